@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+#
+# Benchmark for the recipe cache (bb_cache.dat) file format.
+#
+# A cache with the given number of synthetic CoreRecipeInfo entries is
+# written in both the old stream of pickles format and the indexed format
+# and the time taken to load it cold (page cache dropped, if permitted) and
+# warm is reported, along with the time to save the cache after a single
+# recipe has been reparsed.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import optparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "lib"))
+import bb
+import bb.cache
+from bb.cache import pickle
+
+tasknames = ["do_fetch", "do_unpack", "do_patch", "do_configure", "do_compile",
+             "do_install", "do_populate_sysroot", "do_package", "do_build"]
+
+def recipe_info(i):
+    """Create a CoreRecipeInfo with contents of a typical size"""
+    info = bb.cache.CoreRecipeInfo.__new__(bb.cache.CoreRecipeInfo)
+    pn = "recipe%d" % i
+    fn = "/layers/meta/recipes-%d/%s/%s_1.0.bb" % (i % 50, pn, pn)
+    packages = [pn + suffix for suffix in ("", "-dbg", "-dev", "-doc", "-staticdev", "-locale")]
+    deps = ["recipe%d" % ((i * 7 + j) % 1000) for j in range(8)]
+    info.file_depends = set(("/layers/meta/classes/class%d.bbclass" % j, 1340000000 + j) for j in range(25))
+    info.timestamp = 1340000000 + i
+    info.variants = ['']
+    info.appends = []
+    info.nocache = ''
+    info.skipreason = ''
+    info.skipped = False
+    info.tasks = tasknames
+    info.pn = pn
+    info.packages = packages
+    info.basetaskhashes = dict((t, "%032x" % hash((i, t))) for t in tasknames)
+    info.hashfilename = ''
+    info.task_deps = {'tasks': tasknames, 'parents': dict((t, tasknames[:n]) for n, t in enumerate(tasknames)),
+                      'depends': dict((t, " ".join(d + ":do_populate_sysroot" for d in deps)) for t in tasknames),
+                      'nostamp': {}, 'fakeroot': {}, 'noexec': {}}
+    info.pe, info.pv, info.pr = '', '1.0', 'r0'
+    info.defaultpref = 0
+    info.broken = ''
+    info.not_world = ''
+    info.stamp = "/build/tmp/stamps/%s-1.0-r0" % pn
+    info.stamp_base = dict((t, None) for t in tasknames)
+    info.stamp_extrainfo = dict((t, None) for t in tasknames)
+    info.file_checksums = {}
+    info.packages_dynamic = []
+    info.depends = deps
+    info.provides = []
+    info.rdepends = []
+    info.rprovides = []
+    info.rrecommends = []
+    info.rprovides_pkg = dict((p, []) for p in packages)
+    info.rdepends_pkg = dict((p, deps[:3]) for p in packages)
+    info.rrecommends_pkg = dict((p, []) for p in packages)
+    info.inherits = ["/layers/meta/classes/class%d.bbclass" % j for j in range(25)]
+    info.fakerootenv = info.fakerootdirs = info.fakerootnoenv = ''
+    return fn, info
+
+def write_stream(filename, entries):
+    with open(filename, "wb") as f:
+        pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+        pickler.dump(bb.cache.__cache_version__)
+        pickler.dump(bb.__version__)
+        for key, info in entries.iteritems():
+            pickler.dump(key)
+            pickler.dump(info)
+
+def load_stream(filename, keys):
+    depends_cache = {}
+    with open(filename, "rb") as f:
+        unpickler = pickle.Unpickler(f)
+        unpickler.load()
+        unpickler.load()
+        while f:
+            try:
+                key = unpickler.load()
+                value = unpickler.load()
+            except Exception:
+                break
+            depends_cache[key] = [value]
+    for key in keys:
+        depends_cache[key]
+
+def write_indexed(filename, entries):
+    cachefile = bb.cache.RecipeInfoFile(filename)
+    cachefile.write((bb.cache.__cache_version__, bb.__version__), set(), entries)
+
+def load_indexed(filename, keys):
+    cachefile = bb.cache.RecipeInfoFile(filename)
+    cachefile.load()
+    depends_cache = bb.cache.RecipeInfoMap([cachefile])
+    for key in keys:
+        depends_cache[key]
+
+def update_indexed(filename, key, info):
+    cachefile = bb.cache.RecipeInfoFile(filename)
+    version = cachefile.load()
+    cachefile.write(version, set(cachefile.keys()) - set([key]), {key: info})
+
+def drop_caches():
+    try:
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("1\n")
+        return True
+    except IOError:
+        return False
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-n", "--recipes", type="int", default=10000,
+                      help = "number of (virtual) recipes in the cache [default: %default]")
+    parser.add_option("-a", "--access", type="float", default=100.0,
+                      help = "percentage of entries accessed after loading [default: %default]")
+    options, args = parser.parse_args(sys.argv[1:])
+
+    tempdir = tempfile.mkdtemp(prefix="bb-cache-load.")
+    try:
+        entries = dict(recipe_info(i) for i in xrange(options.recipes))
+        keys = sorted(entries)[:int(len(entries) * options.access / 100)]
+        changed_key, changed_info = recipe_info(0)
+
+        results = []
+        for name, write, load in (("stream", write_stream, load_stream),
+                                  ("indexed", write_indexed, load_indexed)):
+            filename = os.path.join(tempdir, "bb_cache.dat." + name)
+            write(filename, entries)
+            cold = drop_caches()
+            coldtime = timed(load, filename, keys)
+            warmtime = min(timed(load, filename, keys) for i in range(3))
+            if name == "stream":
+                synctime = timed(write, filename, entries)
+            else:
+                synctime = timed(update_indexed, filename, changed_key, changed_info)
+            results.append((name, os.path.getsize(filename), coldtime, warmtime, synctime))
+
+        print("%d recipes, %d%% of entries accessed%s" % (options.recipes, options.access,
+              "" if cold else " (page cache not dropped, cold times are warm)"))
+        print("%-8s %10s %10s %10s %12s" % ("format", "size (kB)", "cold (s)", "warm (s)", "1 change (s)"))
+        for name, size, coldtime, warmtime, synctime in results:
+            print("%-8s %10d %10.3f %10.3f %12.3f" % (name, size / 1024, coldtime, warmtime, synctime))
+    finally:
+        shutil.rmtree(tempdir)
+
+if __name__ == "__main__":
+    main()
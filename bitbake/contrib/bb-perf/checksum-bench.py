@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+#
+# Benchmark for the local file checksums and verify_checksum().
+#
+# A recipe files directory with a number of small patches and larger
+# binary blobs is generated and hashed with an empty checksum cache, in one
+# thread and in a thread pool. get_file_checksums() is then timed with an
+# empty and a populated cache. Last, a source tarball (random data, like a
+# compressed archive) is checked with verify_checksum(). The times of the
+# line by line hashing bb.utils used to do are given for reference.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import time
+import shutil
+import hashlib
+import tempfile
+import optparse
+
+topsrcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+sys.path.insert(0, os.path.join(topsrcdir, "bitbake", "lib"))
+import bb
+import bb.data
+import bb.checksum
+import bb.fetch2
+
+def line_hash(h, filename):
+    for line in open(filename):
+        h.update(line)
+    return h.hexdigest()
+
+def write_random(path, size):
+    with open(path, "wb") as f:
+        while size > 0:
+            block = min(size, 1024 * 1024)
+            f.write(os.urandom(block))
+            size -= block
+
+class Method(object):
+    def supports_checksum(self, ud):
+        return True
+
+    def recommends_checksum(self, ud):
+        return True
+
+class FetchData(object):
+    def __init__(self, localpath):
+        self.method = Method()
+        self.localpath = localpath
+        self.md5_name = "md5sum"
+        self.sha256_name = "sha256sum"
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-p", "--patches", type = "int", default = 2000,
+                      help = "number of 4 KiB patches in the files directory (default: %default)")
+    parser.add_option("-b", "--blobs", type = "int", default = 20,
+                      help = "number of 16 MiB blobs in the files directory (default: %default)")
+    parser.add_option("-t", "--tarball", type = "int", default = 1024,
+                      help = "size of the tarball in MiB (default: %default)")
+    parser.add_option("-j", "--threads", type = "int", default = bb.utils.cpu_count(),
+                      help = "hashing threads (default: %default)")
+    options, args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp(prefix = "bb-checksum-")
+    try:
+        filesdir = os.path.join(tempdir, "files")
+        for i in xrange(options.patches):
+            subdir = os.path.join(filesdir, "patches%d" % (i % 20))
+            bb.utils.mkdirhier(subdir)
+            write_random(os.path.join(subdir, "%04d.patch" % i), 4096)
+        for i in xrange(options.blobs):
+            write_random(os.path.join(filesdir, "blob%d.bin" % i), 16 * 1024 * 1024)
+        print("Files directory: %d patches, %d blobs, %d threads" % (options.patches, options.blobs, options.threads))
+
+        files = []
+        for root, dirs, names in os.walk(filesdir):
+            files.extend(os.path.join(root, name) for name in names)
+        elapsed, _ = timed(lambda: [line_hash(hashlib.md5(), f) for f in files])
+        print("  %-28s%.3f s" % ("line by line md5:", elapsed))
+        for threads in sorted(set([1, options.threads])):
+            cache = bb.checksum.FileChecksumCache()
+            elapsed, _ = timed(cache.get_checksums, files, None, threads)
+            print("  %-28s%.3f s" % ("empty cache, %d thread(s):" % threads, elapsed))
+        bb.fetch2._checksum_cache = bb.checksum.FileChecksumCache()
+        elapsed, checksums = timed(bb.fetch2.get_file_checksums, filesdir, "foo")
+        print("  %-28s%.3f s" % ("get_file_checksums:", elapsed))
+        elapsed, cached = timed(bb.fetch2.get_file_checksums, filesdir, "foo")
+        assert cached == checksums
+        print("  %-28s%.3f s" % ("populated cache:", elapsed))
+
+        tarball = os.path.join(tempdir, "source.tar.bz2")
+        write_random(tarball, options.tarball * 1024 * 1024)
+        ud = FetchData(tarball)
+        elapsed, (md5, sha256) = timed(lambda: (line_hash(hashlib.md5(), tarball), line_hash(hashlib.sha256(), tarball)))
+        ud.md5_expected = md5
+        ud.sha256_expected = sha256
+        print("Tarball: %d MiB" % options.tarball)
+        print("  %-28s%.3f s" % ("line by line md5+sha256:", elapsed))
+        elapsed, _ = timed(bb.fetch2.verify_checksum, "http://example.com/source.tar.bz2", ud, bb.data.init())
+        print("  %-28s%.3f s" % ("verify_checksum:", elapsed))
+    finally:
+        shutil.rmtree(tempdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+#
+# Benchmark for datastore lookups, key iteration and memory use.
+#
+# A recipe is parsed against the poky metadata and the copies bitbake
+# makes of its datastore when running a task are created on top of it
+# (bb.build._task_data() and a further copy as made by the fetcher and
+# sstate code), giving a datastore 3-4 layers deep. Variable lookups,
+# iterating over and counting the keys and get_hash() are timed on it,
+# and the memory used by a number of such task datastores is reported.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import gc
+import time
+import shutil
+import tempfile
+import optparse
+
+topsrcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+sys.path.insert(0, os.path.join(topsrcdir, "bitbake", "lib"))
+import bb
+import bb.build
+import bb.data
+import bb.event
+import bb.parse
+
+local_conf = """
+MACHINE = "qemux86"
+DISTRO = "poky"
+TMPDIR = "%s/tmp"
+METADATA_BRANCH = "master"
+METADATA_REVISION = "HEAD"
+"""
+
+def parse_config(topdir, bbpath):
+    d = bb.data.init()
+    d.setVar("BBPATH", bbpath)
+    d.setVar("TOPDIR", topdir)
+    d = bb.parse.handle(os.path.join("conf", "bitbake.conf"), d)
+    for bbclass in ["base"] + (d.getVar("INHERIT", True) or "").split():
+        bb.parse.BBHandler.inherit(bbclass, "configuration INHERITs", 0, d)
+    for var in d.getVar("__BBHANDLERS") or []:
+        bb.event.register(var, d.getVar(var))
+    bb.event.fire(bb.event.ConfigParsed(), d)
+    bb.parse.init_parser(d)
+    return d
+
+def task_data(fn, d, task):
+    localdata = bb.build._task_data(fn, task, d)
+    fetchdata = bb.data.createCopy(localdata)
+    fetchdata.setVar("OVERRIDES", "fetch:%s" % localdata.getVar("OVERRIDES", False))
+    return fetchdata
+
+def best(func, runs):
+    times = []
+    for i in xrange(runs):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    return min(times)
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options] [recipe]")
+    parser.add_option("-b", "--bbpath",
+                      default = "%s:%s" % (os.path.join(topsrcdir, "meta-yocto"), os.path.join(topsrcdir, "meta")),
+                      help = "layers to use, a local.conf is added in front (default: %default)")
+    parser.add_option("-r", "--runs", type = "int", default = 10,
+                      help = "number of runs, the best is reported (default: %default)")
+    parser.add_option("-c", "--copies", type = "int", default = 200,
+                      help = "number of task datastores for the memory use (default: %default)")
+    options, args = parser.parse_args()
+
+    if args:
+        recipe = os.path.abspath(args[0])
+    else:
+        recipe = os.path.join(topsrcdir, "meta", "recipes-core", "busybox", "busybox_1.19.4.bb")
+
+    topdir = tempfile.mkdtemp(prefix = "bb-datastore-")
+    try:
+        os.mkdir(os.path.join(topdir, "conf"))
+        with open(os.path.join(topdir, "conf", "local.conf"), "w") as f:
+            f.write(local_conf % topdir)
+        d = parse_config(topdir, "%s:%s" % (topdir, options.bbpath))
+        rd = bb.parse.handle(recipe, bb.data.createCopy(d))[""]
+    finally:
+        shutil.rmtree(topdir)
+
+    tasks = rd.getVar("__BBTASKS") or []
+    td = task_data(recipe, rd, tasks[0])
+    keys = list(td.keys())
+    print("%s: %d variables, %d tasks" % (os.path.basename(recipe), len(keys), len(tasks)))
+
+    def lookups():
+        for key in keys:
+            td.getVar(key, False)
+            td.getVarFlag(key, "func")
+    def iterate():
+        for key in td:
+            pass
+    def length():
+        len(td)
+
+    print("  %-24s %8.2f ms" % ("getVar + getVarFlag", best(lookups, options.runs) * 1000))
+    print("  %-24s %8.2f ms" % ("iterate keys", best(iterate, options.runs) * 1000))
+    print("  %-24s %8.2f ms" % ("len()", best(length, options.runs) * 1000))
+    print("  %-24s %8.2f ms" % ("get_hash()", best(td.get_hash, options.runs) * 1000))
+    print("  %-24s %8.2f ms" % ("task datastore", best(lambda: task_data(recipe, rd, tasks[0]), options.runs) * 1000))
+
+    gc.collect()
+    before = rss()
+    copies = []
+    for i in xrange(options.copies):
+        td = task_data(recipe, rd, tasks[i % len(tasks)])
+        for key in td:
+            td.getVar(key, False)
+        copies.append(td)
+    gc.collect()
+    print("  %-24s %8.1f KiB each (%d datastores)" % ("memory", (rss() - before) / 1024.0 / options.copies, options.copies))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
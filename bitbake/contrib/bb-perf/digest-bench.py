@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+#
+# Benchmark for checksumming large source archives.
+#
+# A source archive (random data, like a compressed tarball) is hashed with
+# md5_file() and sha256_file() one after the other, the way
+# verify_checksum() used to, and with file_digests(), reading the file and
+# memory mapping it. With --drop-caches (needs root) the page cache is
+# dropped before each run so the file is read from the disk.
+#
+# A download is then simulated by a process copying the archive at a given
+# rate, and the time until the digests are known is measured when hashing
+# the file after the copy and when following it with a DigestFollower.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import optparse
+import subprocess
+
+topsrcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+sys.path.insert(0, os.path.join(topsrcdir, "bitbake", "lib"))
+import bb
+import bb.utils
+import bb.fetch2
+
+# Copies argv[1] to argv[2] at argv[3] MiB/s
+writer = """
+import sys, time
+src, dest, rate = open(sys.argv[1], "rb"), open(sys.argv[2], "wb"), float(sys.argv[3])
+start = time.time()
+copied = 0
+while True:
+    block = src.read(1024 * 1024)
+    if not block:
+        break
+    dest.write(block)
+    dest.flush()
+    copied += 1
+    delay = start + copied / rate - time.time()
+    if delay > 0:
+        time.sleep(delay)
+"""
+
+def write_random(path, size):
+    with open(path, "wb") as f:
+        while size > 0:
+            block = min(size, 1024 * 1024)
+            f.write(os.urandom(block))
+            size -= block
+
+def drop_caches():
+    subprocess.check_call(["sync"])
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-s", "--size", type = "int", default = 2048,
+                      help = "size of the archive in MiB (default: %default)")
+    parser.add_option("-r", "--rate", type = "float", default = 100,
+                      help = "simulated download rate in MiB/s (default: %default)")
+    parser.add_option("-c", "--drop-caches", action = "store_true",
+                      help = "drop the page cache before each run (needs root)")
+    options, args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp(prefix = "bb-digest-")
+    try:
+        archive = os.path.join(tempdir, "source.tar.bz2")
+        write_random(archive, options.size * 1024 * 1024)
+        print("Archive: %d MiB, page cache %s" % (options.size, "dropped" if options.drop_caches else "warm"))
+
+        def timed(name, func):
+            if options.drop_caches:
+                drop_caches()
+            start = time.time()
+            result = func()
+            print("  %-28s%.3f s" % (name, time.time() - start))
+            return result
+
+        expected = timed("md5_file + sha256_file:", lambda: {"md5" : bb.utils.md5_file(archive), "sha256" : bb.utils.sha256_file(archive)})
+        assert timed("file_digests:", lambda: bb.utils.file_digests(archive)) == expected
+        assert timed("file_digests, mmap:", lambda: bb.utils.file_digests(archive, use_mmap = True)) == expected
+
+        print("Download at %.0f MiB/s" % options.rate)
+        dest = os.path.join(tempdir, "download.tar.bz2")
+        def download(follow):
+            if os.path.exists(dest):
+                os.unlink(dest)
+            bb.fetch2._download_digests.clear()
+            if follow:
+                follower = bb.fetch2.DigestFollower(dest)
+                follower.start()
+            subprocess.check_call([sys.executable, "-c", writer, archive, dest, str(options.rate)])
+            if follow:
+                follower.finish()
+            return bb.fetch2.file_digests(dest)
+        assert timed("download, then hash:", lambda: download(False)) == expected
+        assert timed("hash while downloading:", lambda: download(True)) == expected
+    finally:
+        shutil.rmtree(tempdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#
+# Benchmark for variable expansion.
+#
+# The configuration and a recipe are parsed the way the cooker does it and
+# then every variable of the finalized recipe datastore is expanded, both
+# with the iterative regular expression substitution and with the compiled
+# expansion templates. The first run of each starts with empty template and
+# python code caches, the following runs reuse them as the other recipes
+# parsed by the same process would. The results of both are compared.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import optparse
+
+topsrcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+sys.path.insert(0, os.path.join(topsrcdir, "bitbake", "lib"))
+import bb
+import bb.data
+import bb.data_smart
+import bb.event
+import bb.parse
+
+local_conf = """
+MACHINE = "qemux86"
+DISTRO = "poky"
+TMPDIR = "%s/tmp"
+# Don't time the shell commands run to find these
+METADATA_BRANCH = "master"
+METADATA_REVISION = "HEAD"
+"""
+
+class NoCache(dict):
+    def __setitem__(self, key, value):
+        pass
+
+def parse_config(topdir, bbpath):
+    d = bb.data.init()
+    d.setVar("BBPATH", bbpath)
+    d.setVar("TOPDIR", topdir)
+    d = bb.parse.handle(os.path.join("conf", "bitbake.conf"), d)
+    for bbclass in ["base"] + (d.getVar("INHERIT", True) or "").split():
+        bb.parse.BBHandler.inherit(bbclass, "configuration INHERITs", 0, d)
+    for var in d.getVar("__BBHANDLERS") or []:
+        bb.event.register(var, d.getVar(var))
+    bb.event.fire(bb.event.ConfigParsed(), d)
+    bb.parse.init_parser(d)
+    return d
+
+def expand_all(d):
+    d.expand_cache = {}
+    values = {}
+    start = time.time()
+    for key in d.keys():
+        try:
+            values[key] = d.getVar(key, True)
+        except Exception as exc:
+            values[key] = exc.__class__
+    return time.time() - start, values
+
+def run(d, runs, compiled):
+    if compiled:
+        bb.data_smart.compile_expansion = compile_expansion
+        bb.data_smart._python_cache = {}
+    else:
+        bb.data_smart.compile_expansion = lambda s: None
+        bb.data_smart._python_cache = NoCache()
+    bb.data_smart._expansion_templates.clear()
+
+    times = []
+    for i in xrange(runs + 1):
+        elapsed, values = expand_all(d)
+        times.append(elapsed)
+    return times[0], times[1:], values
+
+compile_expansion = bb.data_smart.compile_expansion
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options] [recipe]")
+    parser.add_option("-b", "--bbpath",
+                      default = "%s:%s" % (os.path.join(topsrcdir, "meta-yocto"), os.path.join(topsrcdir, "meta")),
+                      help = "layers to use, a local.conf is added in front (default: %default)")
+    parser.add_option("-r", "--runs", type = "int", default = 5,
+                      help = "number of runs with warm caches (default: %default)")
+    options, args = parser.parse_args()
+
+    if args:
+        recipe = os.path.abspath(args[0])
+    else:
+        recipe = os.path.join(topsrcdir, "meta", "recipes-core", "busybox", "busybox_1.19.4.bb")
+
+    topdir = tempfile.mkdtemp(prefix = "bb-expand-")
+    try:
+        os.mkdir(os.path.join(topdir, "conf"))
+        with open(os.path.join(topdir, "conf", "local.conf"), "w") as f:
+            f.write(local_conf % topdir)
+        d = parse_config(topdir, "%s:%s" % (topdir, options.bbpath))
+        d = bb.parse.handle(recipe, bb.data.createCopy(d))[""]
+
+        results = {}
+        print("%s: %d variables" % (os.path.basename(recipe), len(d.keys())))
+        for name, compiled in (("regular expressions", False), ("compiled templates", True)):
+            cold, warm, results[name] = run(d, options.runs, compiled)
+            print("  %-20s  first %.3f s, then %.3f s (best of %d, mean %.3f s)" %
+                  (name, cold, min(warm), len(warm), sum(warm) / len(warm)))
+    finally:
+        shutil.rmtree(topdir)
+
+    old, new = results["regular expressions"], results["compiled templates"]
+    differ = [key for key in old if old[key] != new.get(key)]
+    for key in sorted(differ):
+        print("  %s differs: %r != %r" % (key, old[key], new.get(key)))
+    return len(differ) != 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+#
+# Regression benchmark for DataSmart.finalize().
+#
+# The configuration is parsed the way the cooker does it and then every
+# recipe found in the given layer is parsed. Each time finalize() is
+# called, both the previous implementation (kept below for reference) and
+# the current one are run on copies of the datastore and their results
+# compared. The same is done for the finalize() run by bb.build for every
+# task of each recipe. The total and the slowest recipes are reported.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+import optparse
+
+topsrcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+sys.path.insert(0, os.path.join(topsrcdir, "bitbake", "lib"))
+import bb
+import bb.data
+import bb.data_smart
+import bb.event
+import bb.parse
+
+local_conf = """
+MACHINE = "qemux86"
+DISTRO = "poky"
+TMPDIR = "%s/tmp"
+METADATA_BRANCH = "master"
+METADATA_REVISION = "HEAD"
+"""
+
+def reference_finalize(self):
+    overrides = (self.getVar("OVERRIDES", True) or "").split(":") or []
+
+    for o in overrides:
+        l = len(o) + 1
+        if o not in self._seen_overrides:
+            continue
+
+        vars = self._seen_overrides[o].copy()
+        for var in vars:
+            name = var[:-l]
+            try:
+                self.setVar(name, self.getVar(var, False))
+                self.delVar(var)
+            except Exception:
+                logging.info("Untracked delVar")
+
+    for op in ["_append", "_prepend"]:
+        if op in self._special_values:
+            appends = self._special_values[op] or []
+            for append in appends:
+                keep = []
+                for (a, o) in self.getVarFlag(append, op) or []:
+                    match = True
+                    if o:
+                        for o2 in o.split("_"):
+                            if not o2 in overrides:
+                                match = False
+                    if not match:
+                        keep.append((a ,o))
+                        continue
+
+                    if op == "_append":
+                        sval = self.getVar(append, False) or ""
+                        sval += a
+                        self.setVar(append, sval)
+                    elif op == "_prepend":
+                        sval = a + (self.getVar(append, False) or "")
+                        self.setVar(append, sval)
+
+                if keep:
+                    self.setVarFlag(append, op, keep)
+                else:
+                    self.delVarFlag(append, op)
+
+finalize = bb.data_smart.DataSmart.finalize
+
+def contents(d):
+    result = {}
+    for key in d.keys():
+        result[key] = (d.getVar(key, False), d.getVarFlags(key))
+    return result
+
+class Compare(object):
+    def __init__(self, check):
+        self.check = check
+        self.reference = 0.0
+        self.current = 0.0
+        self.calls = 0
+        self.differ = set()
+
+    def run(self, d, prepare = None):
+        results = []
+        for func in (reference_finalize, finalize):
+            copy = bb.data.createCopy(d)
+            if prepare:
+                prepare(copy)
+            start = time.time()
+            func(copy)
+            results.append((time.time() - start, copy))
+        self.reference += results[0][0]
+        self.current += results[1][0]
+        self.calls += 1
+        if self.check:
+            old, new = contents(results[0][1]), contents(results[1][1])
+            for key in set(old) | set(new):
+                if old.get(key) != new.get(key):
+                    self.differ.add(key)
+
+def parse_config(topdir, bbpath):
+    d = bb.data.init()
+    d.setVar("BBPATH", bbpath)
+    d.setVar("TOPDIR", topdir)
+    d = bb.parse.handle(os.path.join("conf", "bitbake.conf"), d)
+    for bbclass in ["base"] + (d.getVar("INHERIT", True) or "").split():
+        bb.parse.BBHandler.inherit(bbclass, "configuration INHERITs", 0, d)
+    for var in d.getVar("__BBHANDLERS") or []:
+        bb.event.register(var, d.getVar(var))
+    bb.event.fire(bb.event.ConfigParsed(), d)
+    bb.parse.init_parser(d)
+    return d
+
+def find_recipes(layer):
+    recipes = []
+    for root, dirs, files in os.walk(layer):
+        recipes.extend(os.path.join(root, f) for f in files if f.endswith(".bb"))
+    return sorted(recipes)
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-b", "--bbpath",
+                      default = "%s:%s" % (os.path.join(topsrcdir, "meta-yocto"), os.path.join(topsrcdir, "meta")),
+                      help = "layers to use, a local.conf is added in front (default: %default)")
+    parser.add_option("-l", "--layer", default = os.path.join(topsrcdir, "meta"),
+                      help = "layer whose recipes are parsed (default: %default)")
+    parser.add_option("-n", "--recipes", type = "int", default = 0,
+                      help = "only parse the first N recipes")
+    parser.add_option("-q", "--no-check", action = "store_false", dest = "check", default = True,
+                      help = "don't compare the results")
+    options, args = parser.parse_args()
+
+    recipes = find_recipes(options.layer)
+    if options.recipes:
+        recipes = recipes[:options.recipes]
+
+    parsing = Compare(options.check)
+    tasks = Compare(options.check)
+    def compare_finalize(self):
+        parsing.run(self)
+        finalize(self)
+    bb.data_smart.DataSmart.finalize = compare_finalize
+
+    topdir = tempfile.mkdtemp(prefix = "bb-finalize-")
+    failed = 0
+    slowest = []
+    try:
+        os.mkdir(os.path.join(topdir, "conf"))
+        with open(os.path.join(topdir, "conf", "local.conf"), "w") as f:
+            f.write(local_conf % topdir)
+        d = parse_config(topdir, "%s:%s" % (topdir, options.bbpath))
+
+        for recipe in recipes:
+            before = parsing.current
+            try:
+                datastores = bb.parse.handle(recipe, bb.data.createCopy(d))
+            except Exception:
+                failed += 1
+                continue
+            slowest.append((parsing.current - before, os.path.basename(recipe)))
+
+            rd = datastores[""]
+            for task in rd.getVar("__BBTASKS") or []:
+                def prepare(copy):
+                    copy.setVar("OVERRIDES", "task-%s:%s" % (task[3:], rd.getVar("OVERRIDES", False)))
+                tasks.run(rd, prepare)
+    finally:
+        shutil.rmtree(topdir)
+
+    print("%d recipes parsed, %d failed to parse" % (len(recipes) - failed, failed))
+    for name, compare in (("parsing", parsing), ("tasks", tasks)):
+        print("  %-8s %6d calls, previous %7.3f s, current %7.3f s" %
+              (name, compare.calls, compare.reference, compare.current))
+    print("Slowest recipes to finalise:")
+    for elapsed, recipe in sorted(slowest, reverse = True)[:5]:
+        print("  %-40s %.4f s" % (recipe, elapsed))
+
+    differ = parsing.differ | tasks.differ
+    for key in sorted(differ):
+        print("  %s differs" % key)
+    return len(differ) != 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+#
+# Benchmark for the resolution of mirror urls.
+#
+# The recipes of the layers are parsed against bitbake.conf and the
+# mirrors classes, without running their anonymous python, and a FetchData
+# is set up for every remote url of their SRC_URI. The urls of PREMIRRORS
+# and MIRRORS are then resolved for each of them, as try_mirrors() does
+# before trying them, twice: with empty mirror tables and with the tables
+# the first pass filled.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import glob
+import time
+import shutil
+import logging
+import tempfile
+import optparse
+
+topsrcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+sys.path.insert(0, os.path.join(topsrcdir, "bitbake", "lib"))
+sys.path.insert(0, os.path.join(topsrcdir, "meta", "lib"))
+import bb
+import bb.data
+import bb.parse
+import bb.utils
+import bb.fetch2
+
+def configuration(layers, tempdir):
+    for name in ("os", "sys", "time", "oe.path", "oe.utils", "oe.data"):
+        bb.utils._context[name.split(".")[0]] = __import__(name)
+    d = bb.data.init()
+    d.setVar("BBPATH", ":".join(layers))
+    d.setVar("TOPDIR", tempdir)
+    d.setVar("MACHINE", "qemux86")
+    d.setVar("DISTRO", "poky")
+    d.setVar("IMAGE_PKGTYPE", "rpm")
+    d.setVar("BB_NO_NETWORK", "1")
+    d = bb.parse.handle(os.path.join(layers[0], "conf", "bitbake.conf"), d)
+    for bbclass in ("utils", "base", "mirrors"):
+        bb.parse.handle(os.path.join("classes", bbclass + ".bbclass"), d, True)
+    return d
+
+def remote_urls(layers, d):
+    result = []
+    for layer in layers:
+        for fn in sorted(glob.glob(os.path.join(layer, "recipes-*", "*", "*.bb"))):
+            rd = bb.data.createCopy(d)
+            pn, pv, pr = bb.parse.vars_from_file(fn, rd)
+            rd.setVar("PN", pn)
+            if pv:
+                rd.setVar("PV", pv)
+            rd.setVar("FILE", fn)
+            try:
+                bb.parse.handle(fn, rd, True)
+                fetcher = bb.fetch2.Fetch([], rd, cache = False)
+            except Exception:
+                continue
+            for u in fetcher.urls:
+                ud = fetcher.ud[u]
+                if ud.type != "file":
+                    ud.setup_localpath(rd)
+                    result.append((ud, rd))
+    return result
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options] [layer...]")
+    options, args = parser.parse_args()
+    layers = [os.path.abspath(layer) for layer in args] or \
+             [os.path.abspath(os.path.join(topsrcdir, layer)) for layer in ("meta", "meta-yocto")]
+
+    logging.getLogger("BitBake").setLevel(logging.CRITICAL)
+    tempdir = tempfile.mkdtemp(prefix = "bb-mirror-")
+    try:
+        d = configuration(layers, tempdir)
+        urls = remote_urls(layers, d)
+        print("%d remote urls, %d PREMIRRORS, %d MIRRORS" % (len(urls),
+              len(bb.fetch2.mirror_from_string(d.getVar("PREMIRRORS", True))),
+              len(bb.fetch2.mirror_from_string(d.getVar("MIRRORS", True)))))
+
+        def resolve():
+            count = 0
+            for ud, rd in urls:
+                for var in ("PREMIRRORS", "MIRRORS"):
+                    mirrors = bb.fetch2.mirror_from_string(rd.getVar(var, True))
+                    if hasattr(bb.fetch2, "mirror_candidates"):
+                        count += len(bb.fetch2.mirror_candidates(ud, mirrors, rd))
+                    else:
+                        count += len(bb.fetch2.build_mirroruris(ud, mirrors, rd)[0])
+            return count
+
+        for name in ("first resolution:", "second resolution:"):
+            start = time.time()
+            count = resolve()
+            elapsed = time.time() - start
+            print("  %-28s%.3f s, %.0f us per url, %d mirror urls" % (name, elapsed, elapsed * 1000000 / len(urls), count))
+    finally:
+        shutil.rmtree(tempdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#
+# Benchmark for parsing the recipes of real layers.
+#
+# The configuration is parsed the way the cooker does it and then every
+# recipe found in the given layers is parsed in this process, which avoids
+# the noise of the parser processes and the cache. The total time, the
+# time spent computing the signatures (siggen finalise()), the expand
+# cache counters and the slowest recipes are reported.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import optparse
+
+topsrcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+sys.path.insert(0, os.path.join(topsrcdir, "bitbake", "lib"))
+import bb
+import bb.data
+import bb.data_smart
+import bb.event
+import bb.parse
+
+local_conf = """
+MACHINE = "qemux86"
+DISTRO = "poky"
+TMPDIR = "%s/tmp"
+METADATA_BRANCH = "master"
+METADATA_REVISION = "HEAD"
+"""
+
+def parse_config(topdir, bbpath):
+    d = bb.data.init()
+    d.setVar("BBPATH", bbpath)
+    d.setVar("TOPDIR", topdir)
+    d = bb.parse.handle(os.path.join("conf", "bitbake.conf"), d)
+    for bbclass in ["base"] + (d.getVar("INHERIT", True) or "").split():
+        bb.parse.BBHandler.inherit(bbclass, "configuration INHERITs", 0, d)
+    for var in d.getVar("__BBHANDLERS") or []:
+        bb.event.register(var, d.getVar(var))
+    bb.event.fire(bb.event.ConfigParsed(), d)
+    bb.parse.init_parser(d)
+    return d
+
+def find_recipes(layers):
+    recipes = []
+    for layer in layers:
+        for root, dirs, files in os.walk(layer):
+            recipes.extend(os.path.join(root, f) for f in files if f.endswith(".bb"))
+    return sorted(recipes)
+
+def main():
+    layers = [os.path.join(topsrcdir, "meta-yocto"), os.path.join(topsrcdir, "meta")]
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-b", "--bbpath", default = ":".join(layers),
+                      help = "layers to use, a local.conf is added in front (default: %default)")
+    parser.add_option("-l", "--layer", action = "append", dest = "layers",
+                      help = "layer whose recipes are parsed, can be repeated (default: the layers of --bbpath)")
+    parser.add_option("-n", "--recipes", type = "int", default = 0,
+                      help = "only parse the first N recipes")
+    options, args = parser.parse_args()
+
+    recipes = find_recipes(options.layers or options.bbpath.split(":"))
+    if options.recipes:
+        recipes = recipes[:options.recipes]
+
+    topdir = tempfile.mkdtemp(prefix = "bb-parse-")
+    failed = 0
+    times = []
+    signatures = []
+    try:
+        os.mkdir(os.path.join(topdir, "conf"))
+        with open(os.path.join(topdir, "conf", "local.conf"), "w") as f:
+            f.write(local_conf % topdir)
+        d = parse_config(topdir, "%s:%s" % (topdir, options.bbpath))
+
+        stats = bb.data_smart.expand_cache_stats
+        stats.reset()
+        siggen = bb.parse.siggen
+        finalise = siggen.finalise
+        def timed_finalise(fn, d, variant):
+            start = time.time()
+            finalise(fn, d, variant)
+            signatures.append(time.time() - start)
+        siggen.finalise = timed_finalise
+        for recipe in recipes:
+            start = time.time()
+            try:
+                bb.parse.handle(recipe, bb.data.createCopy(d))
+            except Exception:
+                failed += 1
+                continue
+            times.append((time.time() - start, os.path.basename(recipe)))
+    finally:
+        shutil.rmtree(topdir)
+
+    print("%d recipes parsed in %.3f s, %d failed to parse" % (len(times), sum(t for t, r in times), failed))
+    print("Signatures computed in %.3f s" % sum(signatures))
+    print("Expand cache: %(hits)d hits, %(misses)d misses, %(invalidations)d invalidations" % stats.counters())
+    print("Slowest recipes:")
+    for elapsed, recipe in sorted(times, reverse = True)[:5]:
+        print("  %-40s %.4f s" % (recipe, elapsed))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
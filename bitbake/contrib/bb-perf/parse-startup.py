@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+#
+# Benchmark for bitbake startup with a large number of recipes.
+#
+# A project with the requested number of recipes is generated, each recipe
+# including a .inc file, inheriting a few classes and some having a
+# bbappend. "bitbake -p" is then run once with an empty cache and several
+# times with a warm cache and the wall clock times are reported. Finally the
+# configuration is changed so that every recipe is parsed again, once with
+# the statement cache dropped and once using it.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import optparse
+
+bitbake = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "bin", "bitbake")
+
+bitbake_conf = """
+TMPDIR = "${TOPDIR}/tmp"
+CACHE = "${TMPDIR}/cache"
+STAMP = "${TMPDIR}/stamps/${PN}"
+T = "${TMPDIR}/work/${PN}/temp"
+B = "${TMPDIR}/work/${PN}"
+BBFILES = "${TOPDIR}/recipes/*/*.bb ${TOPDIR}/appends/*.bbappend"
+PN = "${@bb.parse.BBHandler.vars_from_file(d.getVar('FILE'),d)[0] or 'defaultpkgname'}"
+PV = "${@bb.parse.BBHandler.vars_from_file(d.getVar('FILE'),d)[1] or '1.0'}"
+PR = "r0"
+PF = "${PN}-${PV}-${PR}"
+P = "${PN}-${PV}"
+WORKDIR = "${TMPDIR}/work/${PF}"
+S = "${WORKDIR}/${P}"
+PACKAGES = "${PN}-dbg ${PN} ${PN}-dev ${PN}-doc ${PN}-locale"
+FILES_${PN} = "${bindir}/* ${libdir}/*.so.*"
+FILES_${PN}-dev = "${includedir} ${libdir}/*.so"
+prefix = "/usr"
+bindir = "${prefix}/bin"
+libdir = "${prefix}/lib"
+includedir = "${prefix}/include"
+OVERRIDES = "local:${TARGET_ARCH}:pn-${PN}"
+TARGET_ARCH = "arm"
+BB_NUMBER_PARSE_THREADS = "%(threads)s"
+"""
+
+base_bbclass = """
+inherit utils
+
+addtask fetch
+addtask unpack after do_fetch
+addtask configure after do_unpack
+addtask compile after do_configure
+addtask install after do_compile
+addtask build after do_install
+
+do_fetch[dirs] = "${WORKDIR}"
+do_compile[dirs] = "${S}"
+
+python do_fetch () {
+    bb.note("Fetching %s" % d.getVar("PN", True))
+}
+
+do_configure () {
+    oe_runconf ${EXTRA_OECONF}
+}
+
+do_compile () {
+    oe_runmake ${EXTRA_OEMAKE}
+}
+
+do_install () {
+    oe_runmake install DESTDIR=${D}
+}
+
+do_build () {
+    :
+}
+"""
+
+utils_bbclass = """
+oe_runmake () {
+    make "$@" || die "make failed"
+}
+
+oe_runconf () {
+    ./configure --prefix=${prefix} "$@"
+}
+
+def base_conditional(variable, checkvalue, truevalue, falsevalue, d):
+    if d.getVar(variable, True) == checkvalue:
+        return truevalue
+    else:
+        return falsevalue
+"""
+
+autotools_bbclass = """
+EXTRA_OECONF_append = " --disable-static"
+EXTRA_OEMAKE ?= "-j1"
+DEPENDS_prepend = "autoconf-native "
+do_configure_prepend () {
+    autoreconf -fi
+}
+"""
+
+recipe_inc = """
+DESCRIPTION = "Recipe %(n)d of the startup benchmark"
+LICENSE = "MIT"
+SRC_URI = "http://example.com/${BPN}-${PV}.tar.gz"
+BPN = "${PN}"
+EXTRA_OECONF = "--with-foo=${@base_conditional('TARGET_ARCH', 'arm', 'yes', 'no', d)}"
+"""
+
+recipe = """
+require recipe%(n)d.inc
+inherit autotools
+DEPENDS = "%(depends)s"
+RDEPENDS_${PN} = "%(depends)s"
+PR = "r%(n)d"
+do_install_append () {
+    rm -rf ${D}${datadir}
+}
+"""
+
+bbappend = """
+EXTRA_OECONF += "--enable-appended"
+"""
+
+def generate(topdir, recipes, threads):
+    os.makedirs(os.path.join(topdir, "conf"))
+    os.makedirs(os.path.join(topdir, "classes"))
+    os.makedirs(os.path.join(topdir, "appends"))
+    with open(os.path.join(topdir, "conf", "bitbake.conf"), "w") as f:
+        f.write(bitbake_conf % { "threads" : threads })
+    for name, content in (("base", base_bbclass), ("utils", utils_bbclass),
+                          ("autotools", autotools_bbclass)):
+        with open(os.path.join(topdir, "classes", name + ".bbclass"), "w") as f:
+            f.write(content)
+    for n in xrange(recipes):
+        recipedir = os.path.join(topdir, "recipes", "group%d" % (n / 500))
+        if not os.path.isdir(recipedir):
+            os.makedirs(recipedir)
+        depends = " ".join("recipe%d" % (n / (i + 2)) for i in range(3) if n / (i + 2) != n)
+        with open(os.path.join(recipedir, "recipe%d.inc" % n), "w") as f:
+            f.write(recipe_inc % { "n" : n })
+        with open(os.path.join(recipedir, "recipe%d_1.0.bb" % n), "w") as f:
+            f.write(recipe % { "n" : n, "depends" : depends })
+        if n % 10 == 0:
+            with open(os.path.join(topdir, "appends", "recipe%d_1.0.bbappend" % n), "w") as f:
+                f.write(bbappend)
+
+def run(topdir):
+    env = os.environ.copy()
+    env["BBPATH"] = topdir
+    start = time.time()
+    with open(os.path.join(topdir, "bitbake.log"), "a") as log:
+        ret = subprocess.call([sys.executable, bitbake, "-p"], cwd = topdir, env = env,
+                              stdout = log, stderr = subprocess.STDOUT)
+    if ret != 0:
+        raise Exception("bitbake failed, see %s/bitbake.log" % topdir)
+    return time.time() - start
+
+def reparse(topdir, n, statements):
+    # Any change to the configuration invalidates all the recipe cache
+    # entries, the files themselves are unchanged
+    with open(os.path.join(topdir, "conf", "bitbake.conf"), "a") as f:
+        f.write('BENCH_REPARSE = "%d"\n' % n)
+    if not statements:
+        try:
+            os.unlink(os.path.join(topdir, "tmp", "cache", "bb_statements.dat"))
+        except OSError:
+            pass
+    return run(topdir)
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-n", "--recipes", type = "int", default = 8000,
+                      help = "number of recipes to generate (default: %default)")
+    parser.add_option("-j", "--threads", type = "int", default = 8,
+                      help = "value for BB_NUMBER_PARSE_THREADS (default: %default)")
+    parser.add_option("-r", "--runs", type = "int", default = 3,
+                      help = "number of warm cache runs (default: %default)")
+    parser.add_option("-d", "--dir",
+                      help = "use (or generate) the project in this directory and keep it")
+    options, args = parser.parse_args()
+
+    topdir = options.dir
+    if not topdir:
+        topdir = tempfile.mkdtemp(prefix = "bb-startup-")
+    if not os.path.exists(os.path.join(topdir, "conf", "bitbake.conf")):
+        generate(topdir, options.recipes, options.threads)
+
+    try:
+        shutil.rmtree(os.path.join(topdir, "tmp"), ignore_errors = True)
+        cold = run(topdir)
+        warm = [run(topdir) for i in xrange(options.runs)]
+        uncached = [reparse(topdir, i, False) for i in xrange(options.runs)]
+        cached = [reparse(topdir, options.runs + i, True) for i in xrange(options.runs)]
+    except Exception as exc:
+        sys.stderr.write("%s\n" % exc)
+        return 1
+
+    print("Recipes: %d, BB_NUMBER_PARSE_THREADS: %d" % (options.recipes, options.threads))
+    print("  %-30s %8.2f s" % ("cold cache", cold))
+    for name, times in (("warm cache", warm), ("reparse", uncached),
+                        ("reparse with statement cache", cached)):
+        print("  %-30s %8.2f s (best of %d, mean %.2f s)" % (name, min(times), len(times), sum(times) / len(times)))
+
+    if not options.dir:
+        shutil.rmtree(topdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+#
+# Benchmark for bb.persist_data.
+#
+# The access patterns of the fetcher's revision caches are timed against
+# a domain holding a number of keys: a persist() call and a lookup per
+# revision, as latest_revision() does, membership tests of missing keys,
+# updates of existing keys and a bulk update of every key. Several
+# processes then update the same domain at once.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import optparse
+import multiprocessing
+
+topsrcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+sys.path.insert(0, os.path.join(topsrcdir, "bitbake", "lib"))
+import bb
+import bb.data
+import bb.persist_data
+
+def timed(name, func, *args):
+    start = time.time()
+    func(*args)
+    print("  %-32s%.3f s" % (name, time.time() - start))
+
+def writer(d, worker, keys):
+    for i in xrange(keys):
+        bb.persist_data.persist("BENCH_CONCURRENT", d)["%d-%d" % (worker, i)] = "x" * 40
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-k", "--keys", type = "int", default = 2000,
+                      help = "number of keys in the domain (default: %default)")
+    parser.add_option("-p", "--processes", type = "int", default = 8,
+                      help = "number of concurrent writers (default: %default)")
+    options, args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp(prefix = "bb-persist-")
+    try:
+        d = bb.data.init()
+        d.setVar("PERSISTENT_DIR", tempdir)
+        keys = ["git://git.example.com/repo%d.git-recipe%d" % (i, i) for i in xrange(options.keys)]
+        revs = bb.persist_data.persist("BB_URI_HEADREVS", d)
+        print("Domain of %d keys" % options.keys)
+
+        def setitems():
+            for key in keys:
+                revs[key] = "0" * 40
+        def lookups():
+            for key in keys:
+                bb.persist_data.persist("BB_URI_HEADREVS", d)[key]
+        def contains():
+            for key in keys:
+                (key + "-missing") in revs
+        def updates():
+            for key in keys:
+                revs[key] = "1" * 40
+        def update():
+            revs.update((key, "2" * 40) for key in keys)
+
+        timed("set new keys:", setitems)
+        timed("persist() and lookup:", lookups)
+        timed("contains (missing keys):", contains)
+        timed("set existing keys:", updates)
+        timed("update() all keys:", update)
+        assert len(revs) == options.keys and revs[keys[-1]] == "2" * 40
+
+        def concurrent():
+            processes = [multiprocessing.Process(target = writer, args = (d, worker, options.keys / options.processes))
+                         for worker in xrange(options.processes)]
+            for p in processes:
+                p.start()
+            for p in processes:
+                p.join()
+                assert p.exitcode == 0
+        timed("%d processes, %d keys each:" % (options.processes, options.keys / options.processes), concurrent)
+        assert len(bb.persist_data.persist("BENCH_CONCURRENT", d)) == options.keys / options.processes * options.processes
+    finally:
+        shutil.rmtree(tempdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
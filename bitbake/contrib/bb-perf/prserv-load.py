@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# Load test for the PR service.
+#
+# A PR server is started on a temporary database and a number of builder
+# processes ask it for the PR values of their packages at the same time.
+# Half of the builders share their checksums with the other half, so some
+# of the requests find a value and the others create one. The builders
+# run twice: with one getPR() call per package and with getPRs() batches
+# of the packages. The second round asks for the values created by the
+# first one, with the checksums of a different half of the builders.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import time
+import shutil
+import hashlib
+import tempfile
+import optparse
+import multiprocessing
+
+topsrcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+sys.path.insert(0, os.path.join(topsrcdir, "bitbake", "lib"))
+import prserv.serv
+
+def packages(builder, count, shift):
+    for i in xrange(count):
+        checksum = hashlib.md5("%d-%d" % (i, (builder + shift) % 2)).hexdigest()
+        yield ("pkg%d-1.0-r0" % i, "i586", checksum)
+
+def build(host, port, builder, count, shift, batch):
+    conn = prserv.serv.PRServerConnection(host, port)
+    items = list(packages(builder, count, shift))
+    if batch:
+        values = []
+        for i in xrange(0, len(items), batch):
+            values.extend(conn.getPRs(items[i:i + batch]))
+    else:
+        values = [conn.getPR(*item) for item in items]
+    if None in values:
+        sys.exit(1)
+
+def run(host, port, options, shift, batch):
+    start = time.time()
+    builders = [multiprocessing.Process(target = build, args = (host, port, builder, options.packages, shift, batch))
+                for builder in xrange(options.builders)]
+    for p in builders:
+        p.start()
+    for p in builders:
+        p.join()
+        if p.exitcode:
+            raise Exception("builder failed")
+    elapsed = time.time() - start
+    requests = options.builders * options.packages
+    print("  %-28s%.3f s, %.0f PRs/s" % ("getPRs(), batches of %d:" % batch if batch else "getPR():", elapsed, requests / elapsed))
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-b", "--builders", type = "int", default = 8,
+                      help = "number of concurrent builders (default: %default)")
+    parser.add_option("-p", "--packages", type = "int", default = 500,
+                      help = "number of packages per builder (default: %default)")
+    parser.add_option("-c", "--batch", type = "int", default = 100,
+                      help = "number of packages per getPRs() call (default: %default)")
+    options, args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp(prefix = "bb-prserv-")
+    try:
+        server = prserv.serv.PRServSingleton(os.path.join(tempdir, "prserv.sqlite3"),
+                                             os.path.join(tempdir, "prserv.log"), ("localhost", 0))
+        server.start()
+        host, port = server.getinfo()
+        print("%d builders, %d packages each" % (options.builders, options.packages))
+        try:
+            run(host, port, options, 0, 0)
+            if hasattr(prserv.serv.PRServerConnection, "getPRs"):
+                run(host, port, options, 1, options.batch)
+        finally:
+            prserv.serv.PRServerConnection(host, port).terminate()
+            server.working_thread.join()
+    finally:
+        shutil.rmtree(tempdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+#
+# Measure the runqueue scheduling latency, the time between a task
+# process exiting and the runqueue starting the next task.
+#
+# A throwaway project with a number of recipes each containing a single
+# no-op task is generated and built. The tasks record when they finish and
+# an event handler records when the runqueue starts each task.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+import optparse
+
+bitbake = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "bin", "bitbake")
+
+bitbake_conf = """
+TMPDIR = "${TOPDIR}/tmp"
+CACHE = "${TMPDIR}/cache"
+STAMP = "${TMPDIR}/stamps/${PN}"
+T = "${TMPDIR}/work/${PN}/temp"
+B = "${TMPDIR}/work/${PN}"
+BBFILES = "${TOPDIR}/recipes/*.bb"
+PN = "${@bb.parse.BBHandler.vars_from_file(d.getVar('FILE'),d)[0] or 'defaultpkgname'}"
+PV = "1.0"
+PR = "r0"
+PF = "${PN}-${PV}-${PR}"
+BB_NUMBER_THREADS = "%(threads)s"
+BB_WORKER_POOL = "%(pool)s"
+LATENCY_LOG = "${TOPDIR}/latency.log"
+"""
+
+base_bbclass = """
+addtask build
+do_build[dirs] = "${B}"
+do_build[nostamp] = "1"
+python do_build () {
+    import time
+    f = open(d.getVar("LATENCY_LOG", True), "a")
+    f.write("end %f\\n" % time.time())
+    f.close()
+}
+
+addhandler latency_eventhandler
+python latency_eventhandler () {
+    import time
+    if isinstance(e, bb.runqueue.runQueueTaskStarted):
+        f = open(e.data.getVar("LATENCY_LOG", True), "a")
+        f.write("start %f\\n" % time.time())
+        f.close()
+}
+"""
+
+def generate(topdir, tasks, threads, pool):
+    os.makedirs(os.path.join(topdir, "conf"))
+    os.makedirs(os.path.join(topdir, "classes"))
+    os.makedirs(os.path.join(topdir, "recipes"))
+    with open(os.path.join(topdir, "conf", "bitbake.conf"), "w") as f:
+        f.write(bitbake_conf % { "threads" : threads, "pool" : pool })
+    with open(os.path.join(topdir, "classes", "base.bbclass"), "w") as f:
+        f.write(base_bbclass)
+    with open(os.path.join(topdir, "recipes", "top.bb"), "w") as f:
+        f.write('do_build[depends] = "%s"\n' % " ".join("noop%d:do_build" % i for i in xrange(tasks - 1)))
+    for i in xrange(tasks - 1):
+        open(os.path.join(topdir, "recipes", "noop%d.bb" % i), "w").close()
+
+def analyse(logfile):
+    starts = []
+    ends = []
+    for line in open(logfile):
+        kind, stamp = line.split()
+        if kind == "start":
+            starts.append(float(stamp))
+        else:
+            ends.append(float(stamp))
+    ends.sort()
+
+    latencies = []
+    for start in sorted(starts)[1:]:
+        previous = [end for end in ends if end <= start]
+        if previous:
+            latencies.append(start - previous[-1])
+    return latencies
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-n", "--tasks", type = "int", default = 2000,
+                      help = "number of no-op tasks to run (default: %default)")
+    parser.add_option("-j", "--threads", type = "int", default = 1,
+                      help = "value for BB_NUMBER_THREADS (default: %default)")
+    parser.add_option("-w", "--worker-pool", action = "store_true", default = False,
+                      help = "run the tasks in the task worker pool")
+    parser.add_option("-k", "--keep", action = "store_true", default = False,
+                      help = "keep the generated project directory")
+    options, args = parser.parse_args()
+
+    topdir = tempfile.mkdtemp(prefix = "bb-latency-")
+    generate(topdir, options.tasks, options.threads, options.worker_pool and "1" or "0")
+
+    env = os.environ.copy()
+    env["BBPATH"] = topdir
+    with open(os.path.join(topdir, "bitbake.log"), "w") as log:
+        ret = subprocess.call([sys.executable, bitbake, "top"], cwd = topdir, env = env,
+                              stdout = log, stderr = subprocess.STDOUT)
+    if ret != 0:
+        sys.stderr.write("bitbake failed, see %s/bitbake.log\n" % topdir)
+        return ret
+
+    latencies = analyse(os.path.join(topdir, "latency.log"))
+    if not latencies:
+        sys.stderr.write("No task starts were recorded\n")
+        return 1
+    latencies.sort()
+    print("Tasks: %d, BB_NUMBER_THREADS: %d" % (options.tasks, options.threads))
+    print("Scheduling latency (task exit -> next task start):")
+    print("  mean   %8.2f ms" % (sum(latencies) / len(latencies) * 1000))
+    print("  median %8.2f ms" % (latencies[len(latencies) // 2] * 1000))
+    print("  90%%    %8.2f ms" % (latencies[int(len(latencies) * 0.9)] * 1000))
+    print("  max    %8.2f ms" % (latencies[-1] * 1000))
+    print("  total  %8.2f s" % sum(latencies))
+
+    if options.keep:
+        print("Project kept in %s" % topdir)
+    else:
+        shutil.rmtree(topdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+#
+# Microbenchmark for the runqueue schedulers.
+#
+# A synthetic task graph shaped like a distro build (recipes with a chain of
+# tasks, do_configure depending on the do_populate_sysroot of a few other
+# recipes) is "executed" with instantly completing tasks and the time spent
+# inside the scheduler is reported.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import optparse
+import collections
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "lib"))
+import bb
+import bb.parse
+import bb.siggen
+import bb.runqueue
+
+tasknames = ["do_fetch", "do_unpack", "do_patch", "do_configure", "do_compile",
+             "do_install", "do_populate_sysroot", "do_package", "do_build"]
+
+class Struct(object):
+    pass
+
+class SyntheticData(bb.runqueue.RunQueueData):
+    def __init__(self, numtasks, stampdir, seed):
+        random.seed(seed)
+        self.runq_fnid = []
+        self.runq_task = []
+        self.runq_depends = []
+        self.runq_revdeps = []
+
+        self.taskData = Struct()
+        self.taskData.fn_index = []
+        self.dataCache = Struct()
+        self.dataCache.stamp = {}
+        self.dataCache.stamp_base = {}
+        self.dataCache.stamp_extrainfo = {}
+
+        sysroot = []
+        while len(self.runq_fnid) < numtasks:
+            fnid = len(self.taskData.fn_index)
+            fn = "/synthetic/recipe%d.bb" % fnid
+            self.taskData.fn_index.append(fn)
+            self.dataCache.stamp[fn] = os.path.join(stampdir, "recipe%d" % fnid)
+            self.dataCache.stamp_base[fn] = {}
+            self.dataCache.stamp_extrainfo[fn] = {}
+            for taskname in tasknames:
+                task = len(self.runq_fnid)
+                self.runq_fnid.append(fnid)
+                self.runq_task.append(taskname)
+                deps = set()
+                if taskname != tasknames[0]:
+                    deps.add(task - 1)
+                if taskname == "do_configure" and sysroot:
+                    for i in xrange(min(len(sysroot), 4)):
+                        deps.add(random.choice(sysroot))
+                if taskname == "do_populate_sysroot":
+                    sysroot.append(task)
+                self.runq_depends.append(deps)
+                self.runq_revdeps.append(set())
+
+        for task in xrange(len(self.runq_fnid)):
+            for dep in self.runq_depends[task]:
+                self.runq_revdeps[dep].add(task)
+        endpoints = [task for task in xrange(len(self.runq_fnid)) if not self.runq_revdeps[task]]
+        self.runq_weight = self.calculate_task_weights(endpoints)
+
+class SyntheticExecute(bb.runqueue.RunQueueExecuteTasks):
+    def __init__(self, rqdata, threads):
+        self.rqdata = rqdata
+        self.number_tasks = threads
+        self.stats = bb.runqueue.RunQueueStats(len(rqdata.runq_fnid))
+        self.runq_running = [0] * self.stats.total
+        self.runq_complete = [0] * self.stats.total
+        self.runq_buildable = [int(not deps) for deps in rqdata.runq_depends]
+        self.build_stamps = {}
+        self.build_stamps2 = set()
+        self.resources = bb.runqueue.RunQueueResources(rqdata.dataCache, {})
+
+    def run(self, scheduler):
+        start = time.time()
+        self.sched = scheduler(self, self.rqdata)
+        setup = time.time() - start
+
+        inflight = collections.deque()
+        schedtime = 0.0
+        while self.stats.completed < self.stats.total:
+            while True:
+                start = time.time()
+                task = self.sched.next()
+                schedtime += time.time() - start
+                if task is None:
+                    break
+                self.runq_running[task] = 1
+                self.stats.taskActive()
+                self.build_stamps[task] = self.sched.stampfile(task)
+                self.build_stamps2.add(self.build_stamps[task])
+                inflight.append(task)
+            task = inflight.popleft()
+            self.build_stamps2.discard(self.build_stamps.pop(task))
+            self.stats.taskCompleted()
+            start = time.time()
+            self.task_completeoutright(task)
+            schedtime += time.time() - start
+        return setup, schedtime
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-n", "--tasks", type = "int", default = 50000,
+                      help = "approximate number of tasks in the graph (default: %default)")
+    parser.add_option("-j", "--threads", type = "int", default = 8,
+                      help = "value for BB_NUMBER_THREADS (default: %default)")
+    parser.add_option("-s", "--seed", type = "int", default = 0,
+                      help = "random seed for the graph (default: %default)")
+    options, args = parser.parse_args()
+
+    stampdir = tempfile.mkdtemp(prefix = "bb-sched-")
+    bb.parse.siggen = bb.siggen.SignatureGenerator(None)
+    try:
+        start = time.time()
+        rqdata = SyntheticData(options.tasks, stampdir, options.seed)
+        print("Generated %d tasks in %d recipes in %.2fs" % (len(rqdata.runq_fnid), len(rqdata.taskData.fn_index), time.time() - start))
+        for scheduler in (bb.runqueue.RunQueueScheduler, bb.runqueue.RunQueueSchedulerSpeed, bb.runqueue.RunQueueSchedulerCompletion):
+            setup, schedtime = SyntheticExecute(rqdata, options.threads).run(scheduler)
+            print("%-12s setup %8.3fs  scheduling %8.3fs" % (scheduler.name, setup, schedtime))
+    finally:
+        shutil.rmtree(stampdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+#
+# Replay a recorded build through each runqueue scheduler and report the
+# predicted makespan.
+#
+# The task graph comes from the task-depends.dot written by "bitbake -g"
+# and the task durations from the buildstats output of a build of the same
+# target. Tasks are assumed to take exactly their recorded time, tasks
+# with no recorded time take the average of tasks with the same name.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import re
+import sys
+import heapq
+import shutil
+import tempfile
+import optparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "lib"))
+import bb
+import bb.parse
+import bb.siggen
+import bb.runqueue
+
+class Struct(object):
+    pass
+
+class RecordedData(bb.runqueue.RunQueueData):
+    """
+    Just enough of RunQueueData for the schedulers, built from task-depends.dot
+    """
+    def __init__(self, dotfile, stampdir):
+        edge = re.compile(r'^"([^"]+)" -> "([^"]+)"')
+        node = re.compile(r'^"([^"]+)" \[label=')
+
+        tasks = {}
+        depends = []
+        def taskid(name):
+            if name not in tasks:
+                tasks[name] = len(tasks)
+                depends.append(set())
+            return tasks[name]
+
+        for line in open(dotfile):
+            m = edge.match(line)
+            if m:
+                depends[taskid(m.group(1))].add(taskid(m.group(2)))
+                continue
+            m = node.match(line)
+            if m:
+                taskid(m.group(1))
+
+        self.taskData = Struct()
+        self.taskData.fn_index = []
+        self.dataCache = Struct()
+        self.dataCache.pkg_fn = {}
+        self.dataCache.stamp = {}
+        self.dataCache.stamp_base = {}
+        self.dataCache.stamp_extrainfo = {}
+
+        self.runq_fnid = [None] * len(tasks)
+        self.runq_task = [None] * len(tasks)
+        fnids = {}
+        for name, task in tasks.iteritems():
+            pn, taskname = name.rsplit(".", 1)
+            if pn not in fnids:
+                fnids[pn] = len(self.taskData.fn_index)
+                self.taskData.fn_index.append(pn)
+                self.dataCache.pkg_fn[pn] = pn
+                self.dataCache.stamp[pn] = os.path.join(stampdir, pn)
+                self.dataCache.stamp_base[pn] = {}
+                self.dataCache.stamp_extrainfo[pn] = {}
+            self.runq_fnid[task] = fnids[pn]
+            self.runq_task[task] = taskname
+
+        self.runq_depends = depends
+        self.runq_revdeps = [set() for task in tasks]
+        for task in xrange(len(tasks)):
+            for dep in self.runq_depends[task]:
+                self.runq_revdeps[dep].add(task)
+        endpoints = [task for task in xrange(len(tasks)) if not self.runq_revdeps[task]]
+        self.runq_weight = self.calculate_task_weights(endpoints)
+
+class SimulatedExecute(bb.runqueue.RunQueueExecuteTasks):
+    def __init__(self, rqdata, threads, durations):
+        self.rqdata = rqdata
+        self.number_tasks = threads
+        self.durations = durations
+        self.stats = bb.runqueue.RunQueueStats(len(rqdata.runq_fnid))
+        self.runq_running = [0] * self.stats.total
+        self.runq_complete = [0] * self.stats.total
+        self.runq_buildable = [int(not deps) for deps in rqdata.runq_depends]
+        self.build_stamps = {}
+        self.build_stamps2 = set()
+        self.resources = bb.runqueue.RunQueueResources(rqdata.dataCache, {})
+
+    def run(self, scheduler):
+        durations = self.durations
+        class Scheduler(scheduler):
+            def task_durations(self):
+                return durations
+        self.sched = Scheduler(self, self.rqdata)
+        expected = bb.runqueue.expected_task_durations(self.rqdata, durations)
+
+        now = 0.0
+        running = []
+        while self.stats.completed < self.stats.total:
+            while True:
+                task = self.sched.next()
+                if task is None:
+                    break
+                self.runq_running[task] = 1
+                self.stats.taskActive()
+                self.build_stamps[task] = self.sched.stampfile(task)
+                self.build_stamps2.add(self.build_stamps[task])
+                heapq.heappush(running, (now + expected[task], task))
+            if not running:
+                sys.stderr.write("No runnable tasks left, is the task graph complete?\n")
+                break
+            now, task = heapq.heappop(running)
+            self.build_stamps2.discard(self.build_stamps.pop(task))
+            self.stats.taskCompleted()
+            self.task_completeoutright(task)
+        return now
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options] task-depends.dot buildstats-dir [buildstats-dir...]")
+    parser.add_option("-j", "--threads", type = "int", default = 8,
+                      help = "value for BB_NUMBER_THREADS (default: %default)")
+    options, args = parser.parse_args()
+    if len(args) < 2:
+        parser.error("A task-depends.dot file and a buildstats directory are required")
+
+    stampdir = tempfile.mkdtemp(prefix = "bb-simulate-")
+    bb.parse.siggen = bb.siggen.SignatureGenerator(None)
+    try:
+        rqdata = RecordedData(args[0], stampdir)
+        durations = bb.runqueue.read_buildstats(args[1:])
+        print("%d tasks, %d recorded task durations, BB_NUMBER_THREADS: %d" % (len(rqdata.runq_fnid), len(durations), options.threads))
+        for scheduler in (bb.runqueue.RunQueueScheduler, bb.runqueue.RunQueueSchedulerSpeed,
+                          bb.runqueue.RunQueueSchedulerCompletion, bb.runqueue.RunQueueSchedulerCriticalPath):
+            makespan = SimulatedExecute(rqdata, options.threads, durations).run(scheduler)
+            print("%-14s predicted makespan %10.1fs" % (scheduler.name, makespan))
+    finally:
+        shutil.rmtree(stampdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+#
+# Benchmark for writing and reading the signature data of tasks.
+#
+# The recipes of a layer are parsed against the poky metadata and the
+# signature data of all their tasks is dumped the way "bitbake -S" does,
+# once as a sigdata file per task and twice into a SignatureStore
+# (BB_SIGNATURE_STORE). The time taken, the number of files and the space
+# used are reported, then the time to look up and load the signature of
+# each task again.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import glob
+import time
+import shutil
+import tempfile
+import optparse
+
+topsrcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+sys.path.insert(0, os.path.join(topsrcdir, "bitbake", "lib"))
+import bb
+import bb.data
+import bb.event
+import bb.parse
+import bb.siggen
+
+local_conf = """
+MACHINE = "qemux86"
+DISTRO = "poky"
+TMPDIR = "%s/tmp"
+METADATA_BRANCH = "master"
+METADATA_REVISION = "HEAD"
+"""
+
+class DataCache(object):
+    def __init__(self, siggen, stampdir):
+        self.basetaskhash = siggen.basehash
+        self.stamp = {}
+        for fn in siggen.taskdeps:
+            self.stamp[fn] = os.path.join(stampdir, os.path.basename(fn).replace(":", "-"))
+
+def parse_config(topdir, bbpath):
+    d = bb.data.init()
+    d.setVar("BBPATH", bbpath)
+    d.setVar("TOPDIR", topdir)
+    d = bb.parse.handle(os.path.join("conf", "bitbake.conf"), d)
+    for bbclass in ["base"] + (d.getVar("INHERIT", True) or "").split():
+        bb.parse.BBHandler.inherit(bbclass, "configuration INHERITs", 0, d)
+    for var in d.getVar("__BBHANDLERS") or []:
+        bb.event.register(var, d.getVar(var))
+    bb.event.fire(bb.event.ConfigParsed(), d)
+    bb.parse.init_parser(d)
+    return d
+
+def find_recipes(layer):
+    recipes = []
+    for root, dirs, files in os.walk(layer):
+        recipes.extend(os.path.join(root, f) for f in files if f.endswith(".bb"))
+    return sorted(recipes)
+
+def du(path):
+    files = 0
+    size = 0
+    for root, dirs, names in os.walk(path):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-b", "--bbpath",
+                      default = "%s:%s" % (os.path.join(topsrcdir, "meta-yocto"), os.path.join(topsrcdir, "meta")),
+                      help = "layers to use, a local.conf is added in front (default: %default)")
+    parser.add_option("-l", "--layer", default = os.path.join(topsrcdir, "meta", "recipes-core"),
+                      help = "directory whose recipes are parsed (default: %default)")
+    parser.add_option("-n", "--recipes", type = "int", default = 0,
+                      help = "only parse the first N recipes")
+    options, args = parser.parse_args()
+
+    recipes = find_recipes(options.layer)
+    if options.recipes:
+        recipes = recipes[:options.recipes]
+
+    topdir = tempfile.mkdtemp(prefix = "bb-sigstore-")
+    try:
+        os.mkdir(os.path.join(topdir, "conf"))
+        with open(os.path.join(topdir, "conf", "local.conf"), "w") as f:
+            f.write(local_conf % topdir)
+        d = parse_config(topdir, "%s:%s" % (topdir, options.bbpath))
+        siggen = bb.parse.siggen
+        for recipe in recipes:
+            try:
+                bb.parse.handle(recipe, bb.data.createCopy(d))
+            except Exception:
+                pass
+
+        # Make up the task hashes, the data is the same as in a real -S run
+        for fn in siggen.taskdeps:
+            for task in siggen.taskdeps[fn]:
+                k = fn + "." + task
+                siggen.taskhash[k] = siggen.basehash[k]
+                siggen.runtaskdeps[k] = []
+                siggen.file_checksum_values[k] = {}
+        tasks = len(siggen.taskhash)
+        print("%d recipes, %d tasks" % (len(siggen.taskdeps), tasks))
+
+        stampdir = os.path.join(topdir, "stamps")
+        dataCache = DataCache(siggen, stampdir)
+        start = time.time()
+        siggen.dump_sigs(dataCache)
+        elapsed = time.time() - start
+        files, size = du(stampdir)
+        print("  %-16s %7.2f s, %6d files, %8.1f KiB" % ("sigdata files", elapsed, files, size / 1024.0))
+
+        start = time.time()
+        for fn in siggen.taskdeps:
+            for task in siggen.taskdeps[fn]:
+                sigfile = glob.glob(dataCache.stamp[fn] + "." + task + ".sigdata.*")[0]
+                bb.siggen.load_sigfile(sigfile)
+        print("  %-16s %7.2f s to find and load all the signatures" % ("", time.time() - start))
+
+        storefile = os.path.join(topdir, "sigstore", "sigstore.sqlite3")
+        siggen.sigstore = bb.siggen.SignatureStore(storefile)
+        start = time.time()
+        siggen.dump_sigs(dataCache)
+        elapsed = time.time() - start
+        files, size = du(os.path.dirname(storefile))
+        print("  %-16s %7.2f s, %6d files, %8.1f KiB" % ("signature store", elapsed, files, size / 1024.0))
+
+        start = time.time()
+        siggen.dump_sigs(dataCache)
+        elapsed = time.time() - start
+        print("  %-16s %7.2f s, %8.1f KiB added by a second run" % ("", elapsed, (du(os.path.dirname(storefile))[1] - size) / 1024.0))
+
+        start = time.time()
+        for fn in siggen.taskdeps:
+            for task in siggen.taskdeps[fn]:
+                sighash = siggen.sigstore.find(task = task, fn = fn)[0][0]
+                siggen.sigstore.get(sighash, fn, task)
+        print("  %-16s %7.2f s to find and load all the signatures" % ("", time.time() - start))
+    finally:
+        shutil.rmtree(topdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#
+# Benchmark for computing the task hashes in RunQueueData.prepare().
+#
+# A task graph is generated for a number of recipes (see
+# bb/tests/runqueue.py) with the tasks numbered in reverse dependency
+# order, as taskdata tends to number them. The hashes are computed with
+# the loop prepare() used to have and with compute_task_hashes(), the
+# results compared and the best times reported.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import time
+import optparse
+
+topsrcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+sys.path.insert(0, os.path.join(topsrcdir, "bitbake", "lib"))
+import bb
+import bb.data
+import bb.parse
+import bb.runqueue
+import bb.siggen
+from bb.tests.runqueue import make_rqdata, reference_task_hashes
+
+def best(func, rqdata, runs):
+    times = []
+    for i in xrange(runs):
+        bb.parse.siggen = bb.siggen.SignatureGeneratorBasicHash(bb.data.init())
+        rqdata.runq_hash = [None] * len(rqdata.runq_fnid)
+        start = time.time()
+        func(rqdata)
+        times.append(time.time() - start)
+    return min(times), list(rqdata.runq_hash)
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-n", "--recipes", type = "int", default = 2000,
+                      help = "number of recipes, each with 9 tasks (default: %default)")
+    parser.add_option("-r", "--runs", type = "int", default = 5,
+                      help = "number of runs, the best is reported (default: %default)")
+    options, args = parser.parse_args()
+
+    rqdata = make_rqdata(options.recipes, 1, reverse = True)
+    print("%d tasks" % len(rqdata.runq_fnid))
+    previous, expected = best(reference_task_hashes, rqdata, options.runs)
+    current, hashes = best(bb.runqueue.RunQueueData.compute_task_hashes, rqdata, options.runs)
+    print("  %-24s %8.3f s" % ("previous loop", previous))
+    print("  %-24s %8.3f s" % ("compute_task_hashes()", current))
+    if hashes != expected:
+        print("The hashes differ!")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
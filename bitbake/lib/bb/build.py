@@ -552,6 +552,9 @@ def add_tasks(tasklist, d):
         getTask('fakeroot')
         getTask('noexec')
         getTask('umask')
+        getTask('cpu')
+        getTask('mem')
+        getTask('io')
         task_deps['parents'][task] = []
         for dep in flags['deps']:
             dep = data.expand(dep, d)
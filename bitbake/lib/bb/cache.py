@@ -30,6 +30,8 @@
 
 
 import os
+import mmap
+import struct
 import logging
 from collections import defaultdict
 import bb.utils
@@ -43,7 +45,7 @@ except ImportError:
     logger.info("Importing cPickle failed. "
                 "Falling back to a very slow implementation.")
 
-__cache_version__ = "144"
+__cache_version__ = "146"
 
 def getCacheFile(path, filename, data_hash):
     return os.path.join(path, filename + "." + data_hash)
@@ -162,7 +164,7 @@ class CoreRecipeInfo(RecipeInfoCommon):
         cachedata.file_checksums = {}
         cachedata.fn_provides = {}
         cachedata.pn_provides = defaultdict(list)
-        cachedata.all_depends = []
+        cachedata.all_depends = set()
 
         cachedata.deps = defaultdict(list)
         cachedata.packages = defaultdict(list)
@@ -207,8 +209,7 @@ class CoreRecipeInfo(RecipeInfoCommon):
         for dep in self.depends:
             if dep not in cachedata.deps[fn]:
                 cachedata.deps[fn].append(dep)
-            if dep not in cachedata.all_depends:
-                cachedata.all_depends.append(dep)
+            cachedata.all_depends.add(dep)
 
         rprovides = self.rprovides
         for package in self.packages:
@@ -248,6 +249,185 @@ class CoreRecipeInfo(RecipeInfoCommon):
 
 
 
+class RecipeInfoFile(object):
+    """
+    Indexed on-disk store of the RecipeInfo objects of one cache class
+
+    The file starts with a fixed size header holding the offset and length
+    of an index which maps each key to the offset and length of its pickled
+    value. The file is mmapped and values are only unpickled when asked for.
+    Updates append the new values and a new index to the end of the file
+    and then rewrite the header, so the existing index stays intact until
+    the update is complete. Once more than half of the file is unreferenced
+    it is compacted by copying the live values to a new file.
+    """
+
+    magic = "BBCACHE\x00"
+    header = struct.Struct("!8sQQ")
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.index = {}
+        self.map = None
+
+    def load(self):
+        """
+        Map the file and read its index, returning the version tuple
+        it was written with
+        """
+        self.close()
+        with open(self.filename, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, offset, length = self.header.unpack_from(self.map)
+            if magic != self.magic or offset + length > len(self.map):
+                raise ValueError("%s is not an indexed cache file" % self.filename)
+            version, self.index = pickle.loads(self.map[offset:offset + length])
+        except Exception:
+            self.close()
+            raise
+        return version
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.map = None
+        self.index = {}
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        return self.index.keys()
+
+    def raw(self, key):
+        offset, length = self.index[key]
+        return self.map[offset:offset + length]
+
+    def get(self, key):
+        return pickle.loads(self.raw(key))
+
+    def size(self):
+        return sum(length for _, length in self.index.itervalues())
+
+    def write(self, version, keep, update):
+        """
+        Write the entries named in keep unchanged and the entries in the
+        update dict, dropping everything else
+        """
+        live = 0
+        for key in keep:
+            live += self.index[key][1]
+        update = dict((key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+                      for key, value in update.iteritems())
+        for value in update.itervalues():
+            live += len(value)
+
+        if self.map is None or len(self.map) > 2 * live + 4096:
+            self.rewrite(version, keep, update)
+        else:
+            self.append(version, keep, update)
+        self.close()
+
+    def rewrite(self, version, keep, update):
+        index = {}
+        tmpfile = self.filename + ".new"
+        with open(tmpfile, "wb") as f:
+            f.write(self.header.pack(self.magic, 0, 0))
+            for key in keep:
+                index[key] = (f.tell(), self.index[key][1])
+                f.write(self.raw(key))
+            self.write_entries(f, index, version, update)
+        os.rename(tmpfile, self.filename)
+
+    def append(self, version, keep, update):
+        index = dict((key, self.index[key]) for key in keep)
+        with open(self.filename, "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            self.write_entries(f, index, version, update)
+
+    def write_entries(self, f, index, version, update):
+        for key, value in update.iteritems():
+            index[key] = (f.tell(), len(value))
+            f.write(value)
+        offset = f.tell()
+        f.write(pickle.dumps((version, index), pickle.HIGHEST_PROTOCOL))
+        length = f.tell() - offset
+        # The new entries and index must be on disk before the header
+        # pointing at them, or a crash could leave a header pointing at
+        # garbage
+        f.flush()
+        os.fsync(f.fileno())
+        f.seek(0)
+        f.write(self.header.pack(self.magic, offset, length))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class RecipeInfoMap(object):
+    """
+    The depends cache: maps (virtual) filenames to their info arrays,
+    unpickling them from the RecipeInfoFiles on first access. Entries
+    which are set are recorded so that only those need to be written
+    back when the cache is saved.
+    """
+
+    def __init__(self, files):
+        self.files = files
+        self.loaded = {}
+        self.changed = set()
+        if files:
+            self.valid = set(files[0].keys())
+        else:
+            self.valid = set()
+
+    def __contains__(self, key):
+        return key in self.valid
+
+    def __len__(self):
+        return len(self.valid)
+
+    def __iter__(self):
+        return iter(self.valid)
+
+    def keys(self):
+        return list(self.valid)
+
+    def __getitem__(self, key):
+        if key not in self.valid:
+            raise KeyError(key)
+        if key not in self.loaded:
+            try:
+                self.loaded[key] = [f.get(key) for f in self.files if key in f]
+            except Exception:
+                # A damaged entry is a cache miss, the recipe is reparsed
+                logger.debug(1, "Cache: Unable to load %s", key, exc_info=True)
+                self.valid.remove(key)
+                raise KeyError(key)
+        return self.loaded[key]
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, info_array):
+        if self.loaded.get(key) is info_array:
+            return
+        self.loaded[key] = info_array
+        self.valid.add(key)
+        self.changed.add(key)
+
+    def __delitem__(self, key):
+        self.valid.remove(key)
+        self.loaded.pop(key, None)
+        self.changed.discard(key)
+
+
 class Cache(object):
     """
     BitBake Cache implementation
@@ -261,7 +441,8 @@ class Cache(object):
         self.cachedir = data.getVar("CACHE", True)
         self.clean = set()
         self.checked = set()
-        self.depends_cache = {}
+        self.cachefiles = []
+        self.depends_cache = RecipeInfoMap([])
         self.data = None
         self.data_fn = None
         self.cacheclean = True
@@ -286,68 +467,41 @@ class Cache(object):
                     cachefile = getCacheFile(self.cachedir, cache_class.cachefile, self.data_hash)
                     cache_ok = cache_ok and os.path.exists(cachefile)
                     cache_class.init_cacheData(self)
+                    self.cachefiles.append((cache_class, RecipeInfoFile(cachefile)))
         if cache_ok:
             self.load_cachefile()
         elif os.path.isfile(self.cachefile):
             logger.info("Out of date cache found, rebuilding...")
 
     def load_cachefile(self):
-        # Firstly, using core cache file information for
-        # valid checking
-        with open(self.cachefile, "rb") as cachefile:
-            pickled = pickle.Unpickler(cachefile)
+        # Only the header and index of each cache file is read here, the
+        # recipe information itself is unpickled when it is first accessed
+        cachesize = 0
+        for _, cachefile in self.cachefiles:
+            cachesize += os.path.getsize(cachefile.filename)
+
+        bb.event.fire(bb.event.CacheLoadStarted(cachesize), self.data)
+
+        for _, cachefile in self.cachefiles:
             try:
-                cache_ver = pickled.load()
-                bitbake_ver = pickled.load()
+                cache_ver, bitbake_ver = cachefile.load()
             except Exception:
-                logger.info('Invalid cache, rebuilding...')
-                return
+                cache_ver, bitbake_ver = None, None
 
-            if cache_ver != __cache_version__:
+            if cache_ver is None:
+                logger.info('Invalid cache, rebuilding...')
+            elif cache_ver != __cache_version__:
                 logger.info('Cache version mismatch, rebuilding...')
-                return
             elif bitbake_ver != bb.__version__:
                 logger.info('Bitbake version mismatch, rebuilding...')
-                return
-
-
-        cachesize = 0
-        previous_progress = 0
-        previous_percent = 0
+            else:
+                continue
 
-        # Calculate the correct cachesize of all those cache files
-        for cache_class in self.caches_array:
-            if type(cache_class) is type and issubclass(cache_class, RecipeInfoCommon):
-                cachefile = getCacheFile(self.cachedir, cache_class.cachefile, self.data_hash)
-                with open(cachefile, "rb") as cachefile:
-                    cachesize += os.fstat(cachefile.fileno()).st_size
+            for _, cachefile in self.cachefiles:
+                cachefile.close()
+            return
 
-        bb.event.fire(bb.event.CacheLoadStarted(cachesize), self.data)
-        
-        for cache_class in self.caches_array:
-            if type(cache_class) is type and issubclass(cache_class, RecipeInfoCommon):
-                cachefile = getCacheFile(self.cachedir, cache_class.cachefile, self.data_hash)
-                with open(cachefile, "rb") as cachefile:
-                    pickled = pickle.Unpickler(cachefile)                    
-                    while cachefile:
-                        try:
-                            key = pickled.load()
-                            value = pickled.load()
-                        except Exception:
-                            break
-                        if self.depends_cache.has_key(key):
-                            self.depends_cache[key].append(value)
-                        else:
-                            self.depends_cache[key] = [value]
-                        # only fire events on even percentage boundaries
-                        current_progress = cachefile.tell() + previous_progress
-                        current_percent = 100 * current_progress / cachesize
-                        if current_percent > previous_percent:
-                            previous_percent = current_percent
-                            bb.event.fire(bb.event.CacheLoadProgress(current_progress, cachesize),
-                                          self.data)
-
-                    previous_progress += current_progress
+        self.depends_cache = RecipeInfoMap([cachefile for _, cachefile in self.cachefiles])
 
         # Note: depends cache number is corresponding to the parsing file numbers.
         # The same file has several caches, still regarded as one item in the cache
@@ -355,7 +509,6 @@ class Cache(object):
                                                   len(self.depends_cache)),
                       self.data)
 
-    
     @staticmethod
     def virtualfn2realfn(virtualfn):
         """
@@ -495,7 +648,11 @@ class Cache(object):
             self.remove(fn)
             return False
 
-        info_array = self.depends_cache[fn]
+        info_array = self.depends_cache.get(fn)
+        if info_array is None:
+            logger.debug(2, "Cache: %s is not cached", fn)
+            return False
+
         # Check the file's timestamp
         if mtime != info_array[0].timestamp:
             logger.debug(2, "Cache: %s changed", fn)
@@ -530,7 +687,7 @@ class Cache(object):
         for cls in info_array[0].variants:
             virtualfn = self.realfn2virtual(fn, cls)
             self.clean.add(virtualfn)
-            if virtualfn not in self.depends_cache:
+            if self.depends_cache.get(virtualfn) is None:
                 logger.debug(2, "Cache: %s is not cached", virtualfn)
                 invalid = True
 
@@ -574,30 +731,21 @@ class Cache(object):
             logger.debug(2, "Cache is clean, not saving.")
             return
 
-        file_dict = {}
-        pickler_dict = {}
-        for cache_class in self.caches_array:
-            if type(cache_class) is type and issubclass(cache_class, RecipeInfoCommon):
-                cache_class_name = cache_class.__name__
-                cachefile = getCacheFile(self.cachedir, cache_class.cachefile, self.data_hash)
-                file_dict[cache_class_name] = open(cachefile, "wb")
-                pickler_dict[cache_class_name] =  pickle.Pickler(file_dict[cache_class_name], pickle.HIGHEST_PROTOCOL)
-                   
-        pickler_dict['CoreRecipeInfo'].dump(__cache_version__)
-        pickler_dict['CoreRecipeInfo'].dump(bb.__version__)
-
-        try:
-            for key, info_array in self.depends_cache.iteritems():
-                for info in info_array:
-                    if isinstance(info, RecipeInfoCommon):
-                        cache_class_name = info.__class__.__name__
-                        pickler_dict[cache_class_name].dump(key)
-                        pickler_dict[cache_class_name].dump(info)
-        finally:
-            for cache_class in self.caches_array:
-                if type(cache_class) is type and issubclass(cache_class, RecipeInfoCommon):
-                    cache_class_name = cache_class.__name__
-                    file_dict[cache_class_name].close()
+        # Only entries which were (re)parsed are pickled and written out,
+        # the others are carried over from the existing files as they are
+        changed = self.depends_cache.changed
+        for cache_class, cachefile in self.cachefiles:
+            keep = set()
+            update = {}
+            for key in self.depends_cache:
+                if key not in changed:
+                    if key in cachefile:
+                        keep.add(key)
+                    continue
+                for info in self.depends_cache[key]:
+                    if info.__class__ is cache_class:
+                        update[key] = info
+            cachefile.write((__cache_version__, bb.__version__), keep, update)
 
         del self.depends_cache
 
@@ -711,6 +859,36 @@ class CacheData(object):
         for info in info_array:
             info.add_cacheData(self, fn)
 
+    def merge(self, other):
+        """
+        Merge in the data compiled from another set of recipes, e.g.
+        by one of the parser processes
+        """
+        for name, value in other.__dict__.iteritems():
+            if not value or name == "caches_array":
+                continue
+            current = getattr(self, name)
+            if isinstance(value, dict):
+                for key, item in value.iteritems():
+                    if key in current and isinstance(item, list):
+                        current[key].extend(i for i in item if i not in current[key])
+                    else:
+                        current[key] = item
+            elif isinstance(value, set):
+                current.update(value)
+            else:
+                current.extend(value)
+
+    def __getstate__(self):
+        # The defaultdicts with lambda factories can't be pickled, plain
+        # dicts are all merge() needs
+        state = {}
+        for name, value in self.__dict__.iteritems():
+            if isinstance(value, defaultdict):
+                value = dict(value)
+            state[name] = value
+        return state
+
 
 class MultiProcessCache(object):
     """
@@ -20,6 +20,7 @@ import stat
 import bb.utils
 import logging
 from bb.cache import MultiProcessCache
+from multiprocessing.pool import ThreadPool
 
 logger = logging.getLogger("BitBake.Cache")
 
@@ -56,35 +57,99 @@ class FileMtimeCache(object):
     def clear(self):
         self.cache.clear()
 
-# Checksum + mtime cache (persistent)
+# Checksum cache (persistent)
+# The entries are validated against the device, inode, size and mtime of the
+# files, so a file replaced by another one with the same mtime is noticed
 class FileChecksumCache(MultiProcessCache):
     cache_file_name = "local_file_checksum_cache.dat"
-    CACHE_VERSION = 1
+    CACHE_VERSION = 2
 
-    def __init__(self):
-        self.mtime_cache = FileMtimeCache()
-        MultiProcessCache.__init__(self)
+    # Files are only hashed in a thread pool if there is enough data to
+    # make up for starting it
+    pool_minsize = 4 * 1024 * 1024
 
-    def get_checksum(self, f):
-        entry = self.cachedata[0].get(f)
-        cmtime = self.mtime_cache.cached_mtime(f)
+    def stat_key(self, f):
+        st = os.stat(f)
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime)
+
+    def lookup(self, f):
+        """
+        Return the stat key of f and its cached checksum, or None if it
+        isn't in the cache or the file changed. Raises OSError if f can't
+        be stat'ed.
+        """
+        key = self.stat_key(f)
+        entry = self.cachedata_extras[0].get(f) or self.cachedata[0].get(f)
         if entry:
-            (mtime, hashval) = entry
-            if cmtime == mtime:
-                return hashval
-            else:
-                bb.debug(2, "file %s changed mtime, recompute checksum" % f)
+            if entry[0] == key:
+                return key, entry[1]
+            bb.debug(2, "file %s changed, recompute checksum" % f)
+        return key, None
 
-        hashval = bb.utils.md5_file(f)
-        self.cachedata_extras[0][f] = (cmtime, hashval)
+    def get_checksum(self, f):
+        key, hashval = self.lookup(f)
+        if hashval is None:
+            hashval = bb.utils.md5_file(f)
+            self.cachedata_extras[0][f] = (key, hashval)
         return hashval
 
+    def get_checksums(self, filelist, onerror = None, threads = None):
+        """
+        Return a dict of the checksums of the files in filelist. The files
+        which aren't in the cache are hashed concurrently by up to threads
+        threads (by default, one per CPU). The files which can't be read
+        are left out and onerror(f, exception) is called for them.
+        """
+        checksums = {}
+        todo = []
+        size = 0
+        for f in filelist:
+            try:
+                key, hashval = self.lookup(f)
+            except OSError as e:
+                if onerror:
+                    onerror(f, e)
+                continue
+            if hashval is None:
+                todo.append((f, key))
+                size += key[2]
+            else:
+                checksums[f] = hashval
+
+        def hash_file(f):
+            try:
+                return bb.utils.md5_file(f), None
+            except EnvironmentError as e:
+                return None, e
+
+        if threads is None:
+            threads = bb.utils.cpu_count()
+        threads = min(threads, len(todo))
+        if threads > 1 and size >= self.pool_minsize:
+            pool = ThreadPool(threads)
+            try:
+                results = pool.map(hash_file, [f for f, key in todo])
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [hash_file(f) for f, key in todo]
+
+        for (f, key), (hashval, error) in zip(todo, results):
+            if error:
+                if onerror:
+                    onerror(f, error)
+                continue
+            checksums[f] = hashval
+            self.cachedata_extras[0][f] = (key, hashval)
+        return checksums
+
     def merge_data(self, source, dest):
         for h in source[0]:
-            if h in dest:
-                (smtime, _) = source[0][h]
-                (dmtime, _) = dest[0][h]
-                if smtime > dmtime:
+            if h in dest[0]:
+                (skey, _) = source[0][h]
+                (dkey, _) = dest[0][h]
+                if skey[3] > dkey[3]:
                     dest[0][h] = source[0][h]
             else:
                 dest[0][h] = source[0][h]
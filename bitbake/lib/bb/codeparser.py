@@ -2,6 +2,7 @@ import ast
 import codegen
 import logging
 import os.path
+import re
 import bb.utils, bb.data
 from itertools import chain
 from pysh import pyshyacc, pyshlex, sherrors
@@ -33,16 +34,74 @@ def check_indent(codestr):
     return codestr
 
 
+placeholder = "__bbref%d__"
+placeholder_regexp = re.compile(r"__bbref(\d+)__")
+
+def code_template(value, expanded, d):
+    """
+    Split the code in value into a template, where each variable reference
+    is replaced by a placeholder, and the values the placeholders stand for
+    in d. As the templates of the functions defined by the classes are the
+    same for every recipe, they only need to be parsed once. Returns None
+    if expanded (the value expanded in d) isn't just the template with the
+    values substituted in.
+    """
+    if not isinstance(value, basestring) or "${" not in value or "__bbref" in value:
+        return None
+    template = bb.data_smart.compile_expansion(value)
+    if template is None or template.python:
+        return None
+
+    tparts = list(template.parts)
+    vparts = list(template.parts)
+    values = []
+    for n, (i, ref) in enumerate(template.references):
+        # Unset variables are left in the code as they are
+        refvalue = d.getVar(ref, True)
+        if refvalue is not None:
+            vparts[i] = refvalue
+        tparts[i] = placeholder % n
+        values.append(vparts[i])
+    if "".join(vparts) != expanded:
+        return None
+    return "".join(tparts), values
+
+def substitute(names, values):
+    """Replace the placeholders in the names found in a template"""
+    sub = lambda match: values[int(match.group(1))]
+    return set(placeholder_regexp.sub(sub, name) if "__bbref" in name else name for name in names)
+
+# The name the templates are parsed as, replaced by the name of the real
+# function in the messages logged by the parse
+template_name = "__bbname__"
+
+def template_log(parser):
+    """Return the messages a template parser logged, to be stored with the
+    template and replayed by replay_log()"""
+    return [(record.levelno, record.getMessage()) for record in parser.log.buffer]
+
+def replay_log(log, messages, name, values):
+    """Log the messages of a template parse to log, as the parse of the
+    function name with values substituted in would have"""
+    sub = lambda match: values[int(match.group(1))]
+    for level, msg in messages:
+        msg = placeholder_regexp.sub(sub, msg.replace(template_name, name))
+        log.log(level, msg)
+
 class CodeParserCache(MultiProcessCache):
     cache_file_name = "bb_codeparser.dat"
-    CACHE_VERSION = 2
+    CACHE_VERSION = 4
 
     def __init__(self):
         MultiProcessCache.__init__(self)
         self.pythoncache = self.cachedata[0]
         self.shellcache = self.cachedata[1]
+        self.pythontemplates = self.cachedata[2]
+        self.shelltemplates = self.cachedata[3]
         self.pythoncacheextras = self.cachedata_extras[0]
         self.shellcacheextras = self.cachedata_extras[1]
+        self.pythontemplatesextras = self.cachedata_extras[2]
+        self.shelltemplatesextras = self.cachedata_extras[3]
 
     def init_cache(self, d):
         MultiProcessCache.init_cache(self, d)
@@ -50,6 +109,8 @@ class CodeParserCache(MultiProcessCache):
         # cachedata gets re-assigned in the parent
         self.pythoncache = self.cachedata[0]
         self.shellcache = self.cachedata[1]
+        self.pythontemplates = self.cachedata[2]
+        self.shelltemplates = self.cachedata[3]
 
     def compress_keys(self, data):
         # When the dicts are originally created, python calls intern() on the set keys
@@ -66,10 +127,19 @@ class CodeParserCache(MultiProcessCache):
             data[0][h]["execs"] = self.internSet(data[0][h]["execs"])
         for h in data[1]:
             data[1][h]["execs"] = self.internSet(data[1][h]["execs"])
+        for h in data[2]:
+            if data[2][h]:
+                data[2][h]["refs"] = self.internSet(data[2][h]["refs"])
+                data[2][h]["execs"] = self.internSet(data[2][h]["execs"])
+        for h in data[3]:
+            if data[3][h]:
+                data[3][h]["allexecs"] = self.internSet(data[3][h]["allexecs"])
+                data[3][h]["funcdefs"] = self.internSet(data[3][h]["funcdefs"])
+                data[3][h]["words"] = self.internSet(data[3][h]["words"])
         return
 
     def create_cachedata(self):
-        data = [{}, {}]
+        data = [{}, {}, {}, {}]
         return data
 
 codeparsercache = CodeParserCache()
@@ -150,6 +220,7 @@ class PythonParser():
         self.var_execs = set()
         self.execs = set()
         self.references = set()
+        self.name = name
         self.log = BufferedLogger('BitBake.Data.%s' % name, logging.DEBUG, log)
 
         self.unhandled_message = "in call of %s, argument '%s' is not a string literal"
@@ -183,11 +254,66 @@ class PythonParser():
         codeparsercache.pythoncacheextras[h]["refs"] = self.references
         codeparsercache.pythoncacheextras[h]["execs"] = self.execs
 
+    def parse_template(self, template, values):
+        """Parse the code template returned by code_template(), returning
+        False if the code has to be parsed with the values substituted in.
+        """
+
+        # Substituting the values only changes the contents of the string
+        # literals the placeholders are in
+        for value in values:
+            if "'" in value or '"' in value or "\\" in value or "\n" in value:
+                return False
+
+        h = hash(template)
+        if h in codeparsercache.pythontemplates:
+            entry = codeparsercache.pythontemplates[h]
+        elif h in codeparsercache.pythontemplatesextras:
+            entry = codeparsercache.pythontemplatesextras[h]
+        else:
+            entry = None
+            try:
+                code = compile(check_indent(template), "<string>", "exec",
+                               ast.PyCF_ONLY_AST)
+            except SyntaxError:
+                code = None
+            if code:
+                parser = PythonParser(template_name, logger)
+                found = 0
+                for n in ast.walk(code):
+                    if isinstance(n, ast.Str):
+                        found += len(placeholder_regexp.findall(n.s))
+                    elif n.__class__.__name__ == "Call":
+                        parser.visit_Call(n)
+                if found == len(placeholder_regexp.findall(template)):
+                    entry = {}
+                    entry["refs"] = parser.var_references | parser.var_execs
+                    entry["execs"] = parser.execs
+                    entry["log"] = template_log(parser)
+            codeparsercache.pythontemplatesextras[h] = entry
+
+        if not entry:
+            return False
+        self.references = substitute(entry["refs"], values)
+        self.execs = entry["execs"]
+        replay_log(self.log, entry["log"], self.name, values)
+        return True
+
 class ShellParser():
+    # Values which can be substituted for a placeholder without changing
+    # how the code is tokenized
+    plainword = re.compile(r"^[A-Za-z0-9_./+:,@%-]+$")
+    placeholder_word = re.compile(r"[A-Za-z0-9_./+:,@%=-]*__bbref\d+__[A-Za-z0-9_./+:,@%=-]*")
+    assignment = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*=")
+    reserved = frozenset(("if", "then", "else", "elif", "fi", "do", "done",
+                          "case", "esac", "while", "until", "for", "in",
+                          "function", "select", "time", "eval"))
+
     def __init__(self, name, log):
         self.funcdefs = set()
         self.allexecs = set()
         self.execs = set()
+        self.name = name
         self.log = BufferedLogger('BitBake.Data.%s' % name, logging.DEBUG, log)
         self.unhandled_template = "unable to handle non-literal command '%s'"
         self.unhandled_template = "while parsing %s, %s" % (name, self.unhandled_template)
@@ -221,6 +347,58 @@ class ShellParser():
 
         return self.execs
 
+    def parse_template(self, template, values):
+        """Parse the code template returned by code_template(), returning
+        False if the code has to be parsed with the values substituted in.
+        """
+
+        for value in values:
+            if not self.plainword.match(value):
+                return False
+
+        h = hash(template)
+        if h in codeparsercache.shelltemplates:
+            entry = codeparsercache.shelltemplates[h]
+        elif h in codeparsercache.shelltemplatesextras:
+            entry = codeparsercache.shelltemplatesextras[h]
+        else:
+            entry = None
+            # The contents of here-documents are not tokenized as words
+            if "<<" not in template:
+                parser = ShellParser(template_name, logger)
+                try:
+                    tokens, _ = pyshyacc.parse(template, eof=True, debug=False)
+                    for token in tokens:
+                        parser.process_tokens(token)
+                except Exception:
+                    # Leave reporting the error to the parse of the real code
+                    tokens = None
+                if tokens is not None:
+                    entry = {}
+                    entry["allexecs"] = parser.allexecs
+                    entry["funcdefs"] = parser.funcdefs
+                    entry["words"] = set(self.placeholder_word.findall(template))
+                    entry["log"] = template_log(parser)
+            codeparsercache.shelltemplatesextras[h] = entry
+
+        if not entry:
+            return False
+
+        # A value must not turn a word into a reserved word, an assignment
+        # or the number of a redirection
+        for word in entry["words"]:
+            real = substitute((word,), values).pop()
+            if real in self.reserved or real.isdigit():
+                return False
+            if bool(self.assignment.match(word)) != bool(self.assignment.match(real)):
+                return False
+
+        self.allexecs = substitute(entry["allexecs"], values)
+        self.funcdefs = substitute(entry["funcdefs"], values)
+        self.execs = set(cmd for cmd in self.allexecs if cmd not in self.funcdefs)
+        replay_log(self.log, entry["log"], self.name, values)
+        return True
+
     def process_tokens(self, tokens):
         """Process a supplied portion of the syntax tree as returned by
         pyshyacc.parse.
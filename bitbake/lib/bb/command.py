@@ -179,6 +179,14 @@ class CommandsSync:
         """
         return bb.utils.cpu_count()
 
+    def getExpandCacheStats(self, command, params):
+        """
+        Get the hits, misses and invalidations of the expand caches of the
+        datastores in the server process, the parser processes log theirs
+        at the end of parsing
+        """
+        return bb.data_smart.expand_cache_stats.counters()
+
     def setConfFilter(self, command, params):
         """
         Set the configuration file parsing filter
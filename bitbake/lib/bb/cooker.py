@@ -873,6 +873,7 @@ class BBCooker:
         if data.getVar("BB_WORKERCONTEXT", False) is None:
             bb.fetch.fetcher_init(data)
         bb.codeparser.parser_cache_init(data)
+        bb.parse.statement_cache_init(data)
         bb.event.fire(bb.event.ConfigParsed(), data)
         bb.parse.init_parser(data)
         data.setVar('BBINCLUDED',bb.parse.get_file_depends(data))
@@ -1183,7 +1184,10 @@ class BBCooker:
             sys.exit(1)
 
         if self.state != state.parsing:
+            bb.parse.statcache.refresh()
             self.parseConfiguration ()
+            if self.configuration.data.getVar("BB_STATCACHE_INOTIFY", True) == "1":
+                bb.parse.statcache.watch()
 
             if self.status:
                 del self.status
@@ -1478,6 +1482,10 @@ class Feeder(multiprocessing.Process):
                 continue
 
 class Parser(multiprocessing.Process):
+    # The errors which only mean the cache entries of a shard couldn't be
+    # checked, in which case the main process checks them again
+    cache_errors = (EnvironmentError, KeyError)
+
     def __init__(self, jobs, results, quit, init):
         self.jobs = jobs
         self.results = results
@@ -1509,13 +1517,52 @@ class Parser(multiprocessing.Process):
 
                 if job is None:
                     break
-                result = self.parse(*job)
+                result = getattr(self, job[0])(*job[1:])
 
             try:
                 self.results.put(result, timeout=0.25)
             except Queue.Full:
                 pending.append(result)
 
+        bb.parse.statcache.report()
+        bb.parse.statements.report()
+        bb.data_smart.expand_cache_stats.report()
+
+    def validate(self, index, files, caches_array):
+        """
+        Check the cache entries of a shard of the recipes, returning the
+        valid ones along with a CacheData compiled from them. An exception
+        is returned in place of the results, with its traceback attached.
+        """
+        clean = []
+        skipped = []
+        virtuals = 0
+        cachedata = bb.cache.CacheData(caches_array)
+        try:
+            with bb.utils.gc_disabled():
+                for filename, appends in files:
+                    if not self.bb_cache.cacheValid(filename, appends):
+                        continue
+                    clean.append(filename)
+                    cached, infos = self.bb_cache.load(filename, appends, self.cfg)
+                    for virtualfn, info_array in infos:
+                        virtuals += 1
+                        if info_array[0].skipped:
+                            skipped.append((virtualfn, SkippedPackage(info_array[0])))
+                        else:
+                            cachedata.add_from_recipeinfo(virtualfn, info_array)
+        except self.cache_errors as exc:
+            # The shard is checked again by the main process
+            exc.recipe = filename
+            exc.traceback = list(bb.exceptions.extract_traceback(sys.exc_info()[2], context=3))
+            return index, None, None, [], 0, exc
+        except Exception as exc:
+            # Anything else is a bug, reported by the main process
+            exc.recipe = filename
+            exc.traceback = list(bb.exceptions.extract_traceback(sys.exc_info()[2], context=3))
+            return index, None, None, [], 0, exc
+        return index, clean, cachedata, skipped, virtuals, None
+
     def parse(self, filename, appends, caches_array):
         try:
             return True, bb.cache.Cache.parse(filename, appends, self.cfg, caches_array)
@@ -1548,46 +1595,152 @@ class CookerParser(object):
         self.total = len(filelist)
 
         self.current = 0
+        self.validated = set()
         self.num_processes = int(self.cfgdata.getVar("BB_NUMBER_PARSE_THREADS", True) or
                                  multiprocessing.cpu_count())
 
+        self.prime_statcache()
         self.bb_cache = bb.cache.Cache(self.cfgdata, self.cfghash, cooker.caches_array)
         self.fromcache = []
         self.willparse = []
-        for filename in self.filelist:
-            appends = self.cooker.get_file_appends(filename)
-            if not self.bb_cache.cacheValid(filename, appends):
-                self.willparse.append((filename, appends, cooker.caches_array))
-            else:
-                self.fromcache.append((filename, appends))
-        self.toparse = self.total - len(self.fromcache)
+        self.processes = []
+        files = [(filename, self.cooker.get_file_appends(filename))
+                 for filename in self.filelist]
+        if self.num_processes > 1 and len(self.bb_cache.depends_cache):
+            self.start_processes()
+            self.validate_cache(files)
+        with bb.utils.gc_disabled():
+            for filename, appends in files:
+                if filename in self.validated:
+                    continue
+                if not self.bb_cache.cacheValid(filename, appends):
+                    self.willparse.append(("parse", filename, appends, cooker.caches_array))
+                else:
+                    self.fromcache.append((filename, appends))
+        self.toparse = self.total - self.cached - len(self.fromcache)
         self.progress_chunk = max(self.toparse / 100, 1)
 
         self.start()
         self.haveshutdown = False
 
+    def prime_statcache(self):
+        """
+        List the directories holding the recipes, bbappends, classes and
+        configuration files before the parser processes are started, so
+        they share the results
+        """
+        dirs = set(os.path.dirname(filename) for filename in self.filelist)
+        for appends in self.cooker.appendlist.itervalues():
+            dirs.update(os.path.dirname(filename) for filename in appends)
+        for path in (self.cfgdata.getVar("BBPATH", True) or "").split(":"):
+            dirs.update([path, os.path.join(path, "classes"), os.path.join(path, "conf")])
+        bb.parse.statcache.prime(dirs)
+
+    def start_processes(self):
+        def init():
+            Parser.cfg = self.cfgdata
+            Parser.bb_cache = self.bb_cache
+            bb.parse.statcache.reset_stats()
+            bb.parse.statements.reset_stats()
+            bb.data_smart.expand_cache_stats.reset()
+            multiprocessing.util.Finalize(None, bb.codeparser.parser_cache_save, args=(self.cfgdata,), exitpriority=1)
+            multiprocessing.util.Finalize(None, bb.parse.statement_cache_save, args=(self.cfgdata,), exitpriority=1)
+            multiprocessing.util.Finalize(None, bb.fetch.fetcher_parse_save, args=(self.cfgdata,), exitpriority=1)
+
+        self.feeder_quit = multiprocessing.Queue(maxsize=1)
+        self.parser_quit = multiprocessing.Queue(maxsize=self.num_processes)
+        self.jobs = multiprocessing.Queue(maxsize=self.num_processes)
+        self.result_queue = multiprocessing.Queue()
+        for i in range(0, self.num_processes):
+            parser = Parser(self.jobs, self.result_queue, self.parser_quit, init)
+            parser.start()
+            self.processes.append(parser)
+
+    def validate_cache(self, files):
+        """
+        Check the cache entries of the recipes in shards spread over the
+        parser processes, merging the data from the valid ones into the
+        cooker's CacheData in the order of the file list
+        """
+        chunk = max(len(files) / (self.num_processes * 8), 16)
+        shards = [files[i:i + chunk] for i in xrange(0, len(files), chunk)]
+
+        bb.event.fire(bb.event.CacheValidateStarted(len(files)), self.cfgdata)
+        with bb.utils.gc_disabled():
+            self.collect_validated(shards, len(files))
+        bb.event.fire(bb.event.CacheValidateCompleted(len(files), self.cached), self.cfgdata)
+
+    def collect_validated(self, shards, total):
+        pending = list(reversed(xrange(len(shards))))
+        results = {}
+        merged = 0
+        checked = 0
+        while merged < len(shards):
+            while pending:
+                job = ("validate", pending[-1], shards[pending[-1]], self.cooker.caches_array)
+                try:
+                    self.jobs.put_nowait(job)
+                except Queue.Full:
+                    break
+                pending.pop()
+
+            try:
+                result = self.result_queue.get(timeout=0.25)
+            except Queue.Empty:
+                continue
+            results[result[0]] = result
+            checked += len(shards[result[0]])
+            bb.event.fire(bb.event.CacheValidateProgress(checked, total), self.cfgdata)
+
+            while merged in results:
+                _, clean, cachedata, skipped, virtuals, exc = results.pop(merged)
+                if exc is None:
+                    self.merge_validated(shards[merged], clean, cachedata, skipped, virtuals)
+                elif isinstance(exc, Parser.cache_errors):
+                    # Leave the shard to be checked by the main process
+                    logger.debug(1, "Unable to check the cache of %s in a parser process", exc.recipe,
+                                 exc_info=(type(exc), exc, exc.traceback))
+                else:
+                    logger.error("Unable to check the cache of %s", exc.recipe,
+                                 exc_info=(type(exc), exc, exc.traceback))
+                    for process in self.processes:
+                        self.parser_quit.put(None)
+                    for process in self.processes:
+                        process.join()
+                    raise bb.BBHandledException()
+                merged += 1
+
+    def merge_validated(self, files, clean, cachedata, skipped, virtuals):
+        clean = set(clean)
+        for filename, appends in files:
+            self.validated.add(filename)
+            if filename not in clean:
+                self.bb_cache.remove(filename)
+                self.willparse.append(("parse", filename, appends, self.cooker.caches_array))
+        self.cooker.status.merge(cachedata)
+        for virtualfn, skippedpackage in skipped:
+            self.cooker.skiplist[virtualfn] = skippedpackage
+        self.cached += len(clean)
+        self.current += len(clean)
+        self.skipped += len(skipped)
+        self.virtuals += virtuals
+
     def start(self):
         self.results = self.load_cached()
-        self.processes = []
         if self.toparse:
             bb.event.fire(bb.event.ParseStarted(self.toparse), self.cfgdata)
-            def init():
-                Parser.cfg = self.cfgdata
-                multiprocessing.util.Finalize(None, bb.codeparser.parser_cache_save, args=(self.cfgdata,), exitpriority=1)
-                multiprocessing.util.Finalize(None, bb.fetch.fetcher_parse_save, args=(self.cfgdata,), exitpriority=1)
-
-            self.feeder_quit = multiprocessing.Queue(maxsize=1)
-            self.parser_quit = multiprocessing.Queue(maxsize=self.num_processes)
-            self.jobs = multiprocessing.Queue(maxsize=self.num_processes)
-            self.result_queue = multiprocessing.Queue()
+            if not self.processes:
+                self.start_processes()
+
             self.feeder = Feeder(self.willparse, self.jobs, self.feeder_quit)
             self.feeder.start()
-            for i in range(0, self.num_processes):
-                parser = Parser(self.jobs, self.result_queue, self.parser_quit, init)
-                parser.start()
-                self.processes.append(parser)
 
             self.results = itertools.chain(self.results, self.parse_generator())
+        elif self.processes:
+            for process in self.processes:
+                self.jobs.put(None)
+            for process in self.processes:
+                process.join()
 
     def shutdown(self, clean=True, force=False):
         if not self.toparse:
@@ -1626,6 +1779,7 @@ class CookerParser(object):
         sync.start()
         multiprocessing.util.Finalize(None, sync.join, exitpriority=-100)
         bb.codeparser.parser_cache_savemerge(self.cooker.configuration.data)
+        bb.parse.statement_cache_savemerge(self.cooker.configuration.data)
         bb.fetch.fetcher_parse_done(self.cooker.configuration.data)
 
     def load_cached(self):
@@ -1656,6 +1810,8 @@ class CookerParser(object):
             parsed, result = self.results.next()
         except StopIteration:
             self.shutdown()
+            bb.parse.statcache.report()
+            bb.data_smart.expand_cache_stats.report()
             return False
         except ParsingFailure as exc:
             logger.error('Unable to parse %s: %s' %
@@ -288,15 +288,17 @@ def build_dependencies(key, keys, shelldeps, vardepvals, d):
         if key in vardepvals:
            value =  d.getVarFlag(key, "vardepvalue", True)
         elif d.getVarFlag(key, "func"):
+            parsedvar = d.expandWithRefs(value, key)
+            template = bb.codeparser.code_template(value, parsedvar.value, d)
             if d.getVarFlag(key, "python"):
-                parsedvar = d.expandWithRefs(value, key)
                 parser = bb.codeparser.PythonParser(key, logger)
-                parser.parse_python(parsedvar.value)
+                if not (template and parser.parse_template(*template)):
+                    parser.parse_python(parsedvar.value)
                 deps = deps | parser.references
             else:
-                parsedvar = d.expandWithRefs(value, key)
                 parser = bb.codeparser.ShellParser(key, logger)
-                parser.parse_shell(parsedvar.value)
+                if not (template and parser.parse_template(*template)):
+                    parser.parse_shell(parsedvar.value)
                 deps = deps | shelldeps
             if vardeps is None:
                 parser.log.flush()
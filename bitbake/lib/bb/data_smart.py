@@ -28,7 +28,7 @@ BitBake build tools.
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 # Based on functions from the base bb module, Copyright 2003 Holger Schurig
 
-import copy, re
+import copy, re, time
 from collections import MutableMapping
 import logging
 import hashlib
@@ -42,9 +42,14 @@ __setvar_keyword__ = ["_append", "_prepend"]
 __setvar_regexp__ = re.compile('(?P<base>.*?)(?P<keyword>_append|_prepend)(_(?P<add>.*))?')
 __expand_var_regexp__ = re.compile(r"\${[^{}]+}")
 __expand_python_regexp__ = re.compile(r"\${@.+?}")
+# The flags getVar() returns the value of
+__value_flags__ = ("content", "defaultval")
 
 
-class VariableParse:
+class VariableParse(object):
+    # Many of these are kept in the expand caches
+    __slots__ = ("varname", "d", "value", "references", "execs", "unresolved", "python")
+
     def __init__(self, varname, d, val = None):
         self.varname = varname
         self.d = d
@@ -52,6 +57,10 @@ class VariableParse:
 
         self.references = set()
         self.execs = set()
+        # References to variables which weren't set, and whether any python
+        # code was run, for invalidating the expand cache
+        self.unresolved = ()
+        self.python = False
 
     def var_sub(self, match):
             key = match.group()[2:-1]
@@ -63,27 +72,133 @@ class VariableParse:
                 self.references.add(key)
                 return var
             else:
+                self.unresolved += (key,)
                 return match.group()
 
     def python_sub(self, match):
-            code = match.group()[3:-1]
-            codeobj = compile(code.strip(), self.varname or "<expansion>", "eval")
-
-            parser = bb.codeparser.PythonParser(self.varname, logger)
-            parser.parse_python(code)
-            if self.varname:
-                vardeps = self.d.getVarFlag(self.varname, "vardeps", True)
-                if vardeps is None:
+            return self.python_eval(match.group()[3:-1])
+
+    def python_eval(self, code):
+            # The code object and the references found by the parser only
+            # depend on the code (and the name used in tracebacks), so they
+            # are shared by all the datastores
+            key = (self.varname, code)
+            try:
+                codeobj, references, execs = _python_cache[key]
+            except KeyError:
+                codeobj = compile(code.strip(), self.varname or "<expansion>", "eval")
+
+                parser = bb.codeparser.PythonParser(self.varname, logger)
+                parser.parse_python(code)
+                if self.varname:
+                    vardeps = self.d.getVarFlag(self.varname, "vardeps", True)
+                    if vardeps is None:
+                        parser.log.flush()
+                else:
                     parser.log.flush()
-            else:
-                parser.log.flush()
-            self.references |= parser.references
-            self.execs |= parser.execs
+                references, execs = parser.references, parser.execs
+                if len(_python_cache) >= _cache_limit:
+                    _python_cache.clear()
+                _python_cache[key] = (codeobj, references, execs)
+
+            self.references |= references
+            self.execs |= execs
+            self.python = True
 
             value = utils.better_eval(codeobj, DataContext(self.d))
             return str(value)
 
 
+class ExpansionTemplate(object):
+    """
+    A string split into literal text, variable references and python
+    snippets, which can be expanded against any datastore in a single pass.
+
+    Only strings where each ${ starts a reference which contains no other
+    reference are compiled, anything else (e.g. ${A${B}} or references
+    inside python snippets) is left to the iterative expansion.
+    """
+
+    def __init__(self, parts, references, python):
+        self.parts = parts
+        self.references = references
+        self.python = python
+
+    @staticmethod
+    def compile(s):
+        spans = []
+        for match in __expand_python_regexp__.finditer(s):
+            spans.append((match.start(), match.end(), True))
+        for match in __expand_var_regexp__.finditer(s):
+            # ${@...} without braces in the code matches both expressions
+            if match.group()[2] != "@":
+                spans.append((match.start(), match.end(), False))
+        if s.count("${") != len(spans):
+            return None
+        spans.sort()
+
+        parts = []
+        references = []
+        python = []
+        end = 0
+        for start, nextend, is_python in spans:
+            if start < end:
+                return None
+            if start > end:
+                parts.append(s[end:start])
+            text = s[start:nextend]
+            if is_python:
+                python.append((len(parts), text[3:-1]))
+            else:
+                references.append((len(parts), text[2:-1]))
+            parts.append(text)
+            end = nextend
+        if end < len(s):
+            parts.append(s[end:])
+        return ExpansionTemplate(tuple(parts), tuple(references), tuple(python))
+
+    def expand(self, varparse):
+        """
+        Perform the first pass of the expansion, returning None if that has
+        to be left to the regular expressions since a value which was
+        substituted in contains further references
+        """
+        parts = list(self.parts)
+        d = varparse.d
+        for i, key in self.references:
+            if varparse.varname == key:
+                raise Exception("variable %s references itself!" % key)
+            value = d.getVar(key, True)
+            if value is not None:
+                if "${" in value:
+                    return None
+                varparse.references.add(key)
+                parts[i] = value
+            else:
+                varparse.unresolved += (key,)
+        for i, code in self.python:
+            parts[i] = varparse.python_eval(code)
+        return "".join(parts)
+
+_cache_limit = 100000
+_expansion_templates = {}
+_python_cache = {}
+
+def compile_expansion(s):
+    """
+    Return the ExpansionTemplate for s (which has to contain "${"), or None
+    if it can't be compiled. Templates are cached by the raw string.
+    """
+    try:
+        return _expansion_templates[s]
+    except KeyError:
+        template = ExpansionTemplate.compile(s)
+        if len(_expansion_templates) >= _cache_limit:
+            _expansion_templates.clear()
+        _expansion_templates[s] = template
+        return template
+
+
 class DataContext(dict):
     def __init__(self, metadata, **kwargs):
         self.metadata = metadata
@@ -111,15 +226,74 @@ class ExpansionError(Exception):
     def __str__(self):
         return self.msg
 
+class FinalizeStats(object):
+    """
+    Number of calls to and the time spent in DataSmart.finalize(), which
+    the parser reports for each recipe
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.time = 0.0
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.time += elapsed
+
+finalize_stats = FinalizeStats()
+
+class ExpandCacheStats(object):
+    """
+    Hits, misses and invalidations of the expand caches of all the
+    datastores in this process
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def counters(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "invalidations": self.invalidations}
+
+    def report(self):
+        logger.debug(1, "Expand cache: %d hits, %d misses, %d invalidations",
+                     self.hits, self.misses, self.invalidations)
+
+expand_cache_stats = ExpandCacheStats()
+
 class DataSmart(MutableMapping):
-    def __init__(self, special = COWDictBase.copy(), seen = COWDictBase.copy() ):
+    def __init__(self, special = None, seen = None):
         self.dict = {}
 
         # cookie monster tribute
+        if special is None:
+            special = COWDictBase.copy()
+        if seen is None:
+            seen = COWDictBase.copy()
         self._special_values = special
         self._seen_overrides = seen
 
         self.expand_cache = {}
+        # The variables whose cached expansion references each variable,
+        # and those whose expansion ran python code, which can depend on
+        # anything
+        self._expand_referrers = {}
+        self._expand_python = set()
+
+        # Variables are looked up in self.dict and then in the dicts of the
+        # datastores this one was copied from, nearest first. Each datastore
+        # caches the set of the keys it holds itself for iterating over them.
+        self._layers = (self,)
+        self._chain = (self.dict,)
+        self._keys = None
 
     def expandWithRefs(self, s, varname):
 
@@ -127,11 +301,29 @@ class DataSmart(MutableMapping):
             return VariableParse(varname, self, s)
 
         if varname and varname in self.expand_cache:
+            expand_cache_stats.hits += 1
             return self.expand_cache[varname]
 
         varparse = VariableParse(varname, self)
 
-        while s.find('${') != -1:
+        # The first pass is done using a template compiled from the string,
+        # the loop below finishes off anything the substitution introduced
+        done = True
+        if s.find('${') != -1:
+            done = False
+            template = compile_expansion(s)
+            if template is not None:
+                try:
+                    expanded = template.expand(varparse)
+                except ExpansionError:
+                    raise
+                except Exception as exc:
+                    raise ExpansionError(varname, s, exc)
+                if expanded is not None:
+                    done = expanded == s
+                    s = expanded
+
+        while not done and s.find('${') != -1:
             olds = s
             try:
                 s = __expand_var_regexp__.sub(varparse.var_sub, s)
@@ -146,10 +338,47 @@ class DataSmart(MutableMapping):
         varparse.value = s
 
         if varname:
+            expand_cache_stats.misses += 1
             self.expand_cache[varname] = varparse
+            if varparse.python:
+                self._expand_python.add(varname)
+            else:
+                referrers = self._expand_referrers
+                for refs in (varparse.references, varparse.unresolved):
+                    for ref in refs:
+                        if ref in referrers:
+                            referrers[ref].append(varname)
+                        else:
+                            referrers[ref] = [varname]
 
         return varparse
 
+    def _invalidateExpansion(self, var):
+        """
+        Drop the cached expansion of var and of the variables which
+        (indirectly) reference it, as well as those which ran python code
+        """
+        cache = self.expand_cache
+        if not cache:
+            return
+        referrers = self._expand_referrers
+        pending = [var]
+        if self._expand_python:
+            pending.extend(self._expand_python)
+            self._expand_python = set()
+        while pending:
+            var = pending.pop()
+            if cache.pop(var, None) is not None:
+                expand_cache_stats.invalidations += 1
+            if var in referrers:
+                pending.extend(referrers.pop(var))
+
+    def _resetExpandCache(self):
+        expand_cache_stats.invalidations += len(self.expand_cache)
+        self.expand_cache = {}
+        self._expand_referrers = {}
+        self._expand_python = set()
+
     def expand(self, s, varname = None):
         return self.expandWithRefs(s, varname).value
 
@@ -157,84 +386,140 @@ class DataSmart(MutableMapping):
     def finalize(self):
         """Performs final steps upon the datastore, including application of overrides"""
 
+        start = time.time()
         overrides = (self.getVar("OVERRIDES", True) or "").split(":") or []
+        active = set(overrides)
+        changed = False
 
         #
-        # Well let us see what breaks here. We used to iterate
-        # over each variable and apply the override and then
-        # do the line expanding.
-        # If we have bad luck - which we will have - the keys
-        # where in some order that is so important for this
-        # method which we don't have anymore.
-        # Anyway we will fix that and write test cases this
-        # time.
-
+        # First we apply all overrides, in the order of OVERRIDES so the
+        # last one wins. _seen_overrides indexes the variables by their
+        # override suffix, so only those variables are looked at.
+        # Then we will handle _append and _prepend, the variables with
+        # pending ones being indexed by _special_values.
         #
-        # First we apply all overrides
-        # Then  we will handle _append and _prepend
+        # The variables are updated in place rather than with setVar() and
+        # delVar(), which reset the expand cache on every call, so it's
+        # only reset once at the end.
         #
 
         for o in overrides:
-            # calculate '_'+override
-            l = len(o) + 1
-
             # see if one should even try
             if o not in self._seen_overrides:
                 continue
 
-            vars = self._seen_overrides[o].copy()
+            # calculate '_'+override
+            l = len(o) + 1
+            vars = list(self._seen_overrides.__getreadonly__(o))
+            if not vars:
+                continue
+            seen = self._seen_overrides[o]
             for var in vars:
                 name = var[:-l]
-                try:
-                    self.setVar(name, self.getVar(var, False))
-                    self.delVar(var)
-                except Exception:
-                    logger.info("Untracked delVar")
+                self._setContent(name, self.getVar(var, False))
+                self.dict[var] = {}
+                self._changed()
+                seen.discard(var)
+            changed = True
 
         # now on to the appends and prepends
         for op in __setvar_keyword__:
-            if op in self._special_values:
-                appends = self._special_values[op] or []
-                for append in appends:
-                    keep = []
-                    for (a, o) in self.getVarFlag(append, op) or []:
+            if op not in self._special_values:
+                continue
+
+            done = []
+            for append in list(self._special_values.__getreadonly__(op) or []):
+                local_var = self._findVar(append)
+                if not local_var or op not in local_var:
+                    # Applied by the datastore this one was copied from
+                    done.append(append)
+                    continue
+
+                keep = []
+                sval = None
+                for (a, o) in local_var[op]:
+                    if o:
                         match = True
-                        if o:
-                            for o2 in o.split("_"):
-                                if not o2 in overrides:
-                                    match = False
+                        for o2 in o.split("_"):
+                            if not o2 in active:
+                                match = False
+                                break
                         if not match:
                             keep.append((a ,o))
                             continue
 
-                        if op == "_append":
-                            sval = self.getVar(append, False) or ""
-                            sval += a
-                            self.setVar(append, sval)
-                        elif op == "_prepend":
-                            sval = a + (self.getVar(append, False) or "")
-                            self.setVar(append, sval)
-
-                    # We save overrides that may be applied at some later stage
-                    if keep:
-                        self.setVarFlag(append, op, keep)
+                    if sval is None:
+                        sval = self.getVar(append, False) or ""
+                    if op == "_append":
+                        sval += a
                     else:
-                        self.delVarFlag(append, op)
+                        sval = a + sval
+
+                if sval is not None:
+                    self._setContent(append, sval)
+                    changed = True
+
+                # We save overrides that may be applied at some later stage
+                if keep:
+                    self.setVarFlag(append, op, keep)
+                else:
+                    self.delVarFlag(append, op)
+                    done.append(append)
+
+            if done:
+                self._special_values[op].difference_update(done)
+
+        if changed:
+            self._resetExpandCache()
+        finalize_stats.add(time.time() - start)
+
+    def _setContent(self, var, value):
+        """setVar() for a variable name known not to be an _append/_prepend"""
+        if not var in self.dict:
+            self._makeShadowCopy(var)
+        elif not self.dict[var]:
+            self._changed()
+        self._seenOverride(var)
+        self.dict[var]["content"] = value
+
+    def _seenOverride(self, var):
+        # more cookies for the cookie monster
+        if '_' in var:
+            override = var[var.rfind('_')+1:]
+            if len(override) > 0:
+                if override not in self._seen_overrides:
+                    self._seen_overrides[override] = set()
+                self._seen_overrides[override].add( var )
 
     def initVar(self, var):
-        self.expand_cache = {}
+        self._invalidateExpansion(var)
         if not var in self.dict:
             self.dict[var] = {}
+            self._changed()
 
     def _findVar(self, var):
-        dest = self.dict
-        while dest:
+        for dest in self._chain:
             if var in dest:
                 return dest[var]
+        return None
+
+    def _changed(self):
+        """
+        Called when a variable is added to or removed from self.dict, or
+        its flags become empty or non-empty
+        """
+        self._keys = None
+
+    def _localKeys(self):
+        if self._keys is None:
+            self._keys = frozenset(key for key, value in self.dict.iteritems() if value)
+        return self._keys
 
-            if "_data" not in dest:
-                break
-            dest = dest["_data"]
+    def _keyset(self):
+        keys = set()
+        for data in self._layers:
+            keys.update(data._localKeys())
+        return keys
 
     def _makeShadowCopy(self, var):
         if var in self.dict:
@@ -244,11 +529,12 @@ class DataSmart(MutableMapping):
 
         if local_var:
             self.dict[var] = copy.copy(local_var)
+            self._changed()
         else:
             self.initVar(var)
 
     def setVar(self, var, value):
-        self.expand_cache = {}
+        self._invalidateExpansion(var)
         match  = __setvar_regexp__.match(var)
         if match and match.group("keyword") in __setvar_keyword__:
             base = match.group('base')
@@ -270,14 +556,10 @@ class DataSmart(MutableMapping):
 
         if not var in self.dict:
             self._makeShadowCopy(var)
+        elif not self.dict[var]:
+            self._changed()
 
-        # more cookies for the cookie monster
-        if '_' in var:
-            override = var[var.rfind('_')+1:]
-            if len(override) > 0:
-                if override not in self._seen_overrides:
-                    self._seen_overrides[override] = set()
-                self._seen_overrides[override].add( var )
+        self._seenOverride(var)
 
         # setting var
         self.dict[var]["content"] = value
@@ -322,16 +604,21 @@ class DataSmart(MutableMapping):
         self.setVar(key, value)
 
     def delVar(self, var):
-        self.expand_cache = {}
+        self._invalidateExpansion(var)
         self.dict[var] = {}
+        self._changed()
         if '_' in var:
             override = var[var.rfind('_')+1:]
             if override and override in self._seen_overrides and var in self._seen_overrides[override]:
                 self._seen_overrides[override].remove(var)
 
     def setVarFlag(self, var, flag, flagvalue):
+        if flag in __value_flags__:
+            self._invalidateExpansion(var)
         if not var in self.dict:
             self._makeShadowCopy(var)
+        elif not self.dict[var]:
+            self._changed()
         self.dict[var][flag] = flagvalue
 
     def getVarFlag(self, var, flag, expand=False, noweakdefault=False):
@@ -354,7 +641,11 @@ class DataSmart(MutableMapping):
             self._makeShadowCopy(var)
 
         if var in self.dict and flag in self.dict[var]:
+            if flag in __value_flags__:
+                self._invalidateExpansion(var)
             del self.dict[var][flag]
+            if not self.dict[var]:
+                self._changed()
 
     def appendVarFlag(self, key, flag, value):
         value = (self.getVarFlag(key, flag, False) or "") + value
@@ -365,8 +656,12 @@ class DataSmart(MutableMapping):
         self.setVarFlag(key, flag, value)
 
     def setVarFlags(self, var, flags):
+        if "defaultval" in flags:
+            self._invalidateExpansion(var)
         if not var in self.dict:
             self._makeShadowCopy(var)
+        elif not self.dict[var]:
+            self._changed()
 
         for i in flags:
             if i == "content":
@@ -389,6 +684,7 @@ class DataSmart(MutableMapping):
 
 
     def delVarFlags(self, var):
+        self._invalidateExpansion(var)
         if not var in self.dict:
             self._makeShadowCopy(var)
 
@@ -402,15 +698,18 @@ class DataSmart(MutableMapping):
                 self.dict[var]["content"] = content
             else:
                 del self.dict[var]
+            self._changed()
 
 
     def createCopy(self):
         """
-        Create a copy of self by setting _data to self
+        Create a copy of self, which looks up the variables it doesn't
+        set itself in self
         """
         # we really want this to be a DataSmart...
         data = DataSmart(seen=self._seen_overrides.copy(), special=self._special_values.copy())
-        data.dict["_data"] = self.dict
+        data._layers = (data,) + self._layers
+        data._chain = (data.dict,) + self._chain
 
         return data
 
@@ -432,29 +731,13 @@ class DataSmart(MutableMapping):
 
     def localkeys(self):
         for key in self.dict:
-            if key != '_data':
-                yield key
+            yield key
 
     def __iter__(self):
-        def keylist(d):        
-            klist = set()
-            for key in d:
-                if key == "_data":
-                    continue
-                if not d[key]:
-                    continue
-                klist.add(key)
-
-            if "_data" in d:
-                klist |= keylist(d["_data"])
-
-            return klist
-
-        for k in keylist(self.dict):
-             yield k
+        return iter(self._keyset())
 
     def __len__(self):
-        return len(frozenset(self))
+        return len(self._keyset())
 
     def __getitem__(self, item):
         value = self.getVar(item, False)
@@ -397,6 +397,23 @@ class CacheLoadCompleted(OperationCompleted):
         OperationCompleted.__init__(self, total, "Loading cache Completed")
         self.num_entries = num_entries
 
+class CacheValidateStarted(OperationStarted):
+    """Checking of the dependency cache against the recipes has begun"""
+    def __init__(self, total):
+        OperationStarted.__init__(self, "Checking cache Started")
+        self.total = total
+
+class CacheValidateProgress(OperationProgress):
+    """Cache checking progress"""
+    def __init__(self, current, total):
+        OperationProgress.__init__(self, current, total, "Checking cache")
+
+class CacheValidateCompleted(OperationCompleted):
+    """Cache checking is complete"""
+    def __init__(self, total, num_valid):
+        OperationCompleted.__init__(self, total, "Checking cache Completed")
+        self.num_valid = num_valid
+
 class TreeDataPreparationStarted(OperationStarted):
     """Tree data preparation started"""
     def __init__(self):
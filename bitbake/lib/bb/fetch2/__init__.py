@@ -29,6 +29,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 import os, re
 import logging
+import threading
 import urllib
 import bb.persist_data, bb.utils
 import bb.checksum
@@ -36,6 +37,13 @@ from bb import data
 
 __version__ = "2"
 _checksum_cache = bb.checksum.FileChecksumCache()
+# Digests of downloaded files, by (device, inode), see file_digests()
+_download_digests = {}
+# Parsed and compiled mirrors variables, see mirror_table()
+_mirror_strings = {}
+_mirror_tables = {}
+# HTTP connections kept open by the threads of Fetch.available()
+http_connections = threading.local()
 
 logger = logging.getLogger("BitBake.Fetcher")
 
@@ -182,58 +190,66 @@ def encodeurl(decoded):
 
     return url
 
+def compile_mirror(uri_find, uri_replace):
+    """
+    Decode a (find, replace) mirror pair for _uri_replace() and compile
+    the regular expressions of the find url
+    """
+    uri_find_decoded = decodeurl(uri_find)
+    regexps = []
+    for loc, regexp in enumerate(uri_find_decoded[:5]):
+        if loc == 0 and regexp and not regexp.endswith("$"):
+            # Leaving the type unanchored can mean "https" matching "file" can become "files"
+            # which is clearly undesirable.
+            regexp += "$"
+        regexps.append(re.compile(regexp))
+    return (regexps, uri_find_decoded[5], decodeurl(uri_replace))
+
 def uri_replace(ud, uri_find, uri_replace, replacements, d):
     if not ud.url or not uri_find or not uri_replace:
         logger.error("uri_replace: passed an undefined value, not replacing")
         return None
-    uri_decoded = list(decodeurl(ud.url))
-    uri_find_decoded = list(decodeurl(uri_find))
-    uri_replace_decoded = list(decodeurl(uri_replace))
-    logger.debug(2, "For url %s comparing %s to %s" % (uri_decoded, uri_find_decoded, uri_replace_decoded))
+    return _uri_replace(ud, decodeurl(ud.url), compile_mirror(uri_find, uri_replace), replacements)
+
+def _uri_replace(ud, uri_decoded, mirror, replacements):
+    regexps, uri_find_parm, uri_replace_decoded = mirror
+    uri_decoded = list(uri_decoded)
     result_decoded = ['', '', '', '', '', {}]
-    for loc, i in enumerate(uri_find_decoded):
-        result_decoded[loc] = uri_decoded[loc]
-        regexp = i
-        if loc == 0 and regexp and not regexp.endswith("$"):
-            # Leaving the type unanchored can mean "https" matching "file" can become "files"
-            # which is clearly undesirable.
-            regexp += "$"
-        if loc == 5:
-            # Handle URL parameters
-            if i:
-                # Any specified URL parameters must match
-                for k in uri_replace_decoded[loc]:
-                    if uri_decoded[loc][k] != uri_replace_decoded[loc][k]:
-                        return None
-            # Overwrite any specified replacement parameters
-            for k in uri_replace_decoded[loc]:
-                result_decoded[loc][k] = uri_replace_decoded[loc][k]
-        elif (re.match(regexp, uri_decoded[loc])):
-            if not uri_replace_decoded[loc]:
-                result_decoded[loc] = ""    
-            else:
-                for k in replacements:
-                    uri_replace_decoded[loc] = uri_replace_decoded[loc].replace(k, replacements[k])
-                #bb.note("%s %s %s" % (regexp, uri_replace_decoded[loc], uri_decoded[loc]))
-                result_decoded[loc] = re.sub(regexp, uri_replace_decoded[loc], uri_decoded[loc])
-            if loc == 2:
-                # Handle path manipulations
-                basename = None
-                if uri_decoded[0] != uri_replace_decoded[0] and ud.mirrortarball:
-                    # If the source and destination url types differ, must be a mirrortarball mapping
-                    basename = os.path.basename(ud.mirrortarball)
-                    # Kill parameters, they make no sense for mirror tarballs
-                    uri_decoded[5] = {}
-                elif ud.localpath and ud.method.supports_checksum(ud):
-                    basename = os.path.basename(ud.localpath)
-                if basename and not result_decoded[loc].endswith(basename):
-                    result_decoded[loc] = os.path.join(result_decoded[loc], basename)
-        else:
+    for loc, regexp in enumerate(regexps):
+        if not regexp.match(uri_decoded[loc]):
             return None
+        replace = uri_replace_decoded[loc]
+        if not replace:
+            result_decoded[loc] = ""
+        else:
+            for k in replacements:
+                replace = replace.replace(k, replacements[k])
+            result_decoded[loc] = regexp.sub(replace, uri_decoded[loc])
+        if loc == 2:
+            # Handle path manipulations
+            basename = None
+            if uri_decoded[0] != uri_replace_decoded[0] and ud.mirrortarball:
+                # If the source and destination url types differ, must be a mirrortarball mapping
+                basename = os.path.basename(ud.mirrortarball)
+                # Kill parameters, they make no sense for mirror tarballs
+                uri_decoded[5] = {}
+            elif ud.localpath and ud.method.supports_checksum(ud):
+                basename = os.path.basename(ud.localpath)
+            if basename and not result_decoded[loc].endswith(basename):
+                result_decoded[loc] = os.path.join(result_decoded[loc], basename)
+    # Handle URL parameters
+    if uri_find_parm:
+        # Any specified URL parameters must match
+        for k in uri_replace_decoded[5]:
+            if uri_decoded[5][k] != uri_replace_decoded[5][k]:
+                return None
+    # Overwrite any specified replacement parameters
+    result_decoded[5] = dict(uri_decoded[5])
+    result_decoded[5].update(uri_replace_decoded[5])
     result = encodeurl(result_decoded)
     if result == ud.url:
         return None
-    logger.debug(2, "For url %s returning %s" % (ud.url, result))
+    logger.debug(2, "For url %s returning %s", ud.url, result)
     return result
 
 methods = []
@@ -261,6 +277,8 @@ def fetcher_init(d):
         raise FetchError("Invalid SRCREV cache policy of: %s" % srcrev_policy)
 
     _checksum_cache.init_cache(d)
+    _mirror_strings.clear()
+    _mirror_tables.clear()
 
     for m in methods:
         if hasattr(m, "init"):
@@ -272,6 +290,15 @@ def fetcher_parse_save(d):
 def fetcher_parse_done(d):
     _checksum_cache.save_merge(d)
 
+def fetcher_checksums_save(d):
+    """
+    Save the checksums of local files computed outside of the parser
+    processes, for the task hashes
+    """
+    if _checksum_cache.cachedata_extras[0]:
+        _checksum_cache.save_extras(d)
+        _checksum_cache.save_merge(d)
+
 def fetcher_compare_revisions(d):
     """
     Compare the revisions in the persistant cache with current values and
@@ -292,7 +319,86 @@ def fetcher_compare_revisions(d):
     return False
 
 def mirror_from_string(data):
-    return [ i.split() for i in (data or "").replace('\\n','\n').split('\n') if i ]
+    data = data or ""
+    if data not in _mirror_strings:
+        _mirror_strings[data] = [ tuple(i.split()) for i in data.replace('\\n','\n').split('\n') if i ]
+    return list(_mirror_strings[data])
+
+def _digests_key(st):
+    return (st.st_dev, st.st_ino), (st.st_size, st.st_mtime)
+
+def file_digests(path, cached = True):
+    """
+    Return the md5 and sha256 digests of path. Unless cached is False, the
+    ones computed while downloading it or by an earlier call are reused if
+    the file didn't change.
+    """
+    ident, version = _digests_key(os.stat(path))
+    entry = _download_digests.get(ident)
+    if cached and entry and entry[0] == version:
+        return entry[1]
+    digests = bb.utils.file_digests(path)
+    _download_digests[ident] = (version, digests)
+    return digests
+
+class DigestFollower(threading.Thread):
+    """
+    Compute the digests of a file while a fetch command is writing it, so
+    verify_checksum() doesn't have to read it again. The digests are only
+    kept if the command succeeds and the file read is the one left at the
+    end.
+    """
+    interval = 0.1
+
+    def __init__(self, path):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.path = path
+        self.done = threading.Event()
+        self.result = None
+
+    def run(self):
+        digest = bb.utils.MultiDigest()
+        f = None
+        offset = 0
+        try:
+            while True:
+                # Only stop at the end of the file once the writer is done
+                finished = self.done.isSet()
+                if f is None:
+                    try:
+                        f = open(self.path, "rb")
+                    except IOError:
+                        if finished:
+                            return
+                        self.done.wait(self.interval)
+                        continue
+                block = f.read(bb.utils._hash_blocksize)
+                if block:
+                    digest.update(block)
+                    offset += len(block)
+                elif finished:
+                    break
+                elif os.fstat(f.fileno()).st_size < offset:
+                    # Truncated, the command started over
+                    return
+                else:
+                    self.done.wait(self.interval)
+            st = os.stat(self.path)
+            if _digests_key(st)[0] == _digests_key(os.fstat(f.fileno()))[0] and st.st_size == offset:
+                self.result = _digests_key(st), digest.hexdigests()
+        except EnvironmentError:
+            pass
+        finally:
+            if f:
+                f.close()
+
+    def finish(self, success = True):
+        self.done.set()
+        self.join()
+        if success and self.result:
+            (ident, version), digests = self.result
+            _download_digests[ident] = (version, digests)
 
 def verify_checksum(u, ud, d):
     """
@@ -307,8 +413,13 @@ def verify_checksum(u, ud, d):
     if not ud.method.supports_checksum(ud):
         return
 
-    md5data = bb.utils.md5_file(ud.localpath)
-    sha256data = bb.utils.sha256_file(ud.localpath)
+    digests = file_digests(ud.localpath)
+    if (ud.md5_expected and ud.md5_expected != digests["md5"]) or \
+       (ud.sha256_expected and ud.sha256_expected != digests["sha256"]):
+        # Make sure a mismatch isn't down to reused digests
+        digests = file_digests(ud.localpath, False)
+    md5data = digests["md5"]
+    sha256data = digests["sha256"]
 
     if ud.method.recommends_checksum(ud):
         # If strict checking enabled and neither sum defined, raise error
@@ -482,9 +593,50 @@ def check_network_access(d, info = "", url = None):
     else:
         logger.debug(1, "Fetcher accessed the network with the command %s" % info)
 
-def build_mirroruris(origud, mirrors, ld):
-    uris = []
-    uds = []
+class MirrorTable(object):
+    """
+    The (find, replace) pairs of a mirrors variable, compiled once, and
+    the mirror urls found for each url
+    """
+    def __init__(self, mirrors):
+        self.mirrors = []
+        for line in mirrors:
+            try:
+                (find, replace) = line
+            except ValueError:
+                continue
+            self.mirrors.append(compile_mirror(find, replace))
+        self.uris = {}
+
+def mirror_table(mirrors):
+    """
+    Return the MirrorTable of a list of mirrors from mirror_from_string()
+    """
+    key = tuple([tuple(line) for line in mirrors])
+    if key not in _mirror_tables:
+        _mirror_tables[key] = MirrorTable(mirrors)
+    return _mirror_tables[key]
+
+def mirror_fetchdata(newuri, ld):
+    try:
+        newud = FetchData(newuri, ld)
+        newud.setup_localpath(ld)
+        return newud
+    except bb.fetch2.BBFetchException as e:
+        logger.debug(1, "Mirror fetch failure for url %s" % newuri)
+        logger.debug(1, str(e))
+        return None
+
+def mirror_candidates(origud, mirrors, ld):
+    """
+    Return the mirror urls of origud in the order they should be tried,
+    as (url, FetchData) pairs. The urls are remembered by the mirror
+    table, and the FetchData is None for the urls found there.
+    """
+    table = mirror_table(mirrors)
+    key = (origud.url, origud.mirrortarball, os.path.basename(origud.localpath or ""))
+    if key in table.uris:
+        return [(uri, None) for uri in table.uris[key]]
 
     replacements = {}
     replacements["TYPE"] = origud.type
@@ -493,33 +645,39 @@ def build_mirroruris(origud, mirrors, ld):
     replacements["BASENAME"] = origud.path.split("/")[-1]
     replacements["MIRRORNAME"] = origud.host.replace(':','.') + origud.path.replace('/', '.').replace('*', '.')
 
-    def adduri(uri, ud, uris, uds):
-        for line in mirrors:
-            try:
-                (find, replace) = line
-            except ValueError:
+    candidates = []
+    seen = set([origud.url])
+    def adduri(ud):
+        uri_decoded = decodeurl(ud.url)
+        for mirror in table.mirrors:
+            newuri = _uri_replace(ud, uri_decoded, mirror, replacements)
+            if not newuri or newuri in seen:
                 continue
-            newuri = uri_replace(ud, find, replace, replacements, ld)
-            if not newuri or newuri in uris or newuri == origud.url:
-                continue
-            try:
-                newud = FetchData(newuri, ld)
-                newud.setup_localpath(ld)
-            except bb.fetch2.BBFetchException as e:
-                logger.debug(1, "Mirror fetch failure for url %s (original url: %s)" % (newuri, origud.url))
-                logger.debug(1, str(e))
+            newud = mirror_fetchdata(newuri, ld)
+            if not newud:
                 try:
                     ud.method.clean(ud, ld)
                 except UnboundLocalError:
                     pass
-                continue   
-            uris.append(newuri)
-            uds.append(newud)
+                continue
+            seen.add(newuri)
+            candidates.append((newuri, newud))
+
+            adduri(newud)
 
-            adduri(newuri, newud, uris, uds)
+    adduri(origud)
 
-    adduri(None, origud, uris, uds)
+    table.uris[key] = [uri for (uri, ud) in candidates]
+    return candidates
 
+def build_mirroruris(origud, mirrors, ld):
+    uris = []
+    uds = []
+    for uri, ud in mirror_candidates(origud, mirrors, ld):
+        ud = ud or mirror_fetchdata(uri, ld)
+        if ud:
+            uris.append(uri)
+            uds.append(ud)
     return uris, uds
 
 def try_mirror_url(newuri, origud, ud, ld, check = False):
@@ -588,10 +746,13 @@ def try_mirrors(d, origud, mirrors, check = False):
     """
     ld = d.createCopy()
 
-    uris, uds = build_mirroruris(origud, mirrors, ld)
-
-    for index, uri in enumerate(uris):
-        ret = try_mirror_url(uri, origud, uds[index], ld, check)
+    for uri, ud in mirror_candidates(origud, mirrors, ld):
+        # The FetchData of the urls known by the mirror table is only
+        # set up for the mirrors which are tried
+        ud = ud or mirror_fetchdata(uri, ld)
+        if not ud:
+            continue
+        ret = try_mirror_url(uri, origud, ud, ld, check)
         if ret != False:
             return ret
     return None
@@ -660,39 +821,47 @@ def get_file_checksums(filelist, pn):
     """Get a list of the checksums for a list of local files
 
     Returns the checksums for a list of local files, caching the results as
-    it proceeds
+    it proceeds. The files which aren't in the cache are hashed together, in
+    parallel.
 
     """
 
-    def checksum_file(f):
-        try:
-            checksum = _checksum_cache.get_checksum(f)
-        except OSError as e:
-            import traceback
-            bb.warn("Unable to get checksum for %s SRC_URI entry %s: %s" % (pn, os.path.basename(f), e))
-            return None
-        return checksum
+    def checksum_error(f, e):
+        bb.warn("Unable to get checksum for %s SRC_URI entry %s: %s" % (pn, os.path.basename(f), e))
 
-    checksums = []
+    entries = []
     for pth in filelist.split():
-        checksum = None
         if '*' in pth:
             # Handle globs
             import glob
-            for f in glob.glob(pth):
-                checksum = checksum_file(f)
-                if checksum:
-                    checksums.append((f, checksum))
+            entries.append((pth, glob.glob(pth)))
         elif os.path.isdir(pth):
             # Handle directories
-            for root, dirs, files in os.walk(pth):
-                for name in files:
-                    fullpth = os.path.join(root, name)
-                    checksum = checksum_file(fullpth)
-                    if checksum:
-                        checksums.append((fullpth, checksum))
+            files = []
+            for root, dirs, names in os.walk(pth):
+                files.extend(os.path.join(root, name) for name in names)
+            entries.append((pth, files))
+        else:
+            entries.append((pth, None))
+
+    allfiles = []
+    for pth, files in entries:
+        if files is None:
+            allfiles.append(pth)
         else:
-            checksum = checksum_file(pth)
+            allfiles.extend(files)
+    found = _checksum_cache.get_checksums(allfiles, checksum_error)
+
+    checksums = []
+    for pth, files in entries:
+        checksum = found.get(pth)
+        if files is not None:
+            # The glob or directory itself gets the checksum of its last file
+            checksum = None
+            for f in files:
+                checksum = found.get(f)
+                if checksum:
+                    checksums.append((f, checksum))
 
         if checksum:
             checksums.append((pth, checksum))
@@ -1131,6 +1300,10 @@ class Fetch(object):
     def download(self, urls = []):
         """
         Fetch all urls
+
+        If BB_NUMBER_FETCH_THREADS is set to more than 1, that many urls
+        are downloaded at once and the failures reported together at the
+        end.
         """
         if len(urls) == 0:
             urls = self.urls
@@ -1138,66 +1311,151 @@ class Fetch(object):
         network = self.d.getVar("BB_NO_NETWORK", True)
         premirroronly = (self.d.getVar("BB_FETCH_PREMIRRORONLY", True) == "1")
 
-        for u in urls:
-            ud = self.ud[u]
-            ud.setup_localpath(self.d)
-            m = ud.method
-            localpath = ""
+        jobs = int(self.d.getVar("BB_NUMBER_FETCH_THREADS", True) or 1)
+        if jobs > 1 and len(urls) > 1:
+            self.download_concurrent(urls, jobs, network, premirroronly)
+            return
 
-            lf = bb.utils.lockfile(ud.lockfile)
+        for u in urls:
+            self.download_url(u, network, premirroronly)
 
+    def download_concurrent(self, urls, jobs, network, premirroronly):
+        """
+        Download urls in up to jobs processes at a time. The fetchers change
+        the current directory, which threads would share, so each url is
+        downloaded in a process of its own. The lock, mirrors, checksum
+        verification and donestamp of each url are handled as in download().
+        """
+        import multiprocessing
+        import Queue
+
+        class EventPipe(object):
+            """
+            Stands in for bb.event.worker_pipe in the children, so that the
+            parent writes each event to the worker pipe in one piece
+            """
+            def __init__(self, results):
+                self.results = results
+
+            def write(self, data):
+                self.results.put(("event", data))
+
+        def child(u, results):
+            if bb.event.worker_pipe:
+                bb.event.worker_pipe = EventPipe(results)
             try:
-                self.d.setVar("BB_NO_NETWORK", network)
+                self.download_url(u, network, premirroronly)
+                results.put(("done", u, None))
+            except NetworkAccess as exc:
+                results.put(("done", u, exc))
+            except Exception as exc:
+                results.put(("done", u, str(exc) or exc.__class__.__name__))
+
+        results = multiprocessing.Queue()
+        pending = list(urls)
+        running = {}
+        errors = {}
+        try:
+            while pending or running:
+                while pending and len(running) < jobs:
+                    u = pending.pop(0)
+                    running[u] = multiprocessing.Process(target=child, args=(u, results))
+                    running[u].start()
+                try:
+                    msg = results.get(timeout=1)
+                except Queue.Empty:
+                    # Look for processes which died without a result
+                    for u, process in running.items():
+                        if not process.is_alive() and process.exitcode != 0:
+                            errors[u] = "Download process exited with code %s" % process.exitcode
+                            del running[u]
+                    continue
+                if msg[0] == "event":
+                    bb.event.worker_pipe.write(msg[1])
+                    continue
+                u, error = msg[1:]
+                if u in running:
+                    running.pop(u).join()
+                    if isinstance(error, NetworkAccess):
+                        raise error
+                    if error:
+                        errors[u] = error
+        finally:
+            for process in running.itervalues():
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+
+        if errors:
+            msg = "Unable to fetch %d of %d URLs:" % (len(errors), len(urls))
+            for u in urls:
+                if u in errors:
+                    msg += "\n%s: %s" % (u, errors[u])
+            raise FetchError(msg)
+
+    def download_url(self, u, network, premirroronly):
+        """
+        Fetch url u, holding its lock
+        """
+        ud = self.ud[u]
+        ud.setup_localpath(self.d)
+        m = ud.method
+        localpath = ""
+
+        lf = bb.utils.lockfile(ud.lockfile)
+
+        try:
+            self.d.setVar("BB_NO_NETWORK", network)
  
-                if os.path.exists(ud.donestamp) and not m.need_update(u, ud, self.d):
+            if os.path.exists(ud.donestamp) and not m.need_update(u, ud, self.d):
+                localpath = ud.localpath
+            elif m.try_premirror(u, ud, self.d):
+                logger.debug(1, "Trying PREMIRRORS")
+                mirrors = mirror_from_string(self.d.getVar('PREMIRRORS', True))
+                localpath = try_mirrors(self.d, ud, mirrors, False)
+
+            if premirroronly:
+                self.d.setVar("BB_NO_NETWORK", "1")
+
+            os.chdir(self.d.getVar("DL_DIR", True))
+
+            firsterr = None
+            if not localpath and ((not os.path.exists(ud.donestamp)) or m.need_update(u, ud, self.d)):
+                try:
+                    logger.debug(1, "Trying Upstream")
+                    m.download(u, ud, self.d)
+                    if hasattr(m, "build_mirror_data"):
+                        m.build_mirror_data(u, ud, self.d)
                     localpath = ud.localpath
-                elif m.try_premirror(u, ud, self.d):
-                    logger.debug(1, "Trying PREMIRRORS")
-                    mirrors = mirror_from_string(self.d.getVar('PREMIRRORS', True))
-                    localpath = try_mirrors(self.d, ud, mirrors, False)
+                    # early checksum verify, so that if checksum mismatched,
+                    # fetcher still have chance to fetch from mirror
+                    update_stamp(u, ud, self.d)
 
-                if premirroronly:
-                    self.d.setVar("BB_NO_NETWORK", "1")
+                except bb.fetch2.NetworkAccess:
+                    raise
 
-                os.chdir(self.d.getVar("DL_DIR", True))
+                except BBFetchException as e:
+                    if isinstance(e, ChecksumError):
+                        logger.warn("Checksum error encountered with download (will attempt other sources): %s" % str(e))
+                    else:
+                        logger.warn('Failed to fetch URL %s, attempting MIRRORS if available' % u)
+                        logger.debug(1, str(e))
+                    firsterr = e
+                    # Remove any incomplete fetch
+                    m.clean(ud, self.d)
+                    logger.debug(1, "Trying MIRRORS")
+                    mirrors = mirror_from_string(self.d.getVar('MIRRORS', True))
+                    localpath = try_mirrors (self.d, ud, mirrors)
 
-                firsterr = None
-                if not localpath and ((not os.path.exists(ud.donestamp)) or m.need_update(u, ud, self.d)):
-                    try:
-                        logger.debug(1, "Trying Upstream")
-                        m.download(u, ud, self.d)
-                        if hasattr(m, "build_mirror_data"):
-                            m.build_mirror_data(u, ud, self.d)
-                        localpath = ud.localpath
-                        # early checksum verify, so that if checksum mismatched,
-                        # fetcher still have chance to fetch from mirror
-                        update_stamp(u, ud, self.d)
-
-                    except bb.fetch2.NetworkAccess:
-                        raise
-
-                    except BBFetchException as e:
-                        if isinstance(e, ChecksumError):
-                            logger.warn("Checksum error encountered with download (will attempt other sources): %s" % str(e))
-                        else:
-                            logger.warn('Failed to fetch URL %s, attempting MIRRORS if available' % u)
-                            logger.debug(1, str(e))
-                        firsterr = e
-                        # Remove any incomplete fetch
-                        m.clean(ud, self.d)
-                        logger.debug(1, "Trying MIRRORS")
-                        mirrors = mirror_from_string(self.d.getVar('MIRRORS', True))
-                        localpath = try_mirrors (self.d, ud, mirrors)
-
-                if not localpath or ((not os.path.exists(localpath)) and localpath.find("*") == -1):
-                    if firsterr:
-                        logger.error(str(firsterr))
-                    raise FetchError("Unable to fetch URL from any source.", u)
-
-                update_stamp(u, ud, self.d)
-
-            finally:
-                bb.utils.unlockfile(lf)
+            if not localpath or ((not os.path.exists(localpath)) and localpath.find("*") == -1):
+                if firsterr:
+                    logger.error(str(firsterr))
+                raise FetchError("Unable to fetch URL from any source.", u)
+
+            update_stamp(u, ud, self.d)
+
+        finally:
+            bb.utils.unlockfile(lf)
 
     def checkstatus(self, urls = []):
         """
@@ -1208,25 +1466,68 @@ class Fetch(object):
             urls = self.urls
 
         for u in urls:
-            ud = self.ud[u]
-            ud.setup_localpath(self.d)
-            m = ud.method
-            logger.debug(1, "Testing URL %s", u)
-            # First try checking uri, u, from PREMIRRORS
-            mirrors = mirror_from_string(self.d.getVar('PREMIRRORS', True))
-            ret = try_mirrors(self.d, ud, mirrors, True)
-            if not ret:
-                # Next try checking from the original uri, u
-                try:
-                    ret = m.checkstatus(u, ud, self.d)
-                except:
-                    # Finally, try checking uri, u, from MIRRORS
-                    mirrors = mirror_from_string(self.d.getVar('MIRRORS', True))
-                    ret = try_mirrors(self.d, ud, mirrors, True)
-
-            if not ret:
+            if not self.checkstatus_url(u):
                 raise FetchError("URL %s doesn't work" % u, u)
 
+    def checkstatus_url(self, u):
+        """
+        Check url u exists in PREMIRRORS, upstream or in MIRRORS
+        """
+        ud = self.ud[u]
+        ud.setup_localpath(self.d)
+        m = ud.method
+        logger.debug(1, "Testing URL %s", u)
+        # First try checking uri, u, from PREMIRRORS
+        mirrors = mirror_from_string(self.d.getVar('PREMIRRORS', True))
+        ret = try_mirrors(self.d, ud, mirrors, True)
+        if not ret:
+            # Next try checking from the original uri, u
+            try:
+                ret = m.checkstatus(u, ud, self.d)
+            except:
+                # Finally, try checking uri, u, from MIRRORS
+                mirrors = mirror_from_string(self.d.getVar('MIRRORS', True))
+                ret = try_mirrors(self.d, ud, mirrors, True)
+        return ret
+
+    def available(self, urls = [], threads = None):
+        """
+        Check urls as checkstatus() does, several at a time, and return
+        the ones which exist. The urls are checked by threads threads,
+        BB_NUMBER_FETCH_THREADS or 8 by default. Each thread keeps its
+        HTTP connections open for the next checks, see Wget.checkstatus().
+        """
+        from multiprocessing.pool import ThreadPool
+
+        if len(urls) == 0:
+            urls = self.urls
+        if not threads:
+            threads = int(self.d.getVar("BB_NUMBER_FETCH_THREADS", True) or 8)
+
+        connections = []
+        def init():
+            http_connections.cache = {}
+            connections.append(http_connections.cache)
+
+        def check(u):
+            try:
+                return bool(self.checkstatus_url(u))
+            except BBFetchException as e:
+                logger.debug(1, "URL %s doesn't work: %s", u, str(e))
+                return False
+
+        pool = ThreadPool(max(1, min(threads, len(urls))), init)
+        try:
+            found = pool.map(check, urls)
+        finally:
+            pool.close()
+            pool.join()
+            for cache in connections:
+                for connection in cache.values():
+                    connection.close()
+
+        return [u for u, ok in zip(urls, found) if ok]
+
     def unpack(self, root, urls = []):
         """
         Check all urls exist upstream
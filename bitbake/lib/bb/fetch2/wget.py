@@ -26,7 +26,12 @@ BitBake build tools.
 # Based on functions from the base bb module, Copyright 2003 Holger Schurig
 
 import os
+import ssl
+import shlex
+import socket
 import logging
+import httplib
+import urlparse
 import bb
 import urllib
 from   bb import data
@@ -53,10 +58,13 @@ class Wget(FetchMethod):
         ud.basename = os.path.basename(ud.path)
         ud.localfile = data.expand(urllib.unquote(ud.basename), d)
 
+    def basecmd(self, d):
+        return d.getVar("FETCHCMD_wget", True) or "/usr/bin/env wget -t 2 -T 30 -nv --passive-ftp --no-check-certificate"
+
     def download(self, uri, ud, d, checkonly = False):
         """Fetch urls"""
 
-        basecmd = d.getVar("FETCHCMD_wget", True) or "/usr/bin/env wget -t 2 -T 30 -nv --passive-ftp --no-check-certificate"
+        basecmd = self.basecmd(d)
 
         if checkonly:
             fetchcmd = d.getVar("CHECKCOMMAND_wget", True) or d.expand(basecmd + " -c -P ${DL_DIR} '${URI}'")
@@ -77,7 +85,18 @@ class Wget(FetchMethod):
             logger.info("fetch " + uri)
             logger.debug(2, "executing " + fetchcmd)
         bb.fetch2.check_network_access(d, fetchcmd)
-        runfetchcmd(fetchcmd, d, quiet=checkonly)
+        if checkonly:
+            runfetchcmd(fetchcmd, d, quiet=checkonly)
+        else:
+            # Compute the checksums as the file is being downloaded
+            follower = bb.fetch2.DigestFollower(ud.localpath)
+            follower.start()
+            success = False
+            try:
+                runfetchcmd(fetchcmd, d, quiet=checkonly)
+                success = True
+            finally:
+                follower.finish(success)
 
         # Sanity check since wget can pretend it succeed when it didn't
         # Also, this used to happen if sourceforge sent us to the mirror page
@@ -87,4 +106,104 @@ class Wget(FetchMethod):
         return True
 
     def checkstatus(self, uri, ud, d):
-        return self.download(uri, ud, d, True)
+        """
+        Check the url with wget, or with HEAD requests over the HTTP
+        connections kept open by the threads of Fetch.available(). The
+        HEAD requests take the tries, timeout and certificate checking
+        from the options in FETCHCMD_wget.
+        """
+        connections = getattr(bb.fetch2.http_connections, "cache", None)
+        if connections is None or ud.type not in ['http', 'https'] or ud.user or \
+                d.getVar("CHECKCOMMAND_wget", True) or self.proxied(ud, d):
+            return self.download(uri, ud, d, True)
+
+        url = encodeurl([ud.type, ud.host, ud.path, "", "", {}])
+        bb.fetch2.check_network_access(d, "HEAD " + url, url)
+        options = self.head_options(d)
+        for redirect in range(5):
+            status, location = self.head(url, connections, *options)
+            if status in (301, 302, 303, 307) and location:
+                url = urlparse.urljoin(url, location)
+                continue
+            if status == 200:
+                return True
+            break
+        raise FetchError("HEAD request for %s returned status %s" % (url, status), uri)
+
+    def proxied(self, ud, d):
+        for var in (ud.type + "_proxy", "all_proxy", "ALL_PROXY"):
+            if d.getVar(var, True) or os.environ.get(var):
+                return True
+        return False
+
+    def head_options(self, d):
+        """
+        Return the number of tries, the timeout and whether to verify the
+        certificates of the HEAD requests, from the -t/--tries,
+        -T/--timeout and --no-check-certificate options of FETCHCMD_wget.
+        As with wget, the defaults are 20 tries and a 900 second timeout,
+        and -t 0 (retry forever) is limited to the default.
+        """
+        tries, timeout, verify = 20, 900.0, True
+        args = shlex.split(self.basecmd(d))
+        for i, arg in enumerate(args):
+            value = None
+            if arg in ("-t", "--tries", "-T", "--timeout") and i + 1 < len(args):
+                value = args[i + 1]
+            elif arg.startswith("--tries=") or arg.startswith("--timeout="):
+                arg, value = arg.split("=", 1)
+            elif arg[:2] in ("-t", "-T") and len(arg) > 2:
+                arg, value = arg[:2], arg[2:]
+            elif arg == "--no-check-certificate":
+                verify = False
+            if value is None:
+                continue
+            try:
+                if arg in ("-t", "--tries"):
+                    tries = int(value) or 20
+                else:
+                    timeout = float(value)
+            except ValueError:
+                logger.warn("Invalid %s value '%s' in FETCHCMD_wget", arg, value)
+        return tries, timeout, verify
+
+    def head(self, url, connections, tries = 2, timeout = 30, verify = True):
+        """
+        Send a HEAD request for url, reusing the connection to its server
+        if there is one. Return the status and the redirect location.
+        """
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+        if query:
+            path += "?" + query
+        key = (scheme, netloc)
+        attempt = 0
+        while True:
+            reused = key in connections
+            if not reused:
+                if scheme == "https":
+                    kwargs = {}
+                    # Python 2.7.9 and later verify certificates by default
+                    if not verify and hasattr(ssl, "_create_unverified_context"):
+                        kwargs["context"] = ssl._create_unverified_context()
+                    connections[key] = httplib.HTTPSConnection(netloc, timeout = timeout, **kwargs)
+                else:
+                    connections[key] = httplib.HTTPConnection(netloc, timeout = timeout)
+            connection = connections[key]
+            try:
+                connection.request("HEAD", path or "/", headers = {"User-Agent" : "Wget/bitbake"})
+                response = connection.getresponse()
+                response.read()
+            except (httplib.HTTPException, socket.error) as e:
+                connection.close()
+                del connections[key]
+                # The server may have closed a connection kept open, which
+                # doesn't count as a try
+                if not reused:
+                    attempt += 1
+                    if attempt >= tries:
+                        raise FetchError("HEAD request for %s failed: %s" % (url, e), url)
+                continue
+            if response.will_close:
+                connection.close()
+                del connections[key]
+            return response.status, response.getheader("location")
@@ -0,0 +1,127 @@
+# ex:ts=4:sw=4:sts=4:et
+# -*- tab-width: 4; c-basic-offset: 4; indent-tabs-mode: nil -*-
+"""
+BitBake 'inotify' implementation
+
+Minimal wrapper around the Linux inotify interface using ctypes, used to
+find out which directories changed between two parses in a long running
+server.
+"""
+
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import errno
+import struct
+import logging
+
+logger = logging.getLogger("BitBake.Inotify")
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0x80000
+
+CHANGE_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+               IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_event = struct.Struct("iIII")
+
+class Overflow(Exception):
+    """Events were lost, everything has to be assumed to have changed"""
+
+class DirectoryWatcher(object):
+    """
+    Watch a set of directories for changes to their entries
+    """
+
+    def __init__(self):
+        import ctypes, ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        self.wds = {}
+
+    def watch(self, directory):
+        """
+        Start watching directory, returning False if it can't be watched
+        (e.g. it doesn't exist or the watch limit was reached)
+        """
+        if directory in self.wds:
+            return True
+        import ctypes
+        wd = self.libc.inotify_add_watch(self.fd, directory, CHANGE_MASK | IN_ONLYDIR)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err not in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                logger.debug(1, "Unable to watch %s: %s", directory, os.strerror(err))
+            return False
+        self.dirs[wd] = directory
+        self.wds[directory] = wd
+        return True
+
+    def changes(self):
+        """
+        Return the (directory, name) pairs changed since the last call,
+        name being None when the directory itself went away
+        """
+        changed = []
+        while True:
+            try:
+                buf = os.read(self.fd, 65536)
+            except OSError as exc:
+                if exc.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise
+            if not buf:
+                break
+            offset = 0
+            while offset < len(buf):
+                wd, mask, cookie, length = _event.unpack_from(buf, offset)
+                offset += _event.size
+                name = buf[offset:offset + length].rstrip("\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    raise Overflow()
+                directory = self.dirs.get(wd)
+                if directory is None:
+                    continue
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                    changed.append((directory, None))
+                    if mask & IN_MOVE_SELF:
+                        self.libc.inotify_rm_watch(self.fd, wd)
+                    del self.dirs[wd]
+                    del self.wds[directory]
+                else:
+                    changed.append((directory, name))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+        self.dirs = {}
+        self.wds = {}
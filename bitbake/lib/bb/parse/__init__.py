@@ -28,10 +28,17 @@ handlers = []
 
 import os
 import stat
+import errno
 import logging
 import bb
 import bb.utils
 import bb.siggen
+from bb.cache import MultiProcessCache, RecipeInfoFile
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 logger = logging.getLogger("BitBake.Parsing")
 
@@ -52,23 +59,355 @@ class ParseError(Exception):
 class SkipPackage(Exception):
     """Exception raised to skip this package"""
 
-__mtime_cache = {}
+class StatCache(object):
+    """
+    Cache of stat() results shared by the parsers and the recipe cache
+    checks, on the assumption that files do not change during a parse.
+
+    Files which don't exist are cached as well and directories listed
+    with prime() answer lookups of missing files without a system call
+    (e.g. the paths tried by which() along BBPATH). The server primes the
+    cache before the parser processes are forked so they inherit it.
+
+    Between two parses the cache is either cleared or, once watch() has
+    set up inotify, only entries in directories which changed are dropped.
+    """
+
+    def __init__(self):
+        self.watcher = None
+        self.reset_stats()
+        self.clear()
+
+    def reset_stats(self):
+        self.syscalls = 0
+        self.avoided = 0
+
+    def clear(self):
+        self.stats = {}
+        self.listings = {}
+        self.entries = {}
+        self.unwatched = set()
+
+    def missing(self, path):
+        """Return True if path is known not to exist"""
+        dirname, name = os.path.split(path)
+        if not name or not os.path.isabs(dirname):
+            return False
+        if dirname in self.listings:
+            listing = self.listings[dirname]
+            return listing is None or name not in listing
+        if self.stats.get(dirname, 0) is None:
+            return True
+        return self.missing(dirname)
+
+    def stat(self, f):
+        """Return the stat() result of f, or None if it doesn't exist"""
+        try:
+            st = self.stats[f]
+        except KeyError:
+            pass
+        else:
+            self.avoided += 1
+            return st
+
+        if self.missing(f):
+            self.avoided += 1
+            st = None
+        else:
+            self.syscalls += 1
+            try:
+                st = os.stat(f)
+            except OSError:
+                st = None
+        self.stats[f] = st
+        self.add_entry(f)
+        return st
+
+    def mtime(self, f):
+        """Return the mtime of f, or None if it doesn't exist"""
+        st = self.stat(f)
+        if st is None:
+            return None
+        return st[stat.ST_MTIME]
+
+    def update(self, f):
+        self.stats.pop(f, None)
+        return self.mtime(f)
+
+    def add_entry(self, f):
+        dirname = os.path.dirname(f)
+        if dirname not in self.entries:
+            self.entries[dirname] = set()
+            if self.watcher and not self.watcher.watch(dirname):
+                self.unwatched.add(dirname)
+        self.entries[dirname].add(f)
+
+    def prime(self, dirs):
+        """List the given directories up front"""
+        for dirname in dirs:
+            if dirname in self.listings or not os.path.isabs(dirname):
+                continue
+            self.syscalls += 1
+            try:
+                self.listings[dirname] = frozenset(os.listdir(dirname))
+            except OSError:
+                self.listings[dirname] = None
+            if dirname not in self.entries:
+                self.entries[dirname] = set()
+                if self.watcher and not self.watcher.watch(dirname):
+                    self.unwatched.add(dirname)
+
+    def watch(self):
+        """
+        Use inotify to keep the cache between parses, returning False if
+        it isn't available
+        """
+        if self.watcher:
+            return True
+        try:
+            import bb.inotify
+            self.watcher = bb.inotify.DirectoryWatcher()
+        except (ImportError, OSError, AttributeError) as exc:
+            logger.debug(1, "Not using inotify for the stat cache: %s", exc)
+            return False
+        for dirname in self.entries:
+            if not self.watcher.watch(dirname):
+                self.unwatched.add(dirname)
+        return True
+
+    def forget(self, dirname):
+        self.listings.pop(dirname, None)
+        for f in self.entries.pop(dirname, ()):
+            self.stats.pop(f, None)
+
+    def refresh(self):
+        """Drop anything which may have changed since the last parse"""
+        if not self.watcher:
+            self.clear()
+            return
+
+        import bb.inotify
+        try:
+            changes = self.watcher.changes()
+        except bb.inotify.Overflow:
+            self.clear()
+            return
+
+        for dirname, name in changes:
+            if name is None:
+                self.forget(dirname)
+            else:
+                self.listings.pop(dirname, None)
+                f = os.path.join(dirname, name)
+                self.stats.pop(f, None)
+                # The entry itself may be a directory we hold listings for
+                self.forget(f)
+        for dirname in self.unwatched:
+            self.forget(dirname)
+        self.unwatched = set()
+
+    def report(self):
+        logger.debug(1, "Stat cache: %d system calls made, %d avoided",
+                     self.syscalls, self.avoided)
+
+statcache = StatCache()
+
+class FeederLog(logging.Handler):
+    """
+    Record the warnings and errors logged while the line feeders run, so
+    that the statement cache can log them again when the file is not
+    parsed
+    """
+
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.messages = []
+        self.logger = logging.getLogger("BitBake")
+        self.logger.addHandler(self)
+
+    def emit(self, record):
+        self.messages.append((record.name, record.levelno, record.getMessage()))
+
+    def close(self):
+        self.logger.removeHandler(self)
+        logging.Handler.close(self)
+
+class StatementCache(MultiProcessCache):
+    """
+    Persistent cache of the statements parsed from .bb, .bbclass, .inc and
+    .conf files, so that a reparse doesn't have to run the line feeders
+    again for the files which didn't change.
+
+    Entries are keyed by the absolute filename and only used if the mtime,
+    size and the filename the file was parsed as still match. They are kept
+    in an indexed file (see bb.cache.RecipeInfoFile) which is mapped before
+    the parser processes fork, each process only unpickling the statements
+    it needs. New entries are saved by each process as extras and merged
+    into the file by the server once parsing is complete.
+    """
+    cache_file_name = "bb_statements.dat"
+    CACHE_VERSION = 2
+
+    def __init__(self):
+        MultiProcessCache.__init__(self)
+        self.store = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def init_cache(self, d):
+        if self.store is not None:
+            self.store.close()
+        self.store = None
+        self.cachefile = None
+        cachedir = (d.getVar("PERSISTENT_DIR", True) or
+                    d.getVar("CACHE", True))
+        if cachedir in [None, '']:
+            return
+        bb.utils.mkdirhier(cachedir)
+        self.cachefile = os.path.join(cachedir, self.__class__.cache_file_name)
+        self.store = RecipeInfoFile(self.cachefile)
+        self.load_store()
+
+    def load_store(self):
+        try:
+            version = self.store.load()
+        except Exception:
+            return
+        if version != self.__class__.CACHE_VERSION:
+            self.store.close()
+
+    def lookup(self, fn, abs_fn):
+        """
+        Return a (stamp, statements) pair for abs_fn, statements being None
+        if the file has to be parsed, in which case the stamp should be
+        handed to add() along with the result. The messages logged when
+        the file was parsed are logged again on a hit.
+        """
+        if self.store is None:
+            return None, None
+        st = statcache.stat(abs_fn)
+        if st is None:
+            return None, None
+        stamp = (st.st_mtime, st.st_size, fn)
+
+        if abs_fn in self.store:
+            try:
+                entry = self.store.get(abs_fn)
+            except Exception:
+                entry = None
+            if entry and entry[0] == stamp:
+                self.hits += 1
+                for name, level, msg in entry[2]:
+                    logging.getLogger(name).log(level, "%s", msg)
+                return stamp, entry[1]
+        self.misses += 1
+        return stamp, None
+
+    def capture(self):
+        """
+        Return a FeederLog recording the messages logged while a file is
+        fed, to be closed and handed to add() with the statements
+        """
+        return FeederLog()
+
+    def add(self, abs_fn, stamp, statements, log = None):
+        if stamp is not None:
+            messages = []
+            if log is not None:
+                messages = log.messages
+            self.cachedata_extras[0][abs_fn] = (stamp, statements, messages)
+
+    def save_extras(self, d):
+        if self.cachedata_extras[0]:
+            MultiProcessCache.save_extras(self, d)
+
+    def save_merge(self, d):
+        if not self.cachefile:
+            return
+
+        glf = bb.utils.lockfile(self.cachefile + ".lock")
+
+        update = self.cachedata_extras[0]
+        self.cachedata_extras = self.create_cachedata()
+        cachedir = os.path.dirname(self.cachefile)
+        prefix = os.path.basename(self.cachefile) + '-'
+        with bb.utils.gc_disabled():
+            for f in [y for y in os.listdir(cachedir) if y.startswith(prefix)]:
+                f = os.path.join(cachedir, f)
+                try:
+                    p = pickle.Unpickler(file(f, "rb"))
+                    extradata, version = p.load()
+                except (IOError, EOFError):
+                    extradata, version = None, None
+                if version == self.__class__.CACHE_VERSION:
+                    update.update(extradata[0])
+                os.unlink(f)
+
+        # Another server may have written the file since it was loaded
+        self.load_store()
+        keep = []
+        stale = 0
+        if self.store.map is not None:
+            for abs_fn in self.store.keys():
+                if abs_fn in update:
+                    continue
+                if statcache.mtime(abs_fn) is None:
+                    stale += 1
+                    continue
+                keep.append(abs_fn)
+
+        if update or stale:
+            self.store.write(self.__class__.CACHE_VERSION, keep, update)
+            self.load_store()
+
+        bb.utils.unlockfile(glf)
+
+    def report(self):
+        lookups = self.hits + self.misses
+        if lookups:
+            logger.debug(1, "Statement cache: %d hits, %d misses (%d%% hit rate)",
+                         self.hits, self.misses, self.hits * 100 / lookups)
+
+statements = StatementCache()
+
+def statement_cache_init(d):
+    statements.init_cache(d)
+
+def statement_cache_save(d):
+    statements.save_extras(d)
+
+def statement_cache_savemerge(d):
+    statements.save_merge(d)
+
 def cached_mtime(f):
-    if f not in __mtime_cache:
-        __mtime_cache[f] = os.stat(f)[stat.ST_MTIME]
-    return __mtime_cache[f]
+    mtime = statcache.mtime(f)
+    if mtime is None:
+        raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), f)
+    return mtime
 
 def cached_mtime_noerror(f):
-    if f not in __mtime_cache:
-        try:
-            __mtime_cache[f] = os.stat(f)[stat.ST_MTIME]
-        except OSError:
-            return 0
-    return __mtime_cache[f]
+    return statcache.mtime(f) or 0
 
 def update_mtime(f):
-    __mtime_cache[f] = os.stat(f)[stat.ST_MTIME]
-    return __mtime_cache[f]
+    mtime = statcache.update(f)
+    if mtime is None:
+        raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), f)
+    return mtime
+
+def which(path, item):
+    """
+    Locate a file in a PATH like bb.utils.which(), using the stat cache
+    """
+    for p in (path or "").split(':'):
+        next = os.path.join(p, item)
+        if statcache.mtime(next) is not None:
+            if not os.path.isabs(next):
+                next = os.path.abspath(next)
+            return next
+    return ""
 
 def mark_dependency(d, f):
     if f.startswith('./'):
@@ -102,7 +441,7 @@ def init_parser(d):
 def resolve_file(fn, d):
     if not os.path.isabs(fn):
         bbpath = d.getVar("BBPATH", True)
-        newfn = bb.utils.which(bbpath, fn)
+        newfn = which(bbpath, fn)
         if not newfn:
             raise IOError("file %s not found in %s" % (fn, bbpath))
         fn = newfn
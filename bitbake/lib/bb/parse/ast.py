@@ -160,7 +160,7 @@ class MethodFlagsNode(AstNode):
     def __init__(self, filename, lineno, key, m):
         AstNode.__init__(self, filename, lineno)
         self.key = key
-        self.m = m
+        self.groupd = m.groupdict()
 
     def eval(self, data):
         if data.getVar(self.key):
@@ -168,11 +168,11 @@ class MethodFlagsNode(AstNode):
             # flags could cause problems
             data.setVarFlag(self.key, 'python', None)
             data.setVarFlag(self.key, 'fakeroot', None)
-        if self.m.group("py") is not None:
+        if self.groupd["py"] is not None:
             data.setVarFlag(self.key, "python", "1")
         else:
             data.delVarFlag(self.key, "python")
-        if self.m.group("fr") is not None:
+        if self.groupd["fr"] is not None:
             data.setVarFlag(self.key, "fakeroot", "1")
         else:
             data.delVarFlag(self.key, "fakeroot")
@@ -183,6 +183,17 @@ class ExportFuncsNode(AstNode):
         self.n = fns.split()
         self.classes = classes
 
+    def __getstate__(self):
+        # classes is the parser's stack of the classes being inherited,
+        # which has to stay shared when the statements come from a cache
+        state = self.__dict__.copy()
+        del state["classes"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.classes = bb.parse.BBHandler.classes
+
     def eval(self, data):
         for f in self.n:
             allvars = []
@@ -470,4 +481,7 @@ def multi_finalize(fn, d):
         safe_d.setVar("__VARIANTS", " ".join(variants))
 
     datastores[""] = d
+
+    stats = bb.data_smart.finalize_stats
+    logger.debug(2, "Finalising %s took %.3fs (%d calls)", fn, stats.time, stats.calls)
     return datastores
@@ -50,6 +50,7 @@ __python_func_regexp__   = re.compile( r"(\s+.*)|(^$)" )
 __infunc__ = ""
 __inpython__ = False
 __body__   = []
+__residue__ = []
 __classname__ = ""
 classes = [ None, ]
 
@@ -88,19 +89,26 @@ def get_statements(filename, absolute_filename, base_name):
     try:
         return cached_statements[absolute_filename]
     except KeyError:
-        file = open(absolute_filename, 'r')
-        statements = ast.StatementGroup()
-
-        lineno = 0
-        while True:
-            lineno = lineno + 1
-            s = file.readline()
-            if not s: break
-            s = s.rstrip()
-            feeder(lineno, s, filename, base_name, statements)
-        if __inpython__:
-            # add a blank line to close out any python definition
-            feeder(IN_PYTHON_EOF, "", filename, base_name, statements)
+        stamp, statements = bb.parse.statements.lookup(filename, absolute_filename)
+        if statements is None:
+            file = open(absolute_filename, 'r')
+            statements = ast.StatementGroup()
+
+            log = bb.parse.statements.capture()
+            try:
+                lineno = 0
+                while True:
+                    lineno = lineno + 1
+                    s = file.readline()
+                    if not s: break
+                    s = s.rstrip()
+                    feeder(lineno, s, filename, base_name, statements)
+                if __inpython__:
+                    # add a blank line to close out any python definition
+                    feeder(IN_PYTHON_EOF, "", filename, base_name, statements)
+            finally:
+                log.close()
+            bb.parse.statements.add(absolute_filename, stamp, statements, log)
 
         if filename.endswith(".bbclass") or filename.endswith(".inc"):
             cached_statements[absolute_filename] = statements
@@ -116,6 +124,7 @@ def handle(fn, d, include):
 
     if include == 0:
         logger.debug(2, "BB %s: handle(data)", fn)
+        bb.data_smart.finalize_stats.reset()
     else:
         logger.debug(2, "BB %s: handle(data, include)", fn)
 
@@ -59,7 +59,7 @@ def include(oldfn, fn, lineno, data, error_out):
     if not os.path.isabs(fn):
         dname = os.path.dirname(oldfn)
         bbpath = "%s:%s" % (dname, data.getVar("BBPATH", True))
-        abs_fn = bb.utils.which(bbpath, fn)
+        abs_fn = bb.parse.which(bbpath, fn)
         if abs_fn:
             fn = abs_fn
 
@@ -88,26 +88,34 @@ def handle(fn, data, include):
         oldfile = data.getVar('FILE')
 
     abs_fn = resolve_file(fn, data)
-    f = open(abs_fn, 'r')
+    stamp, statements = bb.parse.statements.lookup(fn, abs_fn)
+    if statements is None:
+        f = open(abs_fn, 'r')
 
     if include:
         bb.parse.mark_dependency(data, abs_fn)
 
-    statements = ast.StatementGroup()
-    lineno = 0
-    while True:
-        lineno = lineno + 1
-        s = f.readline()
-        if not s: break
-        w = s.strip()
-        if not w: continue          # skip empty lines
-        s = s.rstrip()
-        if s[0] == '#': continue    # skip comments
-        while s[-1] == '\\':
-            s2 = f.readline().strip()
-            lineno = lineno + 1
-            s = s[:-1] + s2
-        feeder(lineno, s, fn, statements)
+    if statements is None:
+        statements = ast.StatementGroup()
+        log = bb.parse.statements.capture()
+        try:
+            lineno = 0
+            while True:
+                lineno = lineno + 1
+                s = f.readline()
+                if not s: break
+                w = s.strip()
+                if not w: continue          # skip empty lines
+                s = s.rstrip()
+                if s[0] == '#': continue    # skip comments
+                while s[-1] == '\\':
+                    s2 = f.readline().strip()
+                    lineno = lineno + 1
+                    s = s[:-1] + s2
+                feeder(lineno, s, fn, statements)
+        finally:
+            log.close()
+        bb.parse.statements.add(abs_fn, stamp, statements, log)
 
     # DONE WITH PARSING... time to evaluate
     data.setVar('FILE', abs_fn)
@@ -25,6 +25,7 @@ import collections
 import logging
 import os.path
 import sys
+import threading
 import warnings
 from bb.compat import total_ordering
 from collections import Mapping
@@ -37,26 +38,52 @@ except ImportError:
 sqlversion = sqlite3.sqlite_version_info
 if sqlversion[0] < 3 or (sqlversion[0] == 3 and sqlversion[1] < 3):
     raise Exception("sqlite3 version 3.3.0 or later is required.")
+has_wal = sqlversion >= (3, 7, 0)
+has_data_version = sqlversion >= (3, 8, 4)
 
 
 logger = logging.getLogger("BitBake.PersistData")
-if hasattr(sqlite3, 'enable_shared_cache'):
-    try:
-        sqlite3.enable_shared_cache(True)
-    except sqlite3.OperationalError:
-        pass
 
 
 @total_ordering
 class SQLTable(collections.MutableMapping):
-    """Object representing a table/domain in the database"""
+    """
+    Object representing a table/domain in the database
+
+    The keys are indexed and values read are kept in memory for as long as
+    no other connection changes the database, if the sqlite version can
+    tell (3.8.4 or later, which has PRAGMA data_version). Writes made within a with
+    block (or by update()) are done in a single transaction.
+    """
     def __init__(self, cachefile, table):
         self.cachefile = cachefile
         self.table = table
         self.cursor = connect(self.cachefile)
-
-        self._execute("CREATE TABLE IF NOT EXISTS %s(key TEXT, value TEXT);"
-                      % table)
+        self.cache = {}
+        self.data_version = None
+        self.transactions = 0
+
+        if not (self._has_table() and self._has_key_index()):
+            with self:
+                if not self._has_table():
+                    self._execute("CREATE TABLE %s(key TEXT PRIMARY KEY NOT NULL, value TEXT);" % table)
+                elif not self._has_key_index():
+                    # Tables created by older versions have no key index,
+                    # keep the last value set for each key and add one
+                    self._execute("DELETE FROM %s WHERE rowid NOT IN (SELECT MAX(rowid) FROM %s GROUP BY key);"
+                                  % (table, table))
+                    self._execute("CREATE UNIQUE INDEX %s_key ON %s(key);" % (table, table))
+
+    def _has_table(self):
+        return self._execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;",
+                             [self.table]).fetchone() is not None
+
+    def _has_key_index(self):
+        for index in self._execute("PRAGMA index_list(%s);" % self.table).fetchall():
+            # (seq, name, unique, ...)
+            if index[2] and [row[2] for row in self._execute("PRAGMA index_info(%s);" % index[1])] == ["key"]:
+                return True
+        return False
 
     def _execute(self, *query):
         """Execute a query, waiting to acquire a lock if necessary"""
@@ -67,29 +94,56 @@ class SQLTable(collections.MutableMapping):
             except sqlite3.OperationalError as exc:
                 if 'database is locked' in str(exc) and count < 500:
                     count = count + 1
-                    self.cursor.close()
-                    self.cursor = connect(self.cachefile)
                     continue
                 raise
 
+    def _executemany(self, query, args):
+        with self:
+            return self.cursor.executemany(query, args)
+
+    def _cached(self):
+        """Return the read cache, emptied if another connection wrote to the database"""
+        if not has_data_version:
+            # The writes of other connections can't be detected, so nothing
+            # is kept and every read goes to the database
+            return {}
+        version = self._execute("PRAGMA data_version;").fetchone()[0]
+        if version != self.data_version:
+            self.cache.clear()
+            self.data_version = version
+        return self.cache
+
     def __enter__(self):
-        self.cursor.__enter__()
+        if not self.transactions:
+            self._execute("BEGIN IMMEDIATE;")
+        self.transactions += 1
         return self
 
-    def __exit__(self, *excinfo):
-        self.cursor.__exit__(*excinfo)
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.transactions -= 1
+        if self.transactions:
+            return
+        if exc_type is None:
+            self._execute("COMMIT;")
+        else:
+            self.cache.clear()
+            self._execute("ROLLBACK;")
 
     def __getitem__(self, key):
-        data = self._execute("SELECT * from %s where key=?;" %
-                             self.table, [key])
-        for row in data:
-            return row[1]
-        raise KeyError(key)
+        cache = self._cached()
+        if key in cache:
+            return cache[key]
+        row = self._execute("SELECT value FROM %s WHERE key=?;" %
+                            self.table, [key]).fetchone()
+        if row is None:
+            raise KeyError(key)
+        cache[key] = row[0]
+        return row[0]
 
     def __delitem__(self, key):
-        if key not in self:
+        self._cached().pop(key, None)
+        if not self._execute("DELETE FROM %s WHERE key=?;" % self.table, [key]).rowcount:
             raise KeyError(key)
-        self._execute("DELETE from %s where key=?;" % self.table, [key])
 
     def __setitem__(self, key, value):
         if not isinstance(key, basestring):
@@ -97,18 +151,30 @@ class SQLTable(collections.MutableMapping):
         elif not isinstance(value, basestring):
             raise TypeError('Only string values are supported')
 
-        data = self._execute("SELECT * from %s where key=?;" %
-                                   self.table, [key])
-        exists = len(list(data))
-        if exists:
-            self._execute("UPDATE %s SET value=? WHERE key=?;" % self.table,
-                          [value, key])
-        else:
-            self._execute("INSERT into %s(key, value) values (?, ?);" %
-                          self.table, [key, value])
+        cache = self._cached()
+        self._execute("INSERT OR REPLACE INTO %s(key, value) VALUES (?, ?);" %
+                      self.table, [key, value])
+        cache[key] = value
+
+    def update(self, *args, **kwargs):
+        """Set several keys at once, in a single transaction"""
+        items = dict(*args, **kwargs)
+        for key, value in items.iteritems():
+            if not isinstance(key, basestring):
+                raise TypeError('Only string keys are supported')
+            elif not isinstance(value, basestring):
+                raise TypeError('Only string values are supported')
+
+        cache = self._cached()
+        self._executemany("INSERT OR REPLACE INTO %s(key, value) VALUES (?, ?);" %
+                          self.table, items.iteritems())
+        cache.update(items)
 
     def __contains__(self, key):
-        return key in set(self)
+        if key in self._cached():
+            return True
+        return self._execute("SELECT 1 FROM %s WHERE key=?;" % self.table,
+                             [key]).fetchone() is not None
 
     def __len__(self):
         data = self._execute("SELECT COUNT(key) FROM %s;" % self.table)
@@ -117,7 +183,7 @@ class SQLTable(collections.MutableMapping):
 
     def __iter__(self):
         data = self._execute("SELECT key FROM %s;" % self.table)
-        return (row[0] for row in data)
+        return (row[0] for row in data.fetchall())
 
     def __lt__(self, other):
         if not isinstance(other, Mapping):
@@ -130,15 +196,16 @@ class SQLTable(collections.MutableMapping):
 
     def itervalues(self):
         data = self._execute("SELECT value FROM %s;" % self.table)
-        return (row[0] for row in data)
+        return (row[0] for row in data.fetchall())
 
     def items(self):
         return list(self.iteritems())
 
     def iteritems(self):
-        return self._execute("SELECT * FROM %s;" % self.table)
+        return iter(self._execute("SELECT key, value FROM %s;" % self.table).fetchall())
 
     def clear(self):
+        self.cache.clear()
         self._execute("DELETE FROM %s;" % self.table)
 
     def has_key(self, key):
@@ -194,10 +261,26 @@ class PersistData(object):
         del self.data[domain][key]
 
 def connect(database):
-    return sqlite3.connect(database, timeout=5, isolation_level=None)
+    connection = sqlite3.connect(database, timeout=5, isolation_level=None)
+    if has_wal:
+        # Readers and the writer don't block each other in WAL mode. The
+        # mode is kept in the database file, so this only has an effect once.
+        try:
+            connection.execute("PRAGMA journal_mode=WAL;")
+        except sqlite3.OperationalError:
+            pass
+    return connection
+
+# SQLTable objects returned by persist(), by database, domain, process and
+# thread
+_tables = {}
 
 def persist(domain, d):
-    """Convenience factory for SQLTable objects based upon metadata"""
+    """
+    Convenience factory for SQLTable objects based upon metadata. The
+    object of a domain is reused by later calls from the same thread, as
+    long as the database file isn't replaced.
+    """
     import bb.utils
     cachedir = (d.getVar("PERSISTENT_DIR", True) or
                 d.getVar("CACHE", True))
@@ -205,6 +288,19 @@ def persist(domain, d):
         logger.critical("Please set the 'PERSISTENT_DIR' or 'CACHE' variable")
         sys.exit(1)
 
-    bb.utils.mkdirhier(cachedir)
     cachefile = os.path.join(cachedir, "bb_persist_data.sqlite3")
-    return SQLTable(cachefile, domain)
+    # Connections can't be shared with forked processes or other threads
+    key = (cachefile, domain, os.getpid(), threading.current_thread().ident)
+    table = _tables.get(key)
+    try:
+        st = os.stat(cachefile)
+        ident = (st.st_dev, st.st_ino)
+    except OSError:
+        ident = None
+    if table is None or table.ident != ident:
+        bb.utils.mkdirhier(cachedir)
+        table = SQLTable(cachefile, domain)
+        st = os.stat(cachefile)
+        table.ident = (st.st_dev, st.st_ino)
+        _tables[key] = table
+    return table
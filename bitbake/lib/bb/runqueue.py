@@ -25,10 +25,15 @@ Handles preparation and execution of a queue of tasks
 import copy
 import os
 import sys
+import errno
+import select
 import signal
 import stat
 import fcntl
+import heapq
 import logging
+import struct
+import time
 import bb
 from bb import msg, data, event
 from bb import monitordisk
@@ -36,6 +41,12 @@ from bb import monitordisk
 bblogger = logging.getLogger("BitBake")
 logger = logging.getLogger("BitBake.RunQueue")
 
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+    logger.info('Importing cPickle failed.  Falling back to a very slow implementation.')
+
 class RunQueueStats:
     """
     Holds statistics on the tasks handled by the associated runQueue
@@ -67,6 +78,95 @@ class RunQueueStats:
     def taskActive(self):
         self.active = self.active + 1
 
+class RunQueueResources(object):
+    """
+    Admission control for tasks based on the resources they declare using
+    the cpu, mem (in MB) and io task flags, e.g. do_compile[cpu] = "4".
+    Tasks without a cpu flag count as using one cpu, missing mem and io
+    flags count as zero. A task is only started if its usage fits within
+    the BB_RESOURCE_CPU, BB_RESOURCE_MEM and BB_RESOURCE_IO budgets, budgets
+    which aren't set are not enforced. A task which declares more than a
+    whole budget is counted as using all of it so it can still run on its
+    own.
+    """
+    resources = ("cpu", "mem", "io")
+    defaults = { "cpu" : 1.0, "mem" : 0.0, "io" : 0.0 }
+
+    def __init__(self, dataCache, limits):
+        self.dataCache = dataCache
+        self.limits = limits
+        self.active = {}
+        self.totals = dict((resource, 0.0) for resource in self.resources)
+
+    @classmethod
+    def from_config(cls, dataCache, cfgData):
+        limits = {}
+        for resource in cls.resources:
+            limit = cfgData.getVar("BB_RESOURCE_%s" % resource.upper(), True)
+            if limit:
+                limits[resource] = float(limit)
+        return cls(dataCache, limits)
+
+    def usage(self, fn, taskname):
+        """
+        Return the resources the given task declares it uses, capped at
+        the budgets
+        """
+        usage = {}
+        taskdep = self.dataCache.task_deps[fn]
+        for resource in self.resources:
+            usage[resource] = self.defaults[resource]
+            if resource in taskdep and taskname in taskdep[resource]:
+                try:
+                    usage[resource] = float(taskdep[resource][taskname])
+                except ValueError:
+                    logger.warn("Invalid %s[%s] value '%s' in %s", taskname, resource, taskdep[resource][taskname], fn)
+            if resource in self.limits:
+                usage[resource] = min(usage[resource], self.limits[resource])
+        return usage
+
+    def used(self, resource):
+        return self.totals[resource]
+
+    def fits(self, usage, reserved = None):
+        """
+        Return True if usage fits within the budgets alongside the running
+        tasks and, if given, the usage reserved for a blocked task
+        """
+        for resource, limit in self.limits.iteritems():
+            needed = self.totals[resource] + usage[resource]
+            if reserved:
+                needed += reserved[resource]
+            if needed > limit:
+                return False
+        return True
+
+    def acquire(self, task, usage):
+        self.release(task)
+        self.active[task] = usage
+        for resource in self.resources:
+            self.totals[resource] += usage[resource]
+
+    def release(self, task):
+        usage = self.active.pop(task, None)
+        if usage is None:
+            return
+        for resource in self.resources:
+            if self.active:
+                self.totals[resource] -= usage[resource]
+            else:
+                # Avoid accumulating rounding errors over a long build
+                self.totals[resource] = 0.0
+
+    def occupancy(self):
+        """
+        Return a dict of resource to (amount in use, budget or None)
+        """
+        occupancy = {}
+        for resource in self.resources:
+            occupancy[resource] = (self.used(resource), self.limits.get(resource))
+        return occupancy
+
 # These values indicate the next step due to be run in the
 # runQueue state machine
 runQueuePrepare = 2
@@ -79,12 +179,30 @@ runQueueCleanUp = 8
 runQueueComplete = 9
 runQueueChildProcess = 10
 
+def exit_status(status):
+    """
+    Convert a status as returned by os.waitpid() into an exit code
+    """
+    if os.WIFEXITED(status):
+        return os.WEXITSTATUS(status)
+    elif os.WIFSIGNALED(status):
+        # Per shell conventions for $?, when a process exits due to
+        # a signal, we return an exit code of 128 + SIGNUM
+        return 128 + os.WTERMSIG(status)
+    return status
+
 class RunQueueScheduler(object):
     """
     Control the order tasks are scheduled in.
     """
     name = "basic"
 
+    # Ready queue of buildable tasks as a heap of (priority, task) where the
+    # priority is the position of the task in the priority map. It is built
+    # from prio_map the first time a task is requested so subclasses only
+    # need to set prio_map.
+    buildable = None
+
     def __init__(self, runqueue, rqdata):
         """
         The default scheduler just returns the first buildable task (the
@@ -97,21 +215,77 @@ class RunQueueScheduler(object):
         self.prio_map = []
         self.prio_map.extend(range(numTasks))
 
+    def init_buildable(self):
+        self.priority = [0] * len(self.rqdata.runq_fnid)
+        for prio, taskid in enumerate(self.prio_map):
+            self.priority[taskid] = prio
+        self.stamps = {}
+        self.usage = {}
+        self.buildable = []
+        for taskid in self.prio_map:
+            if self.rq.runq_buildable[taskid] == 1 and self.rq.runq_running[taskid] != 1:
+                self.buildable.append((self.priority[taskid], taskid))
+        heapq.heapify(self.buildable)
+
+    def newbuildable(self, taskid):
+        """
+        Called by the runqueue when all dependencies of a task have completed
+        """
+        if self.buildable is not None:
+            heapq.heappush(self.buildable, (self.priority[taskid], taskid))
+
+    def stampfile(self, taskid):
+        if taskid not in self.stamps:
+            fn = self.rqdata.taskData.fn_index[self.rqdata.runq_fnid[taskid]]
+            taskname = self.rqdata.runq_task[taskid]
+            self.stamps[taskid] = bb.build.stampfile(taskname, self.rqdata.dataCache, fn)
+        return self.stamps[taskid]
+
+    def task_usage(self, taskid):
+        if taskid not in self.usage:
+            fn = self.rqdata.taskData.fn_index[self.rqdata.runq_fnid[taskid]]
+            taskname = self.rqdata.runq_task[taskid]
+            self.usage[taskid] = self.rq.resources.usage(fn, taskname)
+        return self.usage[taskid]
+
     def next_buildable_task(self):
         """
-        Return the id of the first task we find that is buildable
+        Return the id of the highest priority buildable task which isn't
+        already running, doesn't share a stamp with a running task and
+        fits within the resource budgets left over by the highest priority
+        task they block
         """
-        for tasknum in xrange(len(self.rqdata.runq_fnid)):
-            taskid = self.prio_map[tasknum]
-            if self.rq.runq_running[taskid] == 1:
+        if self.buildable is None:
+            self.init_buildable()
+
+        skipped = []
+        taskid = None
+        reserved = None
+        while self.buildable:
+            entry = self.buildable[0]
+            # Tasks leave the queue lazily once they have been started
+            if self.rq.runq_running[entry[1]] == 1:
+                heapq.heappop(self.buildable)
                 continue
-            if self.rq.runq_buildable[taskid] == 1:
-                fn = self.rqdata.taskData.fn_index[self.rqdata.runq_fnid[taskid]]
-                taskname = self.rqdata.runq_task[taskid]
-                stamp = bb.build.stampfile(taskname, self.rqdata.dataCache, fn)
-                if stamp in self.rq.build_stamps.values():
+            if self.stampfile(entry[1]) in self.rq.build_stamps2:
+                skipped.append(heapq.heappop(self.buildable))
+                continue
+            if self.rq.resources.limits:
+                usage = self.task_usage(entry[1])
+                if not self.rq.resources.fits(usage, reserved):
+                    # Reserve the usage of the highest priority task which
+                    # doesn't fit so lower priority tasks are only started
+                    # alongside it and can't starve it
+                    if reserved is None:
+                        reserved = usage
+                    skipped.append(heapq.heappop(self.buildable))
                     continue
-                return taskid
+            taskid = entry[1]
+            break
+
+        for entry in skipped:
+            heapq.heappush(self.buildable, entry)
+        return taskid
 
     def next(self):
         """
@@ -135,16 +309,9 @@ class RunQueueSchedulerSpeed(RunQueueScheduler):
         self.rq = runqueue
         self.rqdata = rqdata
 
-        sortweight = sorted(copy.deepcopy(self.rqdata.runq_weight))
-        copyweight = copy.deepcopy(self.rqdata.runq_weight)
-        self.prio_map = []
-
-        for weight in sortweight:
-            idx = copyweight.index(weight)
-            self.prio_map.append(idx)
-            copyweight[idx] = -1
-
-        self.prio_map.reverse()
+        # Ties in weight are broken by running the higher task id first
+        weight = self.rqdata.runq_weight
+        self.prio_map = sorted(xrange(len(weight)), key=lambda taskid: (weight[taskid], taskid), reverse=True)
 
 class RunQueueSchedulerCompletion(RunQueueSchedulerSpeed):
     """
@@ -162,21 +329,122 @@ class RunQueueSchedulerCompletion(RunQueueSchedulerSpeed):
         #FIXME - whilst this groups all fnids together it does not reorder the
         #fnid groups optimally.
 
-        basemap = copy.deepcopy(self.prio_map)
-        self.prio_map = []
-        while (len(basemap) > 0):
-            entry = basemap.pop(0)
-            self.prio_map.append(entry)
+        fnid_tasks = {}
+        fnid_order = []
+        for entry in self.prio_map:
             fnid = self.rqdata.runq_fnid[entry]
-            todel = []
-            for entry in basemap:
-                entry_fnid = self.rqdata.runq_fnid[entry]
-                if entry_fnid == fnid:
-                    todel.append(basemap.index(entry))
-                    self.prio_map.append(entry)
-            todel.reverse()
-            for idx in todel:
-                del basemap[idx]
+            if fnid not in fnid_tasks:
+                fnid_tasks[fnid] = []
+                fnid_order.append(fnid)
+            fnid_tasks[fnid].append(entry)
+
+        self.prio_map = []
+        for fnid in fnid_order:
+            self.prio_map.extend(fnid_tasks[fnid])
+
+class RunQueueSchedulerCriticalPath(RunQueueSchedulerSpeed):
+    """
+    A scheduler which runs the tasks heading the longest remaining path
+    through the task graph first, using the task durations recorded by
+    earlier builds. BB_TASK_DURATIONS lists directories containing
+    buildstats output. Tasks without a recorded duration are assumed to
+    take as long as the average task of the same name, ties (including
+    everything when there is no history) are broken by the task weights
+    the speed scheduler uses.
+    """
+    name = "criticalpath"
+
+    def __init__(self, runqueue, rqdata):
+        self.rq = runqueue
+        self.rqdata = rqdata
+
+        expected = expected_task_durations(self.rqdata, self.task_durations())
+        numTasks = len(expected)
+
+        # Longest path from each task to the end of the build, walking
+        # the graph back from the endpoints
+        self.runq_path = list(expected)
+        revdeps_left = [len(self.rqdata.runq_revdeps[taskid]) for taskid in xrange(numTasks)]
+        ready = [taskid for taskid in xrange(numTasks) if revdeps_left[taskid] == 0]
+        while ready:
+            taskid = ready.pop()
+            for dep in self.rqdata.runq_depends[taskid]:
+                path = expected[dep] + self.runq_path[taskid]
+                if path > self.runq_path[dep]:
+                    self.runq_path[dep] = path
+                revdeps_left[dep] = revdeps_left[dep] - 1
+                if revdeps_left[dep] == 0:
+                    ready.append(dep)
+
+        weight = self.rqdata.runq_weight
+        self.prio_map = sorted(xrange(numTasks), key=lambda taskid: (self.runq_path[taskid], weight[taskid], taskid), reverse=True)
+
+    def task_durations(self):
+        """
+        Return a dict of (pn, taskname) to duration in seconds
+        """
+        dirs = (self.rq.cfgData.getVar("BB_TASK_DURATIONS", True) or "").split()
+        return read_buildstats(dirs)
+
+def expected_task_durations(rqdata, durations):
+    """
+    Return a list of the expected duration of each task in rqdata given the
+    recorded (pn, taskname) durations
+    """
+    pertask = {}
+    for (pn, taskname), elapsed in durations.iteritems():
+        pertask.setdefault(taskname, []).append(elapsed)
+    for taskname in pertask:
+        pertask[taskname] = sum(pertask[taskname]) / len(pertask[taskname])
+
+    expected = []
+    known = 0
+    for taskid in xrange(len(rqdata.runq_fnid)):
+        fn = rqdata.taskData.fn_index[rqdata.runq_fnid[taskid]]
+        pn = rqdata.dataCache.pkg_fn[fn]
+        taskname = rqdata.runq_task[taskid]
+        if (pn, taskname) in durations:
+            known = known + 1
+            expected.append(durations[(pn, taskname)])
+        else:
+            expected.append(pertask.get(taskname, 0.0))
+    logger.debug(1, "Recorded durations known for %s of %s tasks", known, len(expected))
+    return expected
+
+def read_buildstats(dirs):
+    """
+    Read the task durations from buildstats output below the given
+    directories. Each task file contains a line of the form
+    "<PF>: <task>: Elapsed time: <seconds> seconds". Returns a dict of
+    (pn, taskname) to the mean duration over all the builds found.
+    """
+    found = {}
+    for topdir in dirs:
+        for root, _, files in os.walk(topdir):
+            for name in files:
+                try:
+                    f = open(os.path.join(root, name))
+                except IOError:
+                    continue
+                for line in f:
+                    if ": Elapsed time: " not in line:
+                        continue
+                    fields = line.split(": ")
+                    if len(fields) < 4:
+                        continue
+                    # PF is ${PN}-${PV}-${PR}
+                    pn = fields[0].rsplit("-", 2)[0]
+                    try:
+                        elapsed = float(fields[3].split()[0])
+                    except ValueError:
+                        continue
+                    found.setdefault((pn, fields[1]), []).append(elapsed)
+                f.close()
+
+    durations = {}
+    for key, elapsed in found.iteritems():
+        durations[key] = sum(elapsed) / len(elapsed)
+    return durations
 
 class RunQueueData:
     """
@@ -722,33 +990,43 @@ class RunQueueData:
                 for st in self.cooker.configuration.invalidate_stamp.split(','):
                     invalidate_task(fn, "do_%s" % st, True)
 
-        # Interate over the task list and call into the siggen code
-        dealtwith = set()
-        todeal = set(range(len(self.runq_fnid)))
-        while len(todeal) > 0:
-            for task in todeal.copy():
-                if len(self.runq_depends[task] - dealtwith) == 0:
-                    dealtwith.add(task)
-                    todeal.remove(task)
-                    procdep = []
-                    for dep in self.runq_depends[task]:
-                        procdep.append(self.taskData.fn_index[self.runq_fnid[dep]] + "." + self.runq_task[dep])
-                    self.runq_hash[task] = bb.parse.siggen.get_taskhash(self.taskData.fn_index[self.runq_fnid[task]], self.runq_task[task], procdep, self.dataCache)
+        self.compute_task_hashes()
+        bb.fetch2.fetcher_checksums_save(self.cooker.configuration.data)
+
+        return len(self.runq_fnid)
+
+    def compute_task_hashes(self):
+        """
+        Call into the siggen code to compute the hash of each task. The
+        tasks are handled in a single topological pass (Kahn's algorithm):
+        a task is queued as soon as the last of its dependencies has its
+        hash computed.
+        """
+        start = time.time()
+        numtasks = len(self.runq_fnid)
+        identifiers = []
+        for task in xrange(numtasks):
+            identifiers.append('%s.%s' % (self.taskData.fn_index[self.runq_fnid[task]],
+                                          self.runq_task[task]))
 
         self.hashes = {}
         self.hash_deps = {}
-        for task in xrange(len(self.runq_fnid)):
-            identifier = '%s.%s' % (self.taskData.fn_index[self.runq_fnid[task]],
-                                    self.runq_task[task])
-            self.hashes[identifier] = self.runq_hash[task]
-            deps = []
-            for dep in self.runq_depends[task]:
-                depidentifier = '%s.%s' % (self.taskData.fn_index[self.runq_fnid[dep]],
-                                           self.runq_task[dep])
-                deps.append(depidentifier)
-            self.hash_deps[identifier] = deps
-
-        return len(self.runq_fnid)
+        pending = [len(self.runq_depends[task]) for task in xrange(numtasks)]
+        ready = [task for task in xrange(numtasks) if pending[task] == 0]
+        for task in ready:
+            deps = [identifiers[dep] for dep in self.runq_depends[task]]
+            self.runq_hash[task] = bb.parse.siggen.get_taskhash(self.taskData.fn_index[self.runq_fnid[task]], self.runq_task[task], deps, self.dataCache)
+            self.hashes[identifiers[task]] = self.runq_hash[task]
+            self.hash_deps[identifiers[task]] = deps
+            for revdep in self.runq_revdeps[task]:
+                pending[revdep] -= 1
+                if pending[revdep] == 0:
+                    ready.append(revdep)
+
+        if len(ready) != numtasks:
+            bb.msg.fatal("RunQueue", "Unable to compute the hashes of %s tasks due to circular dependencies" % (numtasks - len(ready)))
+
+        logger.verbose("Computed %s task hashes in %.2fs", numtasks, time.time() - start)
 
     def dump_data(self, taskQueue):
         """
@@ -784,6 +1062,9 @@ class RunQueue:
         self.stamppolicy = cfgData.getVar("BB_STAMP_POLICY", True) or "perfile"
         self.hashvalidate = cfgData.getVar("BB_HASHCHECK_FUNCTION", True) or None
         self.setsceneverify = cfgData.getVar("BB_SETSCENE_VERIFY_FUNCTION", True) or None
+        self.use_workerpool = cfgData.getVar("BB_WORKER_POOL", True) == "1"
+        self.workerpool = None
+        self.wakeup = None
 
         self.state = runQueuePrepare
 
@@ -897,8 +1178,15 @@ class RunQueue:
 
         if self.state is runQueueCleanUp:
            self.rqexe.finish()
+           retval = True
 
         if self.state is runQueueComplete or self.state is runQueueFailed:
+            if self.workerpool:
+                self.workerpool.shutdown()
+                self.workerpool = None
+            if self.wakeup:
+                self.wakeup.close()
+                self.wakeup = None
             if self.rqexe.stats.failed:
                 logger.info("Tasks Summary: Attempted %d tasks of which %d didn't need to be rerun and %d failed.", self.rqexe.stats.completed + self.rqexe.stats.failed, self.rqexe.stats.skipped, self.rqexe.stats.failed)
             else:
@@ -964,34 +1252,57 @@ class RunQueueExecute:
         self.build_pids = {}
         self.build_pipes = {}
         self.build_stamps = {}
+        self.build_stamps2 = set()
         self.failed_fnids = []
 
         self.stampcache = {}
+        self.resources = RunQueueResources.from_config(self.rqdata.dataCache, self.cfgData)
+
+        if self.rq.wakeup is None:
+            self.rq.wakeup = runQueueWakeup()
+
+    def wait_for_tasks(self, timeout):
+        """
+        Sleep until a task process exits, one of the task pipes has data
+        waiting or the timeout expires, whichever comes first.
+        """
+        fds = [pipe.input for pipe in self.build_pipes.itervalues()]
+        if self.rq.workerpool:
+            fds.extend(self.rq.workerpool.result_fds())
+        self.rq.wakeup.wait(fds, timeout)
 
     def runqueue_process_waitpid(self):
         """
         Return none is there are no processes awaiting result collection, otherwise
         collect the process exit codes and close the information pipe.
         """
-        pid, status = os.waitpid(-1, os.WNOHANG)
-        if pid == 0 or os.WIFSTOPPED(status):
-            return None
+        result = None
+        if self.rq.workerpool:
+            result = self.rq.workerpool.collect()
 
-        if os.WIFEXITED(status):
-            status = os.WEXITSTATUS(status)
-        elif os.WIFSIGNALED(status):
-            # Per shell conventions for $?, when a process exits due to
-            # a signal, we return an exit code of 128 + SIGNUM
-            status = 128 + os.WTERMSIG(status)
+        if result is not None:
+            pid, status = result
+        else:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0 or os.WIFSTOPPED(status):
+                return None
+            status = exit_status(status)
+
+            if self.rq.workerpool and self.rq.workerpool.worker_exited(pid):
+                if pid not in self.build_pids:
+                    # An idle worker went away, there is no task to fail
+                    return True
 
         task = self.build_pids[pid]
         del self.build_pids[pid]
+        self.resources.release(task)
 
         self.build_pipes[pid].close()
         del self.build_pipes[pid]
 
         # self.build_stamps[pid] may not exist when use shared work directory.
         if pid in self.build_stamps:
+            self.build_stamps2.discard(self.build_stamps[pid])
             del self.build_stamps[pid]
 
         if status != 0:
@@ -1003,12 +1314,20 @@ class RunQueueExecute:
     def finish_now(self):
         if self.stats.active:
             logger.info("Sending SIGTERM to remaining %s tasks", self.stats.active)
-            for k, v in self.build_pids.iteritems():
-                try:
-                    os.kill(-k, signal.SIGTERM)
-                    os.waitpid(-1, 0)
-                except:
-                    pass
+            if self.rq.workerpool:
+                # Terminating the pool closes the pipes of its workers, so
+                # read what is left in them first
+                for pipe in self.build_pipes:
+                    self.build_pipes[pipe].read()
+                self.rq.workerpool.terminate()
+                self.build_pipes = {}
+            else:
+                for k, v in self.build_pids.iteritems():
+                    try:
+                        os.kill(-k, signal.SIGTERM)
+                        os.waitpid(-1, 0)
+                    except:
+                        pass
         for pipe in self.build_pipes:
             self.build_pipes[pipe].read()
 
@@ -1027,7 +1346,8 @@ class RunQueueExecute:
 
         if self.stats.active > 0:
             bb.event.fire(runQueueExitWait(self.stats.active), self.cfgData)
-            self.runqueue_process_waitpid()
+            if self.runqueue_process_waitpid() is None:
+                self.wait_for_tasks(0.5)
             return
 
         if len(self.failed_fnids) != 0:
@@ -1037,11 +1357,12 @@ class RunQueueExecute:
         self.rq.state = runQueueComplete
         return
 
-    def fork_off_task(self, fn, task, taskname, quieterrors=False):
-        # We need to setup the environment BEFORE the fork, since
-        # a fork() or exec*() activates PSEUDO...
-
-        envbackup = {}
+    def task_environment(self, fn, taskname):
+        """
+        Work out the umask and the fakeroot environment variables a task
+        needs. These have to be set up BEFORE the task process is forked
+        since a fork() or exec*() activates PSEUDO...
+        """
         fakeenv = {}
         umask = None
 
@@ -1056,8 +1377,6 @@ class RunQueueExecute:
         if 'fakeroot' in taskdep and taskname in taskdep['fakeroot']:
             envvars = (self.rqdata.dataCache.fakerootenv[fn] or "").split()
             for key, value in (var.split('=') for var in envvars):
-                envbackup[key] = os.environ.get(key)
-                os.environ[key] = value
                 fakeenv[key] = value
 
             fakedirs = (self.rqdata.dataCache.fakerootdirs[fn] or "").split()
@@ -1069,10 +1388,32 @@ class RunQueueExecute:
         else:
             envvars = (self.rqdata.dataCache.fakerootnoenv[fn] or "").split()
             for key, value in (var.split('=') for var in envvars):
-                envbackup[key] = os.environ.get(key)
-                os.environ[key] = value
                 fakeenv[key] = value
 
+        return umask, fakeenv
+
+    def start_task(self, fn, task, taskname, quieterrors=False):
+        """
+        Start a task, either in a freshly forked process or by handing it
+        to the task worker pool. Returns the pid to track it by and the
+        runQueuePipe its events arrive on.
+        """
+        if self.rq.workerpool is None and self.rq.use_workerpool:
+            self.rq.workerpool = RunQueueWorkerPool(self.rq, self.number_tasks)
+
+        umask, fakeenv = self.task_environment(fn, taskname)
+        if self.rq.workerpool:
+            return self.rq.workerpool.run_task(self, fn, task, taskname, umask, fakeenv, quieterrors)
+
+        pid, pipein, pipeout = self.fork_off_task(fn, task, taskname, umask, fakeenv, quieterrors)
+        return pid, runQueuePipe(pipein, pipeout, self.cfgData)
+
+    def fork_off_task(self, fn, task, taskname, umask, fakeenv, quieterrors=False):
+        envbackup = {}
+        for key, value in fakeenv.iteritems():
+            envbackup[key] = os.environ.get(key)
+            os.environ[key] = value
+
         sys.stdout.flush()
         sys.stderr.flush()
         try:
@@ -1092,6 +1433,7 @@ class RunQueueExecute:
             bb.event.worker_pipe = pipeout
 
             self.rq.state = runQueueChildProcess
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
             # Make the child the process group leader
             os.setpgid(0, 0)
             # No stdin
@@ -1103,38 +1445,13 @@ class RunQueueExecute:
 
             self.cooker.configuration.data.setVar("BB_WORKERCONTEXT", "1")
             bb.parse.siggen.set_taskdata(self.rqdata.hashes, self.rqdata.hash_deps)
-            ret = 0
             try:
                 the_data = bb.cache.Cache.loadDataFull(fn, self.cooker.get_file_appends(fn), self.cooker.configuration.data)
-                the_data.setVar('BB_TASKHASH', self.rqdata.runq_hash[task])
-                for h in self.rqdata.hashes:
-                    the_data.setVar("BBHASH_%s" % h, self.rqdata.hashes[h])
-                for h in self.rqdata.hash_deps:
-                    the_data.setVar("BBHASHDEPS_%s" % h, self.rqdata.hash_deps[h])
-
-                # exported_vars() returns a generator which *cannot* be passed to os.environ.update() 
-                # successfully. We also need to unset anything from the environment which shouldn't be there 
-                exports = bb.data.exported_vars(the_data)
-                bb.utils.empty_environment()
-                for e, v in exports:
-                    os.environ[e] = v
-                for e in fakeenv:
-                    os.environ[e] = fakeenv[e]
-                    the_data.setVar(e, fakeenv[e])
-
-                if quieterrors:
-                    the_data.setVarFlag(taskname, "quieterrors", "1")
-
             except Exception as exc:
                 if not quieterrors:
                     logger.critical(str(exc))
                 os._exit(1)
-            try:
-                if not self.cooker.configuration.dry_run:
-                    ret = bb.build.exec_task(fn, taskname, the_data)
-                os._exit(ret)
-            except:
-                os._exit(1)
+            self.exec_task_child(fn, task, taskname, the_data, fakeenv, quieterrors)
         else:
             for key, value in envbackup.iteritems():
                 if value is None:
@@ -1144,6 +1461,43 @@ class RunQueueExecute:
 
         return pid, pipein, pipeout
 
+    def exec_task_child(self, fn, task, taskname, the_data, fakeenv, quieterrors):
+        """
+        Finish setting up the datastore and environment within a forked
+        task process and execute the task. Never returns.
+        """
+        ret = 0
+        try:
+            the_data.setVar('BB_TASKHASH', self.rqdata.runq_hash[task])
+            for h in self.rqdata.hashes:
+                the_data.setVar("BBHASH_%s" % h, self.rqdata.hashes[h])
+            for h in self.rqdata.hash_deps:
+                the_data.setVar("BBHASHDEPS_%s" % h, self.rqdata.hash_deps[h])
+
+            # exported_vars() returns a generator which *cannot* be passed to os.environ.update() 
+            # successfully. We also need to unset anything from the environment which shouldn't be there 
+            exports = bb.data.exported_vars(the_data)
+            bb.utils.empty_environment()
+            for e, v in exports:
+                os.environ[e] = v
+            for e in fakeenv:
+                os.environ[e] = fakeenv[e]
+                the_data.setVar(e, fakeenv[e])
+
+            if quieterrors:
+                the_data.setVarFlag(taskname, "quieterrors", "1")
+
+        except Exception as exc:
+            if not quieterrors:
+                logger.critical(str(exc))
+            os._exit(1)
+        try:
+            if not self.cooker.configuration.dry_run:
+                ret = bb.build.exec_task(fn, taskname, the_data)
+            os._exit(ret)
+        except:
+            os._exit(1)
+
 class RunQueueExecuteDummy(RunQueueExecute):
     def __init__(self, rq):
         self.rq = rq
@@ -1261,6 +1615,7 @@ class RunQueueExecuteTasks(RunQueueExecute):
                     alldeps = 0
             if alldeps == 1:
                 self.runq_buildable[revdep] = 1
+                self.sched.newbuildable(revdep)
                 fn = self.rqdata.taskData.fn_index[self.rqdata.runq_fnid[revdep]]
                 taskname = self.rqdata.runq_task[revdep]
                 logger.debug(1, "Marking task %s (%s, %s) as buildable", revdep, fn, taskname)
@@ -1318,7 +1673,7 @@ class RunQueueExecuteTasks(RunQueueExecute):
             taskdep = self.rqdata.dataCache.task_deps[fn]
             if 'noexec' in taskdep and taskname in taskdep['noexec']:
                 startevent = runQueueTaskStarted(task, self.stats, self.rq,
-                                                 noexec=True)
+                                                 noexec=True, resources=self.resources.occupancy())
                 bb.event.fire(startevent, self.cfgData)
                 self.runq_running[task] = 1
                 self.stats.taskActive()
@@ -1326,14 +1681,17 @@ class RunQueueExecuteTasks(RunQueueExecute):
                 self.task_complete(task)
                 return True
             else:
-                startevent = runQueueTaskStarted(task, self.stats, self.rq)
+                self.resources.acquire(task, self.resources.usage(fn, taskname))
+                startevent = runQueueTaskStarted(task, self.stats, self.rq,
+                                                 resources=self.resources.occupancy())
                 bb.event.fire(startevent, self.cfgData)
 
-            pid, pipein, pipeout = self.fork_off_task(fn, task, taskname)
+            pid, pipe = self.start_task(fn, task, taskname)
 
             self.build_pids[pid] = task
-            self.build_pipes[pid] = runQueuePipe(pipein, pipeout, self.cfgData)
+            self.build_pipes[pid] = pipe
             self.build_stamps[pid] = bb.build.stampfile(taskname, self.rqdata.dataCache, fn)
+            self.build_stamps2.add(self.build_stamps[pid])
             self.runq_running[task] = 1
             self.stats.taskActive()
             if self.stats.active < self.number_tasks:
@@ -1344,7 +1702,7 @@ class RunQueueExecuteTasks(RunQueueExecute):
 
         if self.stats.active > 0:
             if self.runqueue_process_waitpid() is None:
-                return 0.5
+                self.wait_for_tasks(0.5)
             return True
 
         if len(self.failed_fnids) != 0:
@@ -1479,7 +1837,7 @@ class RunQueueExecuteScenequeue(RunQueueExecute):
             sq_fn = []
             sq_taskname = []
             sq_task = []
-            noexec = []
+            noexec = set()
             stamppresent = []
             for task in xrange(len(self.sq_revdeps)):
                 realtask = self.rqdata.runq_setscene[task]
@@ -1488,7 +1846,7 @@ class RunQueueExecuteScenequeue(RunQueueExecute):
                 taskdep = self.rqdata.dataCache.task_deps[fn]
 
                 if 'noexec' in taskdep and taskname in taskdep['noexec']:
-                    noexec.append(task)
+                    noexec.add(task)
                     self.task_skip(task)
                     bb.build.make_stamp(taskname + "_setscene", self.rqdata.dataCache, fn)
                     continue
@@ -1508,9 +1866,9 @@ class RunQueueExecuteScenequeue(RunQueueExecute):
             locs = { "sq_fn" : sq_fn, "sq_task" : sq_taskname, "sq_hash" : sq_hash, "sq_hashfn" : sq_hashfn, "d" : self.cooker.configuration.data }
             valid = bb.utils.better_eval(call, locs)
 
-            valid_new = stamppresent
+            valid_new = set(stamppresent)
             for v in valid:
-                valid_new.append(sq_task[v])
+                valid_new.add(sq_task[v])
 
             for task in xrange(len(self.sq_revdeps)):
                 if task not in valid_new and task not in noexec:
@@ -1577,8 +1935,15 @@ class RunQueueExecuteScenequeue(RunQueueExecute):
         task = None
         if self.stats.active < self.number_tasks:
             # Find the next setscene to run
+            reserved = None
             for nexttask in xrange(self.stats.total):
                 if self.runq_buildable[nexttask] == 1 and self.runq_running[nexttask] != 1:
+                    if self.resources.limits:
+                        usage = self.task_usage(nexttask)
+                        if not self.resources.fits(usage, reserved):
+                            if reserved is None:
+                                reserved = usage
+                            continue
                     task = nexttask
                     break
         if task is not None:
@@ -1604,13 +1969,15 @@ class RunQueueExecuteScenequeue(RunQueueExecute):
                 self.task_skip(task)
                 return True
 
-            startevent = sceneQueueTaskStarted(task, self.stats, self.rq)
+            self.resources.acquire(task, self.task_usage(task))
+            startevent = sceneQueueTaskStarted(task, self.stats, self.rq,
+                                               resources=self.resources.occupancy())
             bb.event.fire(startevent, self.cfgData)
 
-            pid, pipein, pipeout = self.fork_off_task(fn, realtask, taskname)
+            pid, pipe = self.start_task(fn, realtask, taskname)
 
             self.build_pids[pid] = task
-            self.build_pipes[pid] = runQueuePipe(pipein, pipeout, self.cfgData)
+            self.build_pipes[pid] = pipe
             self.runq_running[task] = 1
             self.stats.taskActive()
             if self.stats.active < self.number_tasks:
@@ -1621,7 +1988,7 @@ class RunQueueExecuteScenequeue(RunQueueExecute):
 
         if self.stats.active > 0:
             if self.runqueue_process_waitpid() is None:
-                return 0.5
+                self.wait_for_tasks(0.5)
             return True
 
         # Convert scenequeue_covered task numbers into full taskgraph ids
@@ -1635,8 +2002,16 @@ class RunQueueExecuteScenequeue(RunQueueExecute):
         self.rq.state = runQueueRunInit
         return True
 
-    def fork_off_task(self, fn, task, taskname):
-        return RunQueueExecute.fork_off_task(self, fn, task, taskname, quieterrors=True)
+    def task_usage(self, task):
+        """
+        Resource usage of a setscene task, as declared by the real task
+        """
+        realtask = self.rqdata.runq_setscene[task]
+        fn = self.rqdata.taskData.fn_index[self.rqdata.runq_fnid[realtask]]
+        return self.resources.usage(fn, self.rqdata.runq_task[realtask])
+
+    def start_task(self, fn, task, taskname):
+        return RunQueueExecute.start_task(self, fn, task, taskname, quieterrors=True)
 
 class TaskFailure(Exception):
     """
@@ -1677,19 +2052,22 @@ class sceneQueueEvent(runQueueEvent):
 
 class runQueueTaskStarted(runQueueEvent):
     """
-    Event notifing a task was started
+    Event notifing a task was started, resources is a dict of the resource
+    occupancy after starting it (see RunQueueResources.occupancy())
     """
-    def __init__(self, task, stats, rq, noexec=False):
+    def __init__(self, task, stats, rq, noexec=False, resources=None):
         runQueueEvent.__init__(self, task, stats, rq)
         self.noexec = noexec
+        self.resources = resources
 
 class sceneQueueTaskStarted(sceneQueueEvent):
     """
     Event notifing a setscene task was started
     """
-    def __init__(self, task, stats, rq, noexec=False):
+    def __init__(self, task, stats, rq, noexec=False, resources=None):
         sceneQueueEvent.__init__(self, task, stats, rq)
         self.noexec = noexec
+        self.resources = resources
 
 class runQueueTaskFailed(runQueueEvent):
     """
@@ -1712,6 +2090,48 @@ class runQueueTaskCompleted(runQueueEvent):
     Event notifing a task completed
     """
 
+class runQueueWakeup(object):
+    """
+    A self-pipe which becomes readable whenever a child process exits so the
+    runqueue can sleep in select() until there is something to do rather
+    than polling waitpid() every half second. The interpreter writes to it
+    as soon as the signal arrives (signal.set_wakeup_fd()), a Python
+    handler would only run once select() returns.
+    """
+    def __init__(self):
+        self.readfd, self.writefd = os.pipe()
+        bb.utils.nonblockingfd(self.readfd)
+        bb.utils.nonblockingfd(self.writefd)
+        self.oldhandler = signal.signal(signal.SIGCHLD, self.sigchld)
+        # Don't let the signal interrupt system calls elsewhere in the server
+        signal.siginterrupt(signal.SIGCHLD, False)
+        self.oldwakeupfd = signal.set_wakeup_fd(self.writefd)
+
+    def sigchld(self, signum, frame):
+        # The handler only needs to exist for the signal to be delivered,
+        # the wakeup fd has already been written to
+        pass
+
+    def wait(self, fds, timeout):
+        try:
+            ready = select.select([self.readfd] + fds, [], [], timeout)[0]
+        except select.error as exc:
+            if exc.args[0] != errno.EINTR:
+                raise
+            return
+        if self.readfd in ready:
+            try:
+                while os.read(self.readfd, 4096):
+                    continue
+            except OSError:
+                pass
+
+    def close(self):
+        signal.set_wakeup_fd(self.oldwakeupfd)
+        signal.signal(signal.SIGCHLD, self.oldhandler or signal.SIG_DFL)
+        os.close(self.readfd)
+        os.close(self.writefd)
+
 class runQueuePipe():
     """
     Abstraction for a pipe between a worker thread and the server
@@ -1743,3 +2163,334 @@ class runQueuePipe():
         if len(self.queue) > 0:
             print("Warning, worker left partial message: %s" % self.queue)
         self.input.close()
+
+class runQueueWorkerPipe(runQueuePipe):
+    """
+    The event pipe of a task worker. It outlives the individual tasks so
+    finishing a task only drains it.
+    """
+    def close(self):
+        while self.read():
+            continue
+
+    def shutdown(self):
+        runQueuePipe.close(self)
+
+class RunQueueWorker(object):
+    """
+    A long lived process which executes the tasks handed to it by the
+    runqueue. It keeps the finalised datastores of the recipes it most
+    recently ran tasks for so consecutive tasks of the same recipe do not
+    need to reparse it. Each task is still run in its own forked process
+    so the cached datastore is never modified by a task.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+        self.pid = None
+        self.task = None
+        # Server side mirror of the worker's datastore cache keys, updated
+        # once the worker reports it parsed the recipe of a task
+        self.cached = []
+        self.key = None
+        self.results = ""
+
+    def start(self, rqexe):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            cmdin, cmdout = os.pipe()
+            resin, resout = os.pipe()
+            pipein, pipeout = os.pipe()
+            pid = os.fork()
+        except OSError as e:
+            bb.msg.fatal("RunQueue", "fork failed: %d (%s)" % (e.errno, e.strerror))
+
+        if pid == 0:
+            for fd in (cmdout, resin, pipein):
+                os.close(fd)
+            for worker in self.pool.workers:
+                if worker is not self:
+                    worker.close_fds()
+            ret = 1
+            try:
+                ret = self.main(rqexe, cmdin, resout, os.fdopen(pipeout, 'wb', 0))
+            finally:
+                os._exit(ret)
+
+        os.close(cmdin)
+        os.close(resout)
+        self.pid = pid
+        self.command = cmdout
+        self.result = resin
+        bb.utils.nonblockingfd(self.result)
+        self.pipe = runQueueWorkerPipe(os.fdopen(pipein, 'rb', 4096), os.fdopen(pipeout, 'wb', 0), rqexe.cfgData)
+
+    def close_fds(self):
+        for fd in (self.command, self.result):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.pipe.input.close()
+
+    def send(self, msg):
+        write_message(self.command, msg)
+
+    def receive(self):
+        """
+        Return the result of the task the worker ran or None if the task
+        has not finished yet.
+        """
+        try:
+            self.results = self.results + os.read(self.result, 4096)
+        except OSError:
+            pass
+        if len(self.results) < 4:
+            return None
+        size = struct.unpack("!I", self.results[:4])[0]
+        if len(self.results) < size + 4:
+            return None
+        msg = pickle.loads(self.results[4:size + 4])
+        self.results = self.results[size + 4:]
+        return msg
+
+    def main(self, rqexe, cmdin, resout, pipeout):
+        """
+        The worker process main loop, run tasks until told to quit
+        """
+        bb.event.worker_pid = os.getpid()
+        bb.event.worker_pipe = pipeout
+        rqexe.rq.state = runQueueChildProcess
+
+        signal.signal(signal.SIGTERM, self.sigterm)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        # No stdin
+        newsi = os.open(os.devnull, os.O_RDWR)
+        os.dup2(newsi, sys.stdin.fileno())
+
+        rqexe.cooker.configuration.data.setVar("BB_WORKERCONTEXT", "1")
+        bb.parse.siggen.set_taskdata(rqexe.rqdata.hashes, rqexe.rqdata.hash_deps)
+
+        datacache = {}
+        while True:
+            msg = read_message(cmdin)
+            if msg is None or msg[0] == "quit":
+                return 0
+            fn, task, taskname, appends, umask, fakeenv, quieterrors = msg[1:]
+
+            key = (fn, tuple(appends), self.pool.confighash)
+            if key in datacache:
+                the_data, parsetime = datacache[key]
+                hit = True
+            else:
+                hit = False
+                start = time.time()
+                try:
+                    the_data = bb.cache.Cache.loadDataFull(fn, appends, rqexe.cooker.configuration.data)
+                except Exception as exc:
+                    if not quieterrors:
+                        logger.critical(str(exc))
+                    write_message(resout, (1, False, False, 0))
+                    continue
+                parsetime = time.time() - start
+                datacache[key] = (the_data, parsetime)
+            self.update_cached(key)
+            for stale in set(datacache) - set(self.cached):
+                del datacache[stale]
+
+            status = self.fork_task(rqexe, fn, task, taskname, the_data, umask, fakeenv, quieterrors, (cmdin, resout))
+            write_message(resout, (status, True, hit, parsetime))
+
+    def fork_task(self, rqexe, fn, task, taskname, the_data, umask, fakeenv, quieterrors, fds):
+        envbackup = {}
+        for key, value in fakeenv.iteritems():
+            envbackup[key] = os.environ.get(key)
+            os.environ[key] = value
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            pid = os.fork()
+        except OSError as e:
+            logger.critical("fork failed: %d (%s)" % (e.errno, e.strerror))
+            return 1
+
+        if pid == 0:
+            for fd in fds:
+                os.close(fd)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            bb.event.worker_pid = os.getpid()
+            # Make the child the process group leader
+            os.setpgid(0, 0)
+            if umask:
+                os.umask(umask)
+            rqexe.exec_task_child(fn, task, taskname, the_data, fakeenv, quieterrors)
+
+        for key, value in envbackup.iteritems():
+            if value is None:
+                del os.environ[key]
+            else:
+                os.environ[key] = value
+
+        self.task = pid
+        pid, status = os.waitpid(pid, 0)
+        self.task = None
+        return exit_status(status)
+
+    def sigterm(self, signum, frame):
+        if self.task:
+            try:
+                os.kill(-self.task, signal.SIGTERM)
+                os.waitpid(self.task, 0)
+            except OSError:
+                pass
+        os._exit(1)
+
+    def update_cached(self, key):
+        if key in self.cached:
+            self.cached.remove(key)
+        self.cached.append(key)
+        while len(self.cached) > self.pool.cachesize:
+            self.cached.pop(0)
+
+class RunQueueWorkerPool(object):
+    """
+    A pool of long lived task worker processes (enabled with BB_WORKER_POOL),
+    used instead of forking a new process for every task which then has to
+    reparse its recipe from scratch. BB_WORKER_POOL_CACHE sets how many recipe
+    datastores each worker keeps.
+    """
+    def __init__(self, rq, size):
+        self.rq = rq
+        self.size = size
+        self.cachesize = int(rq.cfgData.getVar("BB_WORKER_POOL_CACHE", True) or 8)
+        self.confighash = rq.cooker.configuration.data.get_hash()
+        self.workers = []
+        self.busy = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.parsetime = 0.0
+        self.saved = 0.0
+
+    def run_task(self, rqexe, fn, task, taskname, umask, fakeenv, quieterrors):
+        appends = self.rq.cooker.get_file_appends(fn)
+        key = (fn, tuple(appends), self.confighash)
+
+        worker = self.choose_worker(key)
+        if worker is None:
+            worker = RunQueueWorker(self)
+            self.workers.append(worker)
+            worker.start(rqexe)
+
+        worker.send(("task", fn, task, taskname, appends, umask, fakeenv, quieterrors))
+        worker.key = key
+        self.busy[worker.pid] = worker
+        return worker.pid, worker.pipe
+
+    def choose_worker(self, key):
+        """
+        Pick an idle worker, preferring one which already has the recipe
+        parsed. Returns None if a new worker should be started.
+        """
+        idle = [worker for worker in self.workers if worker.pid not in self.busy]
+        for worker in idle:
+            if key in worker.cached:
+                return worker
+        if len(self.workers) < self.size or not idle:
+            return None
+        return idle[0]
+
+    def collect(self):
+        """
+        Return (pid, exitcode) for a worker which finished its task or None
+        """
+        for pid, worker in self.busy.items():
+            msg = worker.receive()
+            if msg is None:
+                continue
+            status, parsed, hit, parsetime = msg
+            if parsed:
+                worker.update_cached(worker.key)
+            if hit:
+                self.hits += 1
+                self.saved += parsetime
+            else:
+                self.misses += 1
+                self.parsetime += parsetime
+            del self.busy[pid]
+            return pid, status
+        return None
+
+    def result_fds(self):
+        return [worker.result for worker in self.busy.itervalues()]
+
+    def worker_exited(self, pid):
+        """
+        Forget about a worker process which exited, returns True if the pid
+        belonged to one of our workers.
+        """
+        for worker in self.workers:
+            if worker.pid == pid:
+                self.workers.remove(worker)
+                if pid in self.busy:
+                    del self.busy[pid]
+                os.close(worker.command)
+                os.close(worker.result)
+                return True
+        return False
+
+    def terminate(self):
+        for worker in self.workers:
+            try:
+                os.kill(worker.pid, signal.SIGTERM)
+            except OSError:
+                pass
+        self.shutdown()
+
+    def shutdown(self):
+        for worker in self.workers:
+            try:
+                worker.send(("quit",))
+            except (OSError, IOError):
+                pass
+        for worker in self.workers:
+            try:
+                os.waitpid(worker.pid, 0)
+            except OSError:
+                pass
+            os.close(worker.command)
+            os.close(worker.result)
+            worker.pipe.shutdown()
+        self.workers = []
+        self.busy = {}
+
+        if self.hits or self.misses:
+            logger.info("Task worker pool: %s datastore cache hits, %s misses, %.1fs spent parsing, %.1fs of parsing saved",
+                        self.hits, self.misses, self.parsetime, self.saved)
+
+def write_message(fd, msg):
+    data = pickle.dumps(msg, pickle.HIGHEST_PROTOCOL)
+    os.write(fd, struct.pack("!I", len(data)) + data)
+
+def read_message(fd):
+    """
+    Blocking read of a message written with write_message(), returns None
+    at end of file
+    """
+    def readall(size):
+        data = ""
+        while len(data) < size:
+            chunk = os.read(fd, size - len(data))
+            if not chunk:
+                return None
+            data = data + chunk
+        return data
+
+    header = readall(4)
+    if header is None:
+        return None
+    data = readall(struct.unpack("!I", header)[0])
+    if data is None:
+        return None
+    return pickle.loads(data)
@@ -3,7 +3,10 @@ import logging
 import os
 import re
 import tempfile
+import time
+import zlib
 import bb.data
+import bb.persist_data
 
 logger = logging.getLogger('BitBake.SigGen')
 
@@ -72,6 +75,10 @@ class SignatureGeneratorBasic(SignatureGenerator):
         self.basewhitelist = set((data.getVar("BB_HASHBASE_WHITELIST", True) or "").split())
         self.taskwhitelist = None
         self.init_rundepcheck(data)
+        self.sigstore = None
+        sigstore = data.getVar("BB_SIGNATURE_STORE", True)
+        if sigstore:
+            self.sigstore = SignatureStore(sigstore)
 
     def init_rundepcheck(self, data):
         self.taskwhitelist = data.getVar("BB_HASHTASK_WHITELIST", True) or None
@@ -201,17 +208,8 @@ class SignatureGeneratorBasic(SignatureGenerator):
         self.runtaskdeps = deps
         self.taskhash = hashes
 
-    def dump_sigtask(self, fn, task, stampbase, runtime):
+    def sigtask_data(self, fn, task, stampbase, runtime):
         k = fn + "." + task
-        if runtime == "customfile":
-            sigfile = stampbase
-        elif runtime and k in self.taskhash:
-            sigfile = stampbase + "." + task + ".sigdata" + "." + self.taskhash[k]
-        else:
-            sigfile = stampbase + "." + task + ".sigbasedata" + "." + self.basehash[k]
-
-        bb.utils.mkdirhier(os.path.dirname(sigfile))
-
         data = {}
         data['basewhitelist'] = self.basewhitelist
         data['taskwhitelist'] = self.taskwhitelist
@@ -237,6 +235,32 @@ class SignatureGeneratorBasic(SignatureGenerator):
         if taint:
             data['taint'] = taint
 
+        return data
+
+    def sigtask_record(self, fn, task, stampbase, runtime):
+        """Return the record of a task for SignatureStore.add()"""
+        k = fn + "." + task
+        data = self.sigtask_data(fn, task, stampbase, runtime)
+        if runtime and k in self.taskhash:
+            return (self.taskhash[k], fn, task, "sigdata", data)
+        return (self.basehash[k], fn, task, "sigbasedata", data)
+
+    def dump_sigtask(self, fn, task, stampbase, runtime):
+        if self.sigstore and runtime != "customfile":
+            self.sigstore.add([self.sigtask_record(fn, task, stampbase, runtime)])
+            return
+
+        k = fn + "." + task
+        if runtime == "customfile":
+            sigfile = stampbase
+        elif runtime and k in self.taskhash:
+            sigfile = stampbase + "." + task + ".sigdata" + "." + self.taskhash[k]
+        else:
+            sigfile = stampbase + "." + task + ".sigbasedata" + "." + self.basehash[k]
+
+        bb.utils.mkdirhier(os.path.dirname(sigfile))
+
+        data = self.sigtask_data(fn, task, stampbase, runtime)
         fd, tmpfile = tempfile.mkstemp(dir=os.path.dirname(sigfile), prefix="sigtask.")
         try:
             with os.fdopen(fd, "wb") as stream:
@@ -253,6 +277,7 @@ class SignatureGeneratorBasic(SignatureGenerator):
             raise err
 
     def dump_sigs(self, dataCache):
+        records = []
         for fn in self.taskdeps:
             for task in self.taskdeps[fn]:
                 k = fn + "." + task
@@ -261,7 +286,12 @@ class SignatureGeneratorBasic(SignatureGenerator):
                 if dataCache.basetaskhash[k] != self.basehash[k]:
                     bb.error("Bitbake's cached basehash does not match the one we just generated (%s)!" % k)
                     bb.error("The mismatched hashes were %s and %s" % (dataCache.basetaskhash[k], self.basehash[k]))
-                self.dump_sigtask(fn, task, dataCache.stamp[fn], True)
+                if self.sigstore:
+                    records.append(self.sigtask_record(fn, task, dataCache.stamp[fn], True))
+                else:
+                    self.dump_sigtask(fn, task, dataCache.stamp[fn], True)
+        if records:
+            self.sigstore.add(records)
 
 class SignatureGeneratorBasicHash(SignatureGeneratorBasic):
     name = "basichash"
@@ -301,12 +331,194 @@ def clean_basepaths(a):
         b[clean_basepath(x)] = a[x]
     return b
 
-def compare_sigfiles(a, b):
+class SignatureStore(object):
+    """
+    Append-only database of the signature data of tasks, used instead of a
+    sigdata file per task when BB_SIGNATURE_STORE is set.
+
+    The data of a signature is split into pieces (the dependencies and the
+    value of each variable, the hash of each dependent task, ...) which
+    are pickled, compressed and stored once, keyed by the md5 of their
+    content. The list of pieces making up each of the gendeps, varvals,
+    ... dictionaries is stored the same way, so a signature only adds the
+    pieces which differ from the signatures already stored, and repeated
+    -S runs add little more than a row per task. Signatures are indexed by
+    hash and by file and task name.
+    """
+
+    # Fields of the signature data stored as one piece per item
+    dictfields = ("gendeps", "varvals", "runtaskhashes", "file_checksum_values")
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+        self.pid = None
+
+    def _connect(self):
+        # A connection can't be shared with the forked task processes
+        if self.connection is None or self.pid != os.getpid():
+            bb.utils.mkdirhier(os.path.dirname(os.path.abspath(self.path)))
+            self.connection = bb.persist_data.connect(self.path)
+            self.pid = os.getpid()
+            self._execute("CREATE TABLE IF NOT EXISTS pieces(key TEXT PRIMARY KEY, data BLOB);")
+            self._execute("CREATE TABLE IF NOT EXISTS signatures(hash TEXT, fn TEXT, task TEXT, "
+                          "kind TEXT, time REAL, manifest BLOB, UNIQUE(hash, fn, task, kind));")
+            self._execute("CREATE INDEX IF NOT EXISTS signatures_task ON signatures(task, fn);")
+        return self.connection
+
+    def _execute(self, *query):
+        """Execute a query, waiting to acquire a lock if necessary"""
+        count = 0
+        while True:
+            try:
+                return self.connection.execute(*query)
+            except bb.persist_data.sqlite3.OperationalError as exc:
+                if 'database is locked' in str(exc) and count < 500:
+                    count = count + 1
+                    continue
+                raise
+
+    def _piece(self, value, pieces, keys):
+        # The tasks of a recipe share the objects of their values, which
+        # are kept alive by the records while they are added
+        if id(value) in keys:
+            return keys[id(value)]
+        # The pickle of a value depends on the references to the objects it
+        # is made of, so the key is computed from its repr with the sets
+        # sorted
+        if isinstance(value, (set, frozenset)):
+            content = repr(sorted(value))
+        else:
+            content = repr(value)
+        key = hashlib.md5(type(value).__name__ + ":" + content).hexdigest()
+        if key not in pieces:
+            pieces[key] = bb.persist_data.sqlite3.Binary(zlib.compress(pickle.dumps(value, -1)))
+        keys[id(value)] = key
+        return key
+
+    def _load(self, keys):
+        values = {}
+        keys = list(keys)
+        # Stay below the limit on the number of parameters of a query
+        for i in xrange(0, len(keys), 500):
+            chunk = keys[i:i+500]
+            query = "SELECT key, data FROM pieces WHERE key IN (%s);" % ",".join("?" * len(chunk))
+            for key, data in self._execute(query, chunk):
+                values[key] = pickle.loads(zlib.decompress(str(data)))
+        return values
+
+    def add(self, records):
+        """
+        Store a list of (hash, fn, task, kind, data) records, kind being
+        "sigdata" or "sigbasedata", in a single transaction
+        """
+        pieces = {}
+        keys = {}
+        signatures = []
+        now = time.time()
+        for sighash, fn, task, kind, data in records:
+            manifest = {}
+            for field, value in data.iteritems():
+                if field in self.dictfields:
+                    items = sorted((name, self._piece(item, pieces, keys)) for name, item in value.iteritems())
+                    manifest[field] = self._piece(items, pieces, {})
+                else:
+                    manifest[field] = self._piece(value, pieces, keys)
+            signatures.append((sighash, fn, task, kind, now,
+                               bb.persist_data.sqlite3.Binary(pickle.dumps(manifest, -1))))
+
+        self._connect()
+        self._execute("BEGIN IMMEDIATE;")
+        try:
+            self.connection.executemany("INSERT OR IGNORE INTO pieces(key, data) VALUES (?, ?);",
+                                        pieces.iteritems())
+            self.connection.executemany("INSERT OR REPLACE INTO signatures(hash, fn, task, kind, time, manifest) "
+                                        "VALUES (?, ?, ?, ?, ?, ?);", signatures)
+        except:
+            self.connection.execute("ROLLBACK;")
+            raise
+        self._execute("COMMIT;")
+
+    def find(self, sighash = None, task = None, fn = None):
+        """
+        Return the (hash, fn, task, kind, time) of the signatures matching
+        the arguments given, the most recent first
+        """
+        conditions = []
+        args = []
+        for column, value in (("hash", sighash), ("task", task), ("fn", fn)):
+            if value is not None:
+                conditions.append("%s = ?" % column)
+                args.append(value)
+        query = "SELECT hash, fn, task, kind, time FROM signatures"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        self._connect()
+        return list(self._execute(query + " ORDER BY time DESC, rowid DESC;", args))
+
+    def find_recipe(self, recipe, task):
+        """
+        Return the signatures of task for the recipes given by their file or
+        by their file name without the version (e.g. busybox or
+        virtual:native:quilt), the most recent first
+        """
+        if not task.startswith("do_"):
+            task = "do_" + task
+        found = []
+        for row in self.find(task = task):
+            fn = row[1]
+            name = os.path.basename(fn)
+            if fn.startswith("virtual:"):
+                name = fn.rsplit(":", 1)[0] + ":" + name
+            if recipe in (fn, name, name[:-3]) or name.startswith(recipe + "_"):
+                found.append(row)
+        return found
+
+    def get(self, sighash, fn = None, task = None):
+        """
+        Return the data of the most recent signature with the given hash
+        (and file and task name if given), in the format of the sigdata
+        files, or None if there is no such signature
+        """
+        conditions = "hash = ?"
+        args = [sighash]
+        if fn is not None:
+            conditions += " AND fn = ?"
+            args.append(fn)
+        if task is not None:
+            conditions += " AND task = ?"
+            args.append(task)
+        self._connect()
+        for (manifest,) in self._execute("SELECT manifest FROM signatures WHERE %s "
+                                         "ORDER BY time DESC, rowid DESC LIMIT 1;" % conditions, args):
+            break
+        else:
+            return None
+
+        manifest = pickle.loads(str(manifest))
+        pieces = self._load(set(manifest.itervalues()))
+        items = set()
+        for field in self.dictfields:
+            if field in manifest:
+                items.update(key for name, key in pieces[manifest[field]])
+        pieces.update(self._load(items - set(pieces)))
+
+        data = {}
+        for field, key in manifest.iteritems():
+            if field in self.dictfields:
+                data[field] = dict((name, pieces[itemkey]) for name, itemkey in pieces[key])
+            else:
+                data[field] = pieces[key]
+        return data
+
+def load_sigfile(a):
     p1 = pickle.Unpickler(open(a, "rb"))
-    a_data = p1.load()
-    p2 = pickle.Unpickler(open(b, "rb"))
-    b_data = p2.load()
+    return p1.load()
 
+def compare_sigfiles(a, b):
+    compare_sigdata(load_sigfile(a), load_sigfile(b))
+
+def compare_sigdata(a_data, b_data):
     def dict_diff(a, b, whitelist=set()):
         sa = set(a.keys())
         sb = set(b.keys())
@@ -402,9 +614,9 @@ def compare_sigfiles(a, b):
 
 
 def dump_sigfile(a):
-    p1 = pickle.Unpickler(open(a, "rb"))
-    a_data = p1.load()
+    dump_sigdata(load_sigfile(a))
 
+def dump_sigdata(a_data):
     print "basewhitelist: %s" % (a_data['basewhitelist'])
 
     print "taskwhitelist: %s" % (a_data['taskwhitelist'])
@@ -0,0 +1,201 @@
+#
+# BitBake Tests for cache.py
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import unittest
+import tempfile
+import collections
+import os
+import bb
+import bb.cache
+from bb.cache import pickle
+
+class RecipeInfoFileTest(unittest.TestCase):
+    version = ("1", "2")
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, "bb_cache.dat")
+
+    def tearDown(self):
+        bb.utils.prunedir(self.tempdir)
+
+    def open(self):
+        cachefile = bb.cache.RecipeInfoFile(self.filename)
+        self.assertEqual(cachefile.load(), self.version)
+        return cachefile
+
+    def test_roundtrip(self):
+        cachefile = bb.cache.RecipeInfoFile(self.filename)
+        cachefile.write(self.version, set(), {"a.bb": ["a"], "b.bb": {"b": 1}})
+        cachefile = self.open()
+        self.assertEqual(sorted(cachefile.keys()), ["a.bb", "b.bb"])
+        self.assertEqual(cachefile.get("a.bb"), ["a"])
+        self.assertEqual(cachefile.get("b.bb"), {"b": 1})
+
+    def test_incremental(self):
+        cachefile = bb.cache.RecipeInfoFile(self.filename)
+        entries = dict(("%d.bb" % i, "x" * 1000) for i in range(20))
+        cachefile.write(self.version, set(), entries)
+        size = os.path.getsize(self.filename)
+
+        # Updating one entry appends to the file instead of rewriting it
+        cachefile = self.open()
+        inode = os.stat(self.filename).st_ino
+        keep = set(cachefile.keys()) - set(["0.bb", "1.bb"])
+        cachefile.write(self.version, keep, {"0.bb": "y"})
+        self.assertEqual(os.stat(self.filename).st_ino, inode)
+        self.assertTrue(os.path.getsize(self.filename) > size)
+
+        cachefile = self.open()
+        self.assertEqual(len(cachefile), 19)
+        self.assertFalse("1.bb" in cachefile)
+        self.assertEqual(cachefile.get("0.bb"), "y")
+        self.assertEqual(cachefile.get("2.bb"), "x" * 1000)
+
+    def test_compaction(self):
+        cachefile = bb.cache.RecipeInfoFile(self.filename)
+        entries = dict(("%d.bb" % i, "x" * 1000) for i in range(20))
+        cachefile.write(self.version, set(), entries)
+        size = os.path.getsize(self.filename)
+
+        cachefile = self.open()
+        cachefile.write(self.version, set(["2.bb"]), {})
+        self.assertTrue(os.path.getsize(self.filename) < size)
+        cachefile = self.open()
+        self.assertEqual(cachefile.keys(), ["2.bb"])
+        self.assertEqual(cachefile.get("2.bb"), "x" * 1000)
+
+    def test_sync(self):
+        # The entries are synced before the header is written over and
+        # the header after
+        cachefile = bb.cache.RecipeInfoFile(self.filename)
+        cachefile.write(self.version, set(), dict(("%d.bb" % i, "x" * 1000) for i in range(20)))
+        cachefile = self.open()
+        synced = []
+        fsync = os.fsync
+        def record(fd):
+            with open(self.filename, "rb") as f:
+                synced.append(f.read(bb.cache.RecipeInfoFile.header.size))
+            fsync(fd)
+        os.fsync = record
+        try:
+            cachefile.write(self.version, set(cachefile.keys()), {"0.bb": "y"})
+        finally:
+            os.fsync = fsync
+        self.assertEqual(len(synced), 2)
+        self.assertNotEqual(synced[0], synced[1])
+        self.assertEqual(self.open().get("0.bb"), "y")
+
+    def test_invalid(self):
+        with open(self.filename, "wb") as f:
+            f.write("not a cache file")
+        cachefile = bb.cache.RecipeInfoFile(self.filename)
+        self.assertRaises(Exception, cachefile.load)
+        cachefile.write(self.version, set(), {"a.bb": "a"})
+        self.assertEqual(self.open().get("a.bb"), "a")
+
+class RecipeInfoMapTest(unittest.TestCase):
+
+    def test_lazy(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            core = bb.cache.RecipeInfoFile(os.path.join(tempdir, "core"))
+            extra = bb.cache.RecipeInfoFile(os.path.join(tempdir, "extra"))
+            core.write(None, set(), {"a.bb": "core-a", "b.bb": "core-b"})
+            extra.write(None, set(), {"a.bb": "extra-a"})
+            core.load()
+            extra.load()
+
+            infos = bb.cache.RecipeInfoMap([core, extra])
+            self.assertEqual(len(infos), 2)
+            self.assertEqual(infos.loaded, {})
+            self.assertEqual(infos["a.bb"], ["core-a", "extra-a"])
+            self.assertEqual(infos["b.bb"], ["core-b"])
+            self.assertFalse("c.bb" in infos)
+            self.assertRaises(KeyError, infos.__getitem__, "c.bb")
+
+            infos["c.bb"] = ["core-c"]
+            del infos["b.bb"]
+            self.assertEqual(sorted(infos), ["a.bb", "c.bb"])
+            self.assertEqual(infos.changed, set(["c.bb"]))
+        finally:
+            bb.utils.prunedir(tempdir)
+
+    def test_damaged(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            core = bb.cache.RecipeInfoFile(os.path.join(tempdir, "core"))
+            core.write(None, set(), {"a.bb": "core-a", "b.bb": "core-b"})
+            core.load()
+            offset, length = core.index["a.bb"]
+            core.close()
+            with open(core.filename, "r+b") as f:
+                f.seek(offset)
+                f.write("\xff" * length)
+            core.load()
+
+            # An entry which can't be unpickled is a cache miss
+            infos = bb.cache.RecipeInfoMap([core])
+            self.assertRaises(KeyError, infos.__getitem__, "a.bb")
+            self.assertFalse("a.bb" in infos)
+            self.assertEqual(infos.get("a.bb"), None)
+            self.assertEqual(infos["b.bb"], ["core-b"])
+        finally:
+            bb.utils.prunedir(tempdir)
+
+class TestRecipeInfo(bb.cache.RecipeInfoCommon):
+    def __init__(self, pn, depends):
+        self.pn = pn
+        self.depends = depends
+
+    @classmethod
+    def init_cacheData(cls, cachedata):
+        cachedata.pkg_fn = {}
+        cachedata.providers = collections.defaultdict(list)
+        cachedata.rundeps = collections.defaultdict(lambda: collections.defaultdict(list))
+        cachedata.all_depends = set()
+        cachedata.possible_world = []
+
+    def add_cacheData(self, cachedata, fn):
+        cachedata.pkg_fn[fn] = self.pn
+        cachedata.providers[self.pn].append(fn)
+        cachedata.rundeps[fn][self.pn] = list(self.depends)
+        cachedata.all_depends.update(self.depends)
+        cachedata.possible_world.append(fn)
+
+class CacheDataMergeTest(unittest.TestCase):
+
+    def test_merge(self):
+        recipes = [("a_1.0.bb", TestRecipeInfo("a", ["b"])),
+                   ("a_2.0.bb", TestRecipeInfo("a", ["c"])),
+                   ("b_1.0.bb", TestRecipeInfo("b", []))]
+
+        whole = bb.cache.CacheData([TestRecipeInfo])
+        for fn, info in recipes:
+            whole.add_from_recipeinfo(fn, [info])
+
+        merged = bb.cache.CacheData([TestRecipeInfo])
+        for fn, info in recipes:
+            part = bb.cache.CacheData([TestRecipeInfo])
+            part.add_from_recipeinfo(fn, [info])
+            merged.merge(pickle.loads(pickle.dumps(part, -1)))
+
+        self.assertEqual(merged.pkg_fn, whole.pkg_fn)
+        self.assertEqual(merged.providers, whole.providers)
+        self.assertEqual(merged.rundeps, whole.rundeps)
+        self.assertEqual(merged.all_depends, set(["b", "c"]))
+        self.assertEqual(merged.possible_world, whole.possible_world)
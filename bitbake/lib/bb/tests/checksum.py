@@ -0,0 +1,90 @@
+#
+# BitBake Tests for checksum.py
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import unittest
+import tempfile
+import hashlib
+import shutil
+import os
+import bb
+import bb.data
+import bb.checksum
+import bb.fetch2
+
+class FileChecksumCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = bb.checksum.FileChecksumCache()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write(self, name, content):
+        path = os.path.join(self.tempdir, name)
+        bb.utils.mkdirhier(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_get_checksums(self):
+        files = {}
+        for i in range(8):
+            content = os.urandom(i * 300000 + 1)
+            files[self.write("files/%d" % i, content)] = hashlib.md5(content).hexdigest()
+        errors = []
+        missing = os.path.join(self.tempdir, "missing")
+        self.cache.pool_minsize = 0
+        checksums = self.cache.get_checksums(sorted(files) + [missing], lambda f, e: errors.append(f), 4)
+        self.assertEqual(checksums, files)
+        self.assertEqual(errors, [missing])
+        self.assertEqual(self.cache.get_checksums(sorted(files), threads = 1), files)
+        for f in files:
+            self.assertEqual(self.cache.get_checksum(f), files[f])
+
+    def test_changed_file(self):
+        path = self.write("patch", "a")
+        self.assertEqual(self.cache.get_checksum(path), hashlib.md5("a").hexdigest())
+        # Replace the file, keeping its mtime
+        mtime = os.stat(path).st_mtime
+        os.unlink(path)
+        self.write("patch", "bb")
+        os.utime(path, (mtime, mtime))
+        self.assertEqual(self.cache.get_checksum(path), hashlib.md5("bb").hexdigest())
+
+    def test_save_merge(self):
+        d = bb.data.init()
+        d.setVar("PERSISTENT_DIR", os.path.join(self.tempdir, "cache"))
+        path = self.write("patch", "a")
+        self.cache.init_cache(d)
+        self.cache.get_checksum(path)
+        self.cache.save_extras(d)
+        self.cache.save_merge(d)
+
+        cache = bb.checksum.FileChecksumCache()
+        cache.init_cache(d)
+        self.assertEqual(cache.lookup(path), (cache.stat_key(path), hashlib.md5("a").hexdigest()))
+
+    def test_get_file_checksums(self):
+        self.write("files/a", "a")
+        self.write("files/sub/b", "b")
+        self.write("c.patch", "c")
+        filelist = " ".join([os.path.join(self.tempdir, "files"), os.path.join(self.tempdir, "*.patch")])
+        checksums = bb.fetch2.get_file_checksums(filelist, "foo")
+        expected = [("files", "b"), ("files/a", "a"), ("files/sub/b", "b"), ("c.patch", "c"), ("*.patch", "c")]
+        self.assertEqual(checksums, sorted((os.path.join(self.tempdir, f), hashlib.md5(c).hexdigest()) for f, c in expected))
@@ -367,3 +367,77 @@ esac
     #    self.assertEquals(deps, set(["oe_libinstall"]))
 
 
+
+class CodeTemplateTest(ReferenceTest):
+
+    def buildDependencies(self, value, python = False):
+        self.d.setVar("FOO", value)
+        self.d.setVarFlags("FOO", {"func": True, "python": python})
+        deps, values = bb.data.build_dependencies("FOO", set(self.d.keys()), set(), set(), self.d)
+        return deps
+
+    def test_template(self):
+        template = bb.codeparser.code_template("${A} ${B}/x ${C}", "a b/x ${C}", self.d)
+        self.assertEqual(template, None)
+        self.setValues({"A": "a", "B": "b"})
+        template = bb.codeparser.code_template("${A} ${B}/x ${C}", "a b/x ${C}", self.d)
+        self.assertEqual(template, ("__bbref0__ __bbref1__/x __bbref2__", ["a", "b", "${C}"]))
+
+    def test_python(self):
+        value = "d.getVar('${PN}_foo', True)\nd.setVar('X', '${PN}')\nbar()"
+        self.setEmptyVars(["bar", "one_foo", "two_foo"])
+        self.d.setVar("PN", "one")
+        self.assertEquals(self.buildDependencies(value, True), set(["PN", "one_foo", "bar"]))
+        self.d.setVar("PN", "two")
+        self.assertEquals(self.buildDependencies(value, True), set(["PN", "two_foo", "bar"]))
+
+        parser = bb.codeparser.PythonParser("ParserTest", logger)
+        self.assertTrue(parser.parse_template("d.getVar('__bbref0__', True)", ["two"]))
+        self.assertEquals(parser.references, set(["two"]))
+
+    def test_python_log(self):
+        # The messages of the template parse are logged by every parser
+        # using the template, for the real function and values
+        for name, value in (("do_one", "one"), ("do_two", "two")):
+            parser = bb.codeparser.PythonParser(name, logger)
+            self.assertTrue(parser.parse_template("d.getVar(x + '__bbref0__', True)", [value]))
+            self.assertEquals([record.getMessage() for record in parser.log.buffer],
+                              ["while parsing %s, in call of d.getVar, argument 'x + '%s'' is not a string literal" % (name, value)])
+
+    def test_python_code(self):
+        # The placeholders have to be in string literals
+        self.setEmptyVars(["bar", "baz"])
+        self.d.setVar("CALL", "bar")
+        self.assertEquals(self.buildDependencies("${CALL}()", True), set(["CALL", "bar"]))
+        self.d.setVar("CALL", "baz")
+        self.assertEquals(self.buildDependencies("${CALL}()", True), set(["CALL", "baz"]))
+
+        parser = bb.codeparser.PythonParser("ParserTest", logger)
+        self.assertFalse(parser.parse_template("__bbref0__()", ["bar"]))
+        self.assertFalse(parser.parse_template("x = '__bbref0__'", ["it's"]))
+
+    def test_shell(self):
+        value = "${PN}_install() {\n\t${INSTALL} -d x\n}\n${PN}_install\ncp ${S}/a ${D}"
+        self.setEmptyVars(["cp", "install", "ginstall"])
+        self.setValues({"PN": "one", "S": "/src", "D": "/dest", "INSTALL": "install"})
+        self.assertEquals(self.buildDependencies(value), set(["PN", "S", "D", "INSTALL", "cp", "install"]))
+        self.d.setVar("INSTALL", "ginstall")
+        self.assertEquals(self.buildDependencies(value), set(["PN", "S", "D", "INSTALL", "cp", "ginstall"]))
+
+        parser = bb.codeparser.ShellParser("ParserTest", logger)
+        self.assertTrue(parser.parse_template("__bbref0___x() {\n\ttrue\n}\n__bbref0___x\n__bbref1__", ["one", "cp"]))
+        self.assertEquals(parser.execs, set(["true", "cp"]))
+
+    def test_shell_words(self):
+        # Values which change how the code is tokenized
+        self.setEmptyVars(["echo", "mycmd"])
+        self.d.setVar("CMD", "mycmd arg")
+        self.assertEquals(self.buildDependencies("${CMD}\necho"), set(["CMD", "mycmd", "echo"]))
+
+        parser = bb.codeparser.ShellParser("ParserTest", logger)
+        for value in ["mycmd arg", "", "$x", "a;b", "eval", "if", "2"]:
+            self.assertFalse(parser.parse_template("__bbref0__ >x", [value]))
+        self.assertFalse(parser.parse_template("__bbref0__=1 true", ["a.b"]))
+        self.assertFalse(parser.parse_template("cat <<EOF\n__bbref0__\nEOF", ["a"]))
+        self.assertTrue(parser.parse_template("__bbref0__=1 true", ["A"]))
+        self.assertEquals(parser.execs, set(["true"]))
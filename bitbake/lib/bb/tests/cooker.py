@@ -0,0 +1,51 @@
+#
+# BitBake Tests for cooker.py
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import unittest
+import bb
+import bb.cooker
+
+class FailingCache(object):
+    """A recipe cache whose checks raise the given exception"""
+    def __init__(self, exc):
+        self.exc = exc
+
+    def cacheValid(self, filename, appends):
+        raise self.exc
+
+class ValidateTest(unittest.TestCase):
+
+    def validate(self, exc):
+        parser = bb.cooker.Parser(None, None, None, None)
+        parser.bb_cache = FailingCache(exc)
+        parser.cfg = None
+        return parser.validate(3, [("/meta/a_1.0.bb", [])], [])
+
+    def test_cache_error(self):
+        result = self.validate(OSError(2, "No such file or directory"))
+        self.assertEqual(result[:5], (3, None, None, [], 0))
+        exc = result[5]
+        self.assertTrue(isinstance(exc, bb.cooker.Parser.cache_errors))
+        self.assertEqual(exc.recipe, "/meta/a_1.0.bb")
+        self.assertTrue(exc.traceback)
+
+    def test_other_error(self):
+        # Other errors are passed to the main process too, which reports
+        # them rather than checking the shard again
+        exc = self.validate(TypeError("bug"))[5]
+        self.assertFalse(isinstance(exc, bb.cooker.Parser.cache_errors))
+        self.assertEqual(exc.recipe, "/meta/a_1.0.bb")
@@ -118,6 +118,47 @@ class DataExpansions(unittest.TestCase):
         keys = self.d.keys()
         self.assertEqual(keys, ['value of foo', 'foo', 'bar'])
 
+
+class ExpansionTemplates(unittest.TestCase):
+    def setUp(self):
+        self.d = bb.data.init()
+        self.d.setVar("foo", "value of foo")
+        self.d.setVar("bar", "value of bar")
+
+    def test_compile(self):
+        template = bb.data_smart.compile_expansion("a ${foo} ${@'b'} ${undefined}")
+        self.assertEqual(template.parts, ("a ", "${foo}", " ", "${@'b'}", " ", "${undefined}"))
+        self.assertEqual(template.references, ((1, "foo"), (5, "undefined")))
+        self.assertEqual(template.python, ((3, "'b'"),))
+        self.assertTrue(bb.data_smart.compile_expansion("a ${foo} ${@'b'} ${undefined}") is template)
+
+    def test_not_compiled(self):
+        for s in ("${${foo}}", "${@'${foo}'}", "${@}"):
+            self.assertEqual(bb.data_smart.compile_expansion(s), None)
+
+    def test_references(self):
+        varparse = self.d.expandWithRefs("${foo} ${@d.getVar('bar', True)} ${undefined} ${@len('a')}", None)
+        self.assertEqual(varparse.value, "value of foo value of bar ${undefined} 1")
+        self.assertEqual(varparse.references, set(["foo", "bar"]))
+        self.assertEqual(varparse.execs, set(["len"]))
+
+    def test_shared(self):
+        other = bb.data.init()
+        other.setVar("foo", "other foo")
+        self.d.setVar("FOO", "${foo} ${@d.getVar('foo', True)}")
+        other.setVar("FOO", "${foo} ${@d.getVar('foo', True)}")
+        self.assertEqual(self.d.getVar("FOO", True), "value of foo value of foo")
+        self.assertEqual(other.getVar("FOO", True), "other foo other foo")
+
+    def test_python_result_expanded(self):
+        self.d.setVar("FOO", "${@'$' + '{' + 'foo' + chr(125)}")
+        self.assertEqual(self.d.getVar("FOO", True), "value of foo")
+
+    def test_value_with_reference(self):
+        self.d.setVar("BAR", "${undefined")
+        self.d.setVar("FOO", "${BAR}${@'x'}")
+        self.assertEqual(self.d.getVar("FOO", True), "${undefinedx")
+
 class TestNestedExpansions(unittest.TestCase):
     def setUp(self):
         self.d = bb.data.init()
@@ -186,6 +227,54 @@ class TestMemoize(unittest.TestCase):
         self.assertEqual(d.getVar("foo"),
                          d.getVar("bar"))
 
+class TestExpandCache(unittest.TestCase):
+    def setUp(self):
+        self.d = bb.data.init()
+        self.d.setVar("A", "${B}")
+        self.d.setVar("B", "${C}")
+        self.d.setVar("C", "c")
+        self.d.setVar("OTHER", "${C}")
+
+    def test_indirect_reference(self):
+        self.assertEqual(self.d.getVar("A", True), "c")
+        self.d.setVar("C", "c2")
+        self.assertEqual(self.d.getVar("A", True), "c2")
+
+    def test_unrelated(self):
+        self.d.getVar("A", True)
+        self.d.getVar("OTHER", True)
+        self.d.setVar("UNRELATED", "value")
+        self.d.setVar("OTHER", "other")
+        self.assertTrue("A" in self.d.expand_cache)
+        self.assertTrue("B" in self.d.expand_cache)
+        self.assertFalse("OTHER" in self.d.expand_cache)
+
+    def test_unresolved_reference(self):
+        self.d.setVar("C", "${D}")
+        self.assertEqual(self.d.getVar("A", True), "${D}")
+        self.d.setVar("D", "d")
+        self.assertEqual(self.d.getVar("A", True), "d")
+
+    def test_defaultval(self):
+        self.d.setVar("C", "${D}")
+        self.d.getVar("A", True)
+        self.d.setVarFlag("D", "defaultval", "d")
+        self.assertEqual(self.d.getVar("A", True), "d")
+
+    def test_python(self):
+        self.d.setVar("P", "${@d.getVar('C' + 'X', True)}")
+        self.assertEqual(self.d.getVar("P", True), "None")
+        self.d.setVar("CX", "cx")
+        self.assertEqual(self.d.getVar("P", True), "cx")
+
+    def test_stats(self):
+        stats = bb.data_smart.expand_cache_stats
+        stats.reset()
+        self.d.getVar("A", True)
+        self.d.getVar("A", True)
+        self.d.setVar("C", "c2")
+        self.assertEqual(stats.counters(), {"hits": 1, "misses": 3, "invalidations": 3})
+
 class TestConcat(unittest.TestCase):
     def setUp(self):
         self.d = bb.data.init()
@@ -232,6 +321,94 @@ class TestOverrides(unittest.TestCase):
         bb.data.update_data(self.d)
         self.assertEqual(self.d.getVar("TEST", True), "testvalue3")
 
+    def test_chained_override(self):
+        self.d.setVar("TEST_local_bar", "testvalue2")
+        bb.data.update_data(self.d)
+        self.assertEqual(self.d.getVar("TEST", True), "testvalue2")
+        self.assertEqual(self.d.getVar("TEST_local_bar"), None)
+
+    def test_append_prepend(self):
+        self.d.setVar("TEST_append", " append")
+        self.d.setVar("TEST_append_bar", " bar")
+        self.d.setVar("TEST_prepend_other", "other ")
+        self.d.setVar("TEST_prepend", "prepend ")
+        bb.data.update_data(self.d)
+        self.assertEqual(self.d.getVar("TEST", True), "prepend testvalue append bar")
+        self.assertEqual(self.d.getVarFlag("TEST", "_append"), None)
+        self.assertEqual(self.d.getVarFlag("TEST", "_prepend"), [("other ", "other")])
+
+    def test_finalize_copy(self):
+        self.d.setVar("TEST_append", " append")
+        bb.data.update_data(self.d)
+        copy = bb.data.createCopy(self.d)
+        copy.setVar("OVERRIDES", "foo:bar:local:other")
+        bb.data.update_data(copy)
+        self.assertEqual(copy.getVar("TEST", True), "testvalue append")
+        self.assertFalse("TEST" in copy._special_values["_append"])
+        self.assertFalse("TEST" in copy.localkeys())
+
+    def test_expand_cache(self):
+        bb.data.update_data(self.d)
+        self.d.getVar("TEST", True)
+        bb.data.update_data(self.d)
+        self.assertTrue("TEST" in self.d.expand_cache)
+        self.d.setVar("TEST_bar", "testvalue2")
+        bb.data.update_data(self.d)
+        self.assertFalse("TEST" in self.d.expand_cache)
+        self.assertEqual(self.d.getVar("TEST", True), "testvalue2")
+
+class TestCopies(unittest.TestCase):
+    def setUp(self):
+        self.d = bb.data.init()
+        self.d.setVar("FOO", "foo")
+        self.d.setVar("BAR", "bar")
+        self.copy = bb.data.createCopy(self.d)
+        self.copy.setVar("BAZ", "baz")
+        self.copy2 = bb.data.createCopy(self.copy)
+
+    def test_lookup(self):
+        self.copy2.setVar("BAR", "bar2")
+        self.assertEqual(self.copy2.getVar("FOO"), "foo")
+        self.assertEqual(self.copy2.getVar("BAR"), "bar2")
+        self.assertEqual(self.copy2.getVar("BAZ"), "baz")
+        self.assertEqual(self.copy.getVar("BAR"), "bar")
+
+    def test_parent_changed(self):
+        self.d.setVar("FOO", "foo2")
+        self.d.setVar("NEW", "new")
+        self.assertEqual(self.copy2.getVar("FOO"), "foo2")
+        self.assertEqual(self.copy2.getVar("NEW"), "new")
+        self.assertTrue("NEW" in self.copy2.keys())
+
+    def test_keys(self):
+        self.assertEqual(sorted(self.copy2.keys()), ["BAR", "BAZ", "FOO"])
+        self.assertEqual(len(self.copy2), 3)
+        self.copy2.setVar("NEW", "new")
+        self.assertEqual(len(self.copy2), 4)
+        self.assertEqual(len(self.copy), 3)
+
+    def test_keys_after_delete(self):
+        self.copy.delVar("BAZ")
+        self.assertFalse("BAZ" in self.copy2.keys())
+        self.assertEqual(len(self.copy2), 2)
+        self.copy.setVarFlag("BAZ", "flag", "value")
+        self.assertTrue("BAZ" in self.copy2.keys())
+        self.copy.delVarFlag("BAZ", "flag")
+        self.assertFalse("BAZ" in self.copy2.keys())
+        # Deleting a variable in a copy leaves the key of its parent
+        self.copy2.delVar("FOO")
+        self.assertEqual(self.copy2.getVar("FOO"), None)
+        self.assertTrue("FOO" in self.copy2.keys())
+
+    def test_keys_after_shadow_copy(self):
+        self.assertEqual(len(self.copy2), 3)
+        # Deleting a flag which isn't set still copies the variable in
+        self.copy2.delVarFlag("FOO", "flag")
+        self.d.delVar("FOO")
+        self.assertEqual(self.copy2.getVar("FOO"), "foo")
+        self.assertTrue("FOO" in self.copy2.keys())
+        self.assertEqual(len(self.copy2), 3)
+
 
 class TestFlags(unittest.TestCase):
     def setUp(self):
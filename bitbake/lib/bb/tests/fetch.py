@@ -20,6 +20,16 @@
 import unittest
 import tempfile
 import subprocess
+import hashlib
+import shutil
+import time
+import threading
+import logging
+import multiprocessing
+import pickle
+import socket
+import SocketServer
+import SimpleHTTPServer
 import os
 import bb
 
@@ -67,6 +77,7 @@ class FetcherTest(unittest.TestCase):
                 "http://.*/.* file:///someotherpath/downloads/ \n"
 
     def setUp(self):
+        self.origdir = os.getcwd()
         self.d = bb.data.init()
         self.tempdir = tempfile.mkdtemp()
         self.dldir = os.path.join(self.tempdir, "download")
@@ -78,6 +89,7 @@ class FetcherTest(unittest.TestCase):
         self.d.setVar("PERSISTENT_DIR", persistdir)
 
     def tearDown(self):
+        os.chdir(self.origdir)
         bb.utils.prunedir(self.tempdir)
 
     def test_fetch(self):
@@ -168,6 +180,19 @@ class FetcherTest(unittest.TestCase):
         uris, uds = bb.fetch2.build_mirroruris(fetcher, mirrors, self.d)
         self.assertEqual(uris, ['file:///someotherpath/downloads/bitbake-1.0.tar.gz'])
 
+    def test_mirror_table(self):
+        fetcher = bb.fetch.FetchData("http://downloads.yoctoproject.org/releases/bitbake/bitbake-1.0.tar.gz", self.d)
+        mirrors = bb.fetch2.mirror_from_string(self.mirrorvar)
+        table = bb.fetch2.mirror_table(mirrors)
+        self.assertTrue(bb.fetch2.mirror_table(bb.fetch2.mirror_from_string(self.mirrorvar)) is table)
+        self.assertEqual(len(table.mirrors), 4)
+        uris, uds = bb.fetch2.build_mirroruris(fetcher, mirrors, self.d)
+        self.assertTrue(uris in table.uris.values())
+        # The urls are found in the table the second time
+        candidates = bb.fetch2.mirror_candidates(fetcher, mirrors, self.d)
+        self.assertEqual(candidates, [(uri, None) for uri in uris])
+        self.assertEqual(bb.fetch2.build_mirroruris(fetcher, mirrors, self.d)[0], uris)
+
 
 class URLHandle(unittest.TestCase):
 
@@ -188,4 +213,244 @@ class URLHandle(unittest.TestCase):
             self.assertEqual(result, k)
 
 
+class DigestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, "source.tar.gz")
+        bb.fetch2._download_digests.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def digests(self, content):
+        return {"md5" : hashlib.md5(content).hexdigest(), "sha256" : hashlib.sha256(content).hexdigest()}
+
+    def test_follower(self):
+        follower = bb.fetch2.DigestFollower(self.path)
+        follower.interval = 0.01
+        follower.start()
+        content = ""
+        with open(self.path, "wb") as f:
+            for i in range(5):
+                block = os.urandom(100000)
+                f.write(block)
+                f.flush()
+                content += block
+                time.sleep(0.02)
+        follower.finish()
+        ident, version = bb.fetch2._digests_key(os.stat(self.path))
+        self.assertEqual(bb.fetch2._download_digests[ident], (version, self.digests(content)))
 
+    def test_follower_failure(self):
+        follower = bb.fetch2.DigestFollower(self.path)
+        follower.start()
+        with open(self.path, "wb") as f:
+            f.write("partial")
+        follower.finish(False)
+        self.assertFalse(bb.fetch2._digests_key(os.stat(self.path))[0] in bb.fetch2._download_digests)
+
+    def test_verify_checksum(self):
+        class Method(object):
+            def supports_checksum(self, ud):
+                return True
+            def recommends_checksum(self, ud):
+                return True
+        class FetchData(object):
+            method = Method()
+            localpath = self.path
+            md5_expected = hashlib.md5("data").hexdigest()
+            sha256_expected = hashlib.sha256("data").hexdigest()
+
+        with open(self.path, "wb") as f:
+            f.write("data")
+        ident, version = bb.fetch2._digests_key(os.stat(self.path))
+        # Digests which don't match the file are computed again
+        bb.fetch2._download_digests[ident] = (version, self.digests("other"))
+        bb.fetch2.verify_checksum("http://example.com/source.tar.gz", FetchData(), bb.data.init())
+        self.assertEqual(bb.fetch2._download_digests[ident], (version, self.digests("data")))
+
+        FetchData.md5_expected = hashlib.md5("other").hexdigest()
+        self.assertRaises(bb.fetch2.ChecksumError, bb.fetch2.verify_checksum, "http://example.com/source.tar.gz", FetchData(), bb.data.init())
+
+class WgetTest(unittest.TestCase):
+
+    def test_head_options(self):
+        wget = bb.fetch2.wget.Wget()
+        d = bb.data.init()
+        self.assertEqual(wget.head_options(d), (2, 30.0, False))
+        d.setVar("FETCHCMD_wget", "wget --tries=5 -T5 -nv")
+        self.assertEqual(wget.head_options(d), (5, 5.0, True))
+        d.setVar("FETCHCMD_wget", "wget -t 0 --timeout 10.5")
+        self.assertEqual(wget.head_options(d), (20, 10.5, True))
+        d.setVar("FETCHCMD_wget", "wget")
+        self.assertEqual(wget.head_options(d), (20, 900.0, True))
+
+    def test_head_tries(self):
+        # Nothing listens on the port of a closed socket
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        url = "http://127.0.0.1:%d/file" % sock.getsockname()[1]
+        sock.close()
+        connections = {}
+        self.assertRaises(bb.fetch2.FetchError, bb.fetch2.wget.Wget().head, url, connections, 3, 1)
+        self.assertEqual(connections, {})
+
+class ConcurrentFetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.srvdir = os.path.join(self.tempdir, "srv")
+        self.mirrordir = os.path.join(self.tempdir, "mirror")
+        self.dldir = os.path.join(self.tempdir, "download")
+        for path in (self.srvdir, self.mirrordir, self.dldir):
+            os.mkdir(path)
+
+        self.d = bb.data.init()
+        self.d.setVar("DL_DIR", self.dldir)
+        self.d.setVar("PERSISTENT_DIR", os.path.join(self.tempdir, "persistdata"))
+        self.d.setVar("BB_NUMBER_FETCH_THREADS", "4")
+        self.d.setVar("MIRRORS", "http://.*/.* file://%s/ \n" % self.mirrordir)
+        self.origdir = os.getcwd()
+
+        # A local HTTP server which answers slowly and records how many
+        # requests it is serving at once
+        srvdir = self.srvdir
+        self.active = [0, 0]
+        active = self.active
+        lock = threading.Lock()
+        self.connections = []
+        connections = self.connections
+        class Handler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            def setup(self):
+                SimpleHTTPServer.SimpleHTTPRequestHandler.setup(self)
+                connections.append(self.client_address)
+            def translate_path(self, path):
+                return os.path.join(srvdir, path.split("?")[0].lstrip("/"))
+            def do_GET(self):
+                with lock:
+                    active[0] += 1
+                    active[1] = max(active)
+                time.sleep(0.5)
+                try:
+                    SimpleHTTPServer.SimpleHTTPRequestHandler.do_GET(self)
+                finally:
+                    with lock:
+                        active[0] -= 1
+            def log_message(self, *args):
+                pass
+        self.server = SocketServer.ThreadingTCPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def tearDown(self):
+        os.chdir(self.origdir)
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.tempdir)
+
+    def source(self, directory, name):
+        content = os.urandom(10000)
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(content)
+        self.d.setVarFlag("SRC_URI", name + ".md5sum", hashlib.md5(content).hexdigest())
+        self.d.setVarFlag("SRC_URI", name + ".sha256sum", hashlib.sha256(content).hexdigest())
+        return "%s/%s;name=%s" % (self.url, name, name)
+
+    def test_download(self):
+        urls = [self.source(self.srvdir, "source%d.tar.gz" % i) for i in range(4)]
+        urls.append(self.source(self.mirrordir, "mirrored.tar.gz"))
+        fetcher = bb.fetch2.Fetch(urls, self.d)
+        fetcher.download()
+        for u in urls:
+            ud = fetcher.ud[u]
+            self.assertTrue(os.path.exists(ud.localpath))
+            self.assertTrue(os.path.exists(ud.donestamp))
+        self.assertTrue(self.active[1] > 1)
+
+        # Nothing is downloaded from the server again
+        shutil.rmtree(self.srvdir)
+        bb.fetch2.Fetch(urls, self.d).download()
+
+    def test_errors(self):
+        urls = [self.source(self.srvdir, "source.tar.gz"), self.url + "/missing1.tar.gz",
+                self.url + "/missing2.tar.gz", self.source(self.srvdir, "corrupt.tar.gz")]
+        with open(os.path.join(self.srvdir, "corrupt.tar.gz"), "ab") as f:
+            f.write("corrupt")
+        fetcher = bb.fetch2.Fetch(urls, self.d)
+        try:
+            fetcher.download()
+            self.fail("download() did not fail")
+        except bb.fetch2.FetchError as exc:
+            lines = exc.args[0].splitlines()
+        self.assertTrue(lines[0].startswith("Unable to fetch 3 of 4 URLs:"))
+        self.assertEqual([line.split(": ")[0] for line in lines[1:]], urls[1:])
+        self.assertTrue(os.path.exists(fetcher.ud[urls[0]].donestamp))
+        for u in urls[1:]:
+            self.assertFalse(os.path.exists(fetcher.ud[u].donestamp))
+
+    def test_network_access(self):
+        urls = [self.source(self.srvdir, "source%d.tar.gz" % i) for i in range(4)]
+        self.d.setVar("BB_NO_NETWORK", "1")
+        fetcher = bb.fetch2.Fetch(urls, self.d)
+        self.assertRaises(bb.fetch2.NetworkAccess, fetcher.download)
+        # The other download processes don't outlive the error
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_events(self):
+        # The events fired in the download processes are written to the
+        # worker pipe by the parent, one at a time
+        class WorkerPipe(object):
+            def __init__(self):
+                self.events = []
+            def write(self, data):
+                self.events.append(data)
+
+        urls = [self.source(self.srvdir, "corrupt%d.tar.gz" % i) for i in range(2)]
+        for i in range(2):
+            with open(os.path.join(self.srvdir, "corrupt%d.tar.gz" % i), "ab") as f:
+                f.write("corrupt")
+        pipe = WorkerPipe()
+        handler = bb.event.LogHandler()
+        logger = logging.getLogger("BitBake.Fetcher")
+        logger.addHandler(handler)
+        saved = bb.event.worker_pid, bb.event.worker_pipe
+        bb.event.worker_pid, bb.event.worker_pipe = os.getpid(), pipe
+        try:
+            self.assertRaises(bb.fetch2.FetchError, bb.fetch2.Fetch(urls, self.d).download)
+        finally:
+            bb.event.worker_pid, bb.event.worker_pipe = saved
+            logger.removeHandler(handler)
+
+        warnings = []
+        for data in pipe.events:
+            self.assertTrue(data.startswith("<event>") and data.endswith("</event>"))
+            record = pickle.loads(data[7:-8])
+            if record.levelno == logging.WARNING:
+                warnings.append(record.getMessage())
+        self.assertEqual(len(warnings), 2)
+        self.assertTrue(all("Checksum" in warning for warning in warnings))
+
+    def test_available(self):
+        # A fake sstate cache, with half of the files on the server
+        os.mkdir(os.path.join(self.srvdir, "sstate-cache"))
+        urls = []
+        for i in range(20):
+            name = "sstate-test%d-i586-poky-linux-%032x_populate-sysroot.tgz" % (i, i)
+            if i % 2 == 0:
+                open(os.path.join(self.srvdir, "sstate-cache", name), "w").close()
+            urls.append("file://" + name)
+        self.d.setVar("PREMIRRORS", "file://.* %s/sstate-cache/PATH \n" % self.url)
+        fetcher = bb.fetch2.Fetch(urls, self.d, cache = False)
+        self.assertEqual(fetcher.available(threads = 2), urls[::2])
+        # The connections are reused for the files found
+        self.assertTrue(len(self.connections) <= 2 + len(urls[1::2]))
+        self.assertRaises(bb.fetch2.FetchError, fetcher.checkstatus, urls[1:2])
+        fetcher.checkstatus(urls[:1])
+
+        self.d.setVar("BB_NO_NETWORK", "1")
+        self.assertEqual(bb.fetch2.Fetch(urls, self.d, cache = False).available(), [])
@@ -0,0 +1,193 @@
+#
+# BitBake Tests for the parser helpers (parse/__init__.py)
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import unittest
+import tempfile
+import logging
+import os
+import bb
+import bb.parse
+
+class StatCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.classes = os.path.join(self.tempdir, "classes")
+        os.mkdir(self.classes)
+        self.bbclass = os.path.join(self.classes, "base.bbclass")
+        open(self.bbclass, "w").close()
+        os.utime(self.bbclass, (1000, 1000))
+        self.cache = bb.parse.StatCache()
+
+    def tearDown(self):
+        if self.cache.watcher:
+            self.cache.watcher.close()
+        bb.utils.prunedir(self.tempdir)
+
+    def test_mtime(self):
+        self.assertEqual(self.cache.mtime(self.bbclass), 1000)
+        self.assertEqual(self.cache.mtime(self.bbclass), 1000)
+        self.assertEqual(self.cache.mtime(os.path.join(self.classes, "missing.bbclass")), None)
+        self.assertEqual(self.cache.mtime(os.path.join(self.classes, "missing.bbclass")), None)
+        self.assertEqual((self.cache.syscalls, self.cache.avoided), (2, 2))
+
+    def test_prime(self):
+        self.cache.prime([self.tempdir, self.classes])
+        syscalls = self.cache.syscalls
+        self.assertEqual(self.cache.mtime(os.path.join(self.classes, "missing.bbclass")), None)
+        self.assertEqual(self.cache.mtime(os.path.join(self.tempdir, "conf", "bitbake.conf")), None)
+        self.assertEqual(self.cache.syscalls, syscalls)
+        # Files which are present still have to be stat()ed for their mtime
+        self.assertEqual(self.cache.mtime(self.bbclass), 1000)
+        self.assertEqual(self.cache.syscalls, syscalls + 1)
+
+    def test_refresh(self):
+        self.cache.mtime(self.bbclass)
+        os.utime(self.bbclass, (2000, 2000))
+        self.assertEqual(self.cache.mtime(self.bbclass), 1000)
+        self.cache.refresh()
+        self.assertEqual(self.cache.mtime(self.bbclass), 2000)
+
+    def test_watch(self):
+        if not self.cache.watch():
+            return
+        other = os.path.join(self.tempdir, "other.bbclass")
+        self.cache.prime([self.tempdir, self.classes])
+        self.assertEqual(self.cache.mtime(self.bbclass), 1000)
+        self.assertEqual(self.cache.mtime(other), None)
+
+        # Nothing changed, so nothing is dropped
+        self.cache.refresh()
+        syscalls = self.cache.syscalls
+        self.assertEqual(self.cache.mtime(self.bbclass), 1000)
+        self.assertEqual(self.cache.mtime(other), None)
+        self.assertEqual(self.cache.syscalls, syscalls)
+
+        os.utime(self.bbclass, (2000, 2000))
+        open(other, "w").close()
+        self.cache.refresh()
+        self.assertEqual(self.cache.mtime(self.bbclass), 2000)
+        self.assertNotEqual(self.cache.mtime(other), None)
+
+    def test_which(self):
+        bb.parse.statcache.prime([self.tempdir, self.classes])
+        path = "%s:%s" % (os.path.join(self.tempdir, "missing"), self.tempdir)
+        self.assertEqual(bb.parse.which(path, "classes/base.bbclass"), self.bbclass)
+        self.assertEqual(bb.parse.which(path, "classes/other.bbclass"), "")
+        bb.parse.statcache.clear()
+
+class StatementCacheTest(unittest.TestCase):
+
+    recipe = """
+inherit base
+SUMMARY = "test"
+EXPORT_FUNCTIONS do_compile
+python do_fetch () {
+    bb.note("fetch")
+}
+do_compile () {
+    make
+}
+"""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.recipe_fn = os.path.join(self.tempdir, "test_1.0.bb")
+        self.write(self.recipe)
+        self.d = bb.data.init()
+        self.d.setVar("CACHE", os.path.join(self.tempdir, "cache"))
+        self.cache = bb.parse.StatementCache()
+        self.cache.init_cache(self.d)
+
+    def tearDown(self):
+        self.cache.store.close()
+        bb.parse.statcache.clear()
+        bb.utils.prunedir(self.tempdir)
+
+    def write(self, content):
+        with open(self.recipe_fn, "w") as f:
+            f.write(content)
+        bb.parse.statcache.clear()
+
+    def parse(self):
+        stamp, statements = self.cache.lookup(self.recipe_fn, self.recipe_fn)
+        if statements is None:
+            log = self.cache.capture()
+            try:
+                statements = self.feed()
+            finally:
+                log.close()
+            self.cache.add(self.recipe_fn, stamp, statements, log)
+        return statements
+
+    def feed(self):
+        saved, bb.parse.statements = bb.parse.statements, bb.parse.StatementCache()
+        try:
+            return bb.parse.BBHandler.get_statements(self.recipe_fn, self.recipe_fn, "test_1.0.bb")
+        finally:
+            bb.parse.statements = saved
+            bb.parse.BBHandler.cached_statements.pop(self.recipe_fn, None)
+
+    def test_hit(self):
+        parsed = self.parse()
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+        self.cache.save_merge(self.d)
+
+        cache = bb.parse.StatementCache()
+        cache.init_cache(self.d)
+        stamp, statements = cache.lookup(self.recipe_fn, self.recipe_fn)
+        cache.store.close()
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+        self.assertEqual([type(s) for s in statements], [type(s) for s in parsed])
+        self.assertEqual(statements[1].groupd, parsed[1].groupd)
+
+        exportfuncs = [s for s in statements if isinstance(s, bb.parse.ast.ExportFuncsNode)]
+        self.assertTrue(exportfuncs[0].classes is bb.parse.BBHandler.classes)
+
+    def test_messages(self):
+        self.write(self.recipe + 'DEPENDS = "a \\\n# b \\\n c"\n')
+        log = bb.parse.FeederLog()
+        self.parse()
+        log.close()
+        self.assertEqual(len(log.messages), 1)
+        self.assertTrue("middle of a multiline expression" in log.messages[0][2])
+        self.cache.save_merge(self.d)
+
+        cache = bb.parse.StatementCache()
+        cache.init_cache(self.d)
+        log = bb.parse.FeederLog()
+        cache.lookup(self.recipe_fn, self.recipe_fn)
+        log.close()
+        cache.store.close()
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(log.messages, [("BitBake", logging.ERROR, log.messages[0][2])])
+
+    def test_changed(self):
+        self.parse()
+        self.cache.save_merge(self.d)
+        self.write(self.recipe + 'DESCRIPTION = "changed"\n')
+        self.assertEqual(self.parse()[-1].groupd["var"], "DESCRIPTION")
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+    def test_removed(self):
+        self.parse()
+        self.cache.save_merge(self.d)
+        self.assertTrue(self.recipe_fn in self.cache.store)
+        os.unlink(self.recipe_fn)
+        bb.parse.statcache.clear()
+        self.cache.save_merge(self.d)
+        self.assertFalse(self.recipe_fn in self.cache.store)
@@ -0,0 +1,142 @@
+#
+# BitBake Tests for persist_data.py
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import unittest
+import tempfile
+import shutil
+import os
+import multiprocessing
+import bb
+import bb.data
+import bb.persist_data
+
+def stress(d, worker, iterations):
+    for i in xrange(iterations):
+        table = bb.persist_data.persist("BB_STRESS", d)
+        with table:
+            table["counter"] = str(int(table.get("counter", "0")) + 1)
+        table["%d-%d" % (worker, i)] = str(i)
+        if i:
+            assert table["%d-%d" % (worker, i - 1)] == str(i - 1)
+            assert "%d-%d" % (worker, i - 1) in table
+
+class PersistDataTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.d = bb.data.init()
+        self.d.setVar("PERSISTENT_DIR", self.tempdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_mapping(self):
+        table = bb.persist_data.persist("BB_TEST", self.d)
+        table["a"] = "1"
+        table["b"] = "2"
+        table["a"] = "3"
+        self.assertEqual(table["a"], "3")
+        self.assertTrue("b" in table)
+        self.assertFalse("c" in table)
+        self.assertRaises(KeyError, table.__getitem__, "c")
+        self.assertEqual(len(table), 2)
+        self.assertEqual(sorted(table.items()), [("a", "3"), ("b", "2")])
+        del table["a"]
+        self.assertRaises(KeyError, table.__delitem__, "a")
+        self.assertEqual(list(table), ["b"])
+        self.assertRaises(TypeError, table.__setitem__, "c", 1)
+
+    def test_update(self):
+        table = bb.persist_data.persist("BB_TEST", self.d)
+        table["a"] = "1"
+        table.update(("key%d" % i, str(i)) for i in xrange(100))
+        table.update(a = "2")
+        self.assertEqual(len(table), 101)
+        self.assertEqual(table["a"], "2")
+        self.assertEqual(table["key99"], "99")
+        self.assertRaises(TypeError, table.update, {"b" : None})
+        self.assertFalse("b" in table)
+
+    def test_transaction(self):
+        table = bb.persist_data.persist("BB_TEST", self.d)
+        other = bb.persist_data.SQLTable(table.cachefile, "BB_TEST")
+        table["a"] = "1"
+        try:
+            with table:
+                table["a"] = "2"
+                table["b"] = "2"
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(table["a"], "1")
+        self.assertFalse("b" in table)
+
+        # Changes made through another connection are seen
+        other["a"] = "3"
+        self.assertEqual(table["a"], "3")
+
+    def test_no_data_version(self):
+        # Without data_version the values are always read from the database
+        saved = bb.persist_data.has_data_version
+        bb.persist_data.has_data_version = False
+        try:
+            table = bb.persist_data.persist("BB_TEST", self.d)
+            other = bb.persist_data.SQLTable(table.cachefile, "BB_TEST")
+            table["a"] = "1"
+            self.assertEqual(table["a"], "1")
+            other["a"] = "2"
+            self.assertEqual(table["a"], "2")
+            del other["a"]
+            self.assertFalse("a" in table)
+        finally:
+            bb.persist_data.has_data_version = saved
+
+    def test_persist(self):
+        table = bb.persist_data.persist("BB_TEST", self.d)
+        table["a"] = "1"
+        self.assertTrue(bb.persist_data.persist("BB_TEST", self.d) is table)
+        self.assertFalse(bb.persist_data.persist("BB_OTHER", self.d) is table)
+
+        # A new database is opened if the file is replaced
+        os.unlink(table.cachefile)
+        table = bb.persist_data.persist("BB_TEST", self.d)
+        self.assertFalse("a" in table)
+
+    def test_old_table(self):
+        cachefile = os.path.join(self.tempdir, "bb_persist_data.sqlite3")
+        connection = bb.persist_data.connect(cachefile)
+        connection.execute("CREATE TABLE BB_TEST(key TEXT, value TEXT);")
+        connection.executemany("INSERT INTO BB_TEST(key, value) VALUES (?, ?);", [("a", "1"), ("b", "2"), ("a", "3")])
+        connection.close()
+
+        table = bb.persist_data.persist("BB_TEST", self.d)
+        self.assertEqual(sorted(table.items()), [("a", "3"), ("b", "2")])
+        table["b"] = "4"
+        self.assertEqual(sorted(table.items()), [("a", "3"), ("b", "4")])
+
+    def test_concurrency(self):
+        processes = [multiprocessing.Process(target = stress, args = (self.d, worker, 50)) for worker in range(8)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+            self.assertEqual(p.exitcode, 0)
+
+        table = bb.persist_data.persist("BB_STRESS", self.d)
+        self.assertEqual(table["counter"], str(8 * 50))
+        self.assertEqual(len(table), 8 * 50 + 1)
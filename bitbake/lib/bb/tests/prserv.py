@@ -0,0 +1,77 @@
+#
+# BitBake Tests for the PR service
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+from __future__ import absolute_import
+import unittest
+import tempfile
+import shutil
+import os
+import prserv.db
+import prserv.serv
+
+class PRTableTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def table(self, nohist):
+        self.db = prserv.db.PRData(os.path.join(self.tempdir, "prserv.sqlite3"), nohist)
+        return self.db["PRMAIN"]
+
+    def test_nohist(self):
+        table = self.table(True)
+        self.assertEqual(table.getValue("1.0-r0", "i586", "a"), 0)
+        self.assertEqual(table.getValues([("1.0-r0", "i586", "a"), ("1.0-r0", "i586", "b"),
+                                          ("1.0-r0", "x86_64", "a"), ("1.0-r0", "i586", "b")]), [0, 1, 0, 1])
+        # Going back to an older checksum gives a new value
+        self.assertEqual(table.getValues([("1.0-r0", "i586", "a")]), [2])
+
+    def test_hist(self):
+        table = self.table(False)
+        self.assertEqual(table.getValues([("1.0-r0", "i586", "a"), ("1.0-r0", "i586", "b")]), [0, 1])
+        self.assertEqual(table.getValue("1.0-r0", "i586", "a"), 0)
+
+class PRServerTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.server = prserv.serv.PRServSingleton(os.path.join(self.tempdir, "prserv.sqlite3"),
+                                                  os.path.join(self.tempdir, "prserv.log"), ("localhost", 0))
+        self.server.start()
+        self.host, self.port = self.server.getinfo()
+
+    def tearDown(self):
+        prserv.serv.PRServerConnection(self.host, self.port).terminate()
+        self.server.working_thread.join()
+        shutil.rmtree(self.tempdir)
+
+    def test_getPRs(self):
+        conn = prserv.serv.PRServerConnection(self.host, self.port)
+        items = [("1.0-r0", "i586", "a"), ("1.0-r0", "i586", "b"), ("2.0-r0", "i586", "a")]
+        self.assertEqual(conn.getPRs(items), [0, 1, 0])
+        self.assertEqual(conn.getPR("1.0-r0", "i586", "b"), 1)
+        self.assertEqual(conn.getPR("1.0-r0", "i586", "c"), 2)
+
+        other = prserv.serv.PRServerConnection(self.host, self.port)
+        self.assertEqual(other.getPRs([list(item) for item in items]), [2 + 1, 2 + 2, 0])
+        # Asking for a checksum again after another one gives a new value
+        # in nohist mode
+        self.assertEqual(conn.getPRs(items), [5, 6, 0])
+        self.assertEqual(conn.getPR("1.0-r0", "i586", "a"), 7)
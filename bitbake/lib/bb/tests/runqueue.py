@@ -0,0 +1,629 @@
+#
+# BitBake Tests for runqueue.py
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import unittest
+import hashlib
+import random
+import os
+import select
+import signal
+import shutil
+import tempfile
+import time
+import bb
+import bb.data
+import bb.parse
+import bb.runqueue
+import bb.siggen
+
+class TaskData(object):
+    def __init__(self):
+        self.fn_index = []
+
+class DataCache(object):
+    def __init__(self):
+        self.basetaskhash = {}
+        self.pkg_fn = {}
+        self.file_checksums = {}
+        self.stamp = {}
+        self.stamp_base = {}
+        self.stamp_extrainfo = {}
+        self.task_deps = {}
+
+tasknames = ["do_fetch", "do_unpack", "do_patch", "do_configure", "do_compile",
+             "do_install", "do_populate_sysroot", "do_package", "do_build"]
+
+def make_rqdata(recipes, seed, reverse = False):
+    """
+    Set up the task graph of a number of recipes, each with a chain of
+    tasks and do_configure depending on the do_populate_sysroot of some of
+    the previous recipes, the way RunQueueData.prepare() leaves it. The
+    task ids are shuffled, or if reverse is set, in reverse dependency
+    order as taskdata tends to number them.
+    """
+    rand = random.Random(seed)
+    taskData = TaskData()
+    dataCache = DataCache()
+    rqdata = bb.runqueue.RunQueueData(None, None, bb.data.init(), dataCache, taskData, [])
+    for fnid in xrange(recipes):
+        fn = "/meta/recipes/recipe%d/recipe%d_1.0.bb" % (fnid, fnid)
+        if fnid % 7 == 3:
+            fn = "virtual:native:" + fn
+        taskData.fn_index.append(fn)
+        dataCache.pkg_fn[fn] = "recipe%d" % fnid
+        dataCache.file_checksums[fn] = {}
+        dataCache.stamp[fn] = "/nonexistent/stamps/recipe%d" % fnid
+        dataCache.stamp_base[fn] = {}
+        dataCache.stamp_extrainfo[fn] = {}
+        dataCache.task_deps[fn] = {}
+        for i, taskname in enumerate(tasknames):
+            task = len(rqdata.runq_fnid)
+            rqdata.runq_fnid.append(fnid)
+            rqdata.runq_task.append(taskname)
+            rqdata.runq_depends.append(set())
+            rqdata.runq_revdeps.append(set())
+            rqdata.runq_hash.append(None)
+            dataCache.basetaskhash[fn + "." + taskname] = hashlib.md5(fn + taskname).hexdigest()
+            if i:
+                rqdata.runq_depends[task].add(task - 1)
+            if taskname == "do_configure" and fnid:
+                for dep in rand.sample(xrange(fnid), min(fnid, 4)):
+                    rqdata.runq_depends[task].add(dep * len(tasknames) + tasknames.index("do_populate_sysroot"))
+    # Renumber the tasks so they aren't in dependency order
+    order = range(len(rqdata.runq_fnid))
+    if reverse:
+        order.reverse()
+    else:
+        rand.shuffle(order)
+    remap = dict((old, new) for new, old in enumerate(order))
+    rqdata.runq_fnid = [rqdata.runq_fnid[old] for old in order]
+    rqdata.runq_task = [rqdata.runq_task[old] for old in order]
+    rqdata.runq_depends = [set(remap[dep] for dep in rqdata.runq_depends[old]) for old in order]
+    for task, deps in enumerate(rqdata.runq_depends):
+        for dep in deps:
+            rqdata.runq_revdeps[dep].add(task)
+    return rqdata
+
+def reference_task_hashes(rqdata):
+    """The loop RunQueueData.prepare() used before compute_task_hashes()"""
+    dealtwith = set()
+    todeal = set(range(len(rqdata.runq_fnid)))
+    while len(todeal) > 0:
+        for task in todeal.copy():
+            if len(rqdata.runq_depends[task] - dealtwith) == 0:
+                dealtwith.add(task)
+                todeal.remove(task)
+                procdep = []
+                for dep in rqdata.runq_depends[task]:
+                    procdep.append(rqdata.taskData.fn_index[rqdata.runq_fnid[dep]] + "." + rqdata.runq_task[dep])
+                rqdata.runq_hash[task] = bb.parse.siggen.get_taskhash(rqdata.taskData.fn_index[rqdata.runq_fnid[task]], rqdata.runq_task[task], procdep, rqdata.dataCache)
+
+class SchedulerRunQueue(object):
+    """The parts of RunQueueExecuteTasks the schedulers look at"""
+    def __init__(self, rqdata, limits = {}):
+        numTasks = len(rqdata.runq_fnid)
+        self.cfgData = bb.data.init()
+        self.runq_buildable = [0] * numTasks
+        self.runq_running = [0] * numTasks
+        self.build_stamps2 = set()
+        self.resources = bb.runqueue.RunQueueResources(rqdata.dataCache, limits)
+        self.stats = bb.runqueue.RunQueueStats(numTasks)
+        self.number_tasks = numTasks
+        for task in xrange(numTasks):
+            if not rqdata.runq_depends[task]:
+                self.runq_buildable[task] = 1
+
+def set_task_weights(rqdata):
+    endpoints = [task for task in xrange(len(rqdata.runq_fnid)) if not rqdata.runq_revdeps[task]]
+    rqdata.runq_weight = rqdata.calculate_task_weights(endpoints)
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.siggen = getattr(bb.parse, "siggen", None)
+        bb.parse.siggen = bb.siggen.SignatureGenerator(bb.data.init())
+
+    def tearDown(self):
+        bb.parse.siggen = self.siggen
+
+    def complete(self, rq, rqdata, task):
+        """Complete a task the way RunQueueExecuteTasks.task_completeoutright() does"""
+        rq.runq_running[task] = 1
+        for revdep in rqdata.runq_revdeps[task]:
+            if rq.runq_buildable[revdep]:
+                continue
+            if all(rq.runq_running[dep] for dep in rqdata.runq_depends[revdep]):
+                rq.runq_buildable[revdep] = 1
+                rq.scheduler.newbuildable(revdep)
+
+    def reference_next(self, rq, scheduler):
+        """The linear scan of the priority map the schedulers used to do"""
+        for task in scheduler.prio_map:
+            if rq.runq_running[task] == 1 or rq.runq_buildable[task] != 1:
+                continue
+            if scheduler.stampfile(task) in rq.build_stamps2:
+                continue
+            return task
+
+    def test_order(self):
+        rqdata = make_rqdata(40, 3)
+        set_task_weights(rqdata)
+        for cls in (bb.runqueue.RunQueueScheduler, bb.runqueue.RunQueueSchedulerSpeed,
+                    bb.runqueue.RunQueueSchedulerCompletion):
+            rq = SchedulerRunQueue(rqdata)
+            rq.scheduler = cls(rq, rqdata)
+            order = []
+            while True:
+                task = rq.scheduler.next()
+                expected = self.reference_next(rq, rq.scheduler)
+                self.assertEqual(task, expected)
+                if task is None:
+                    break
+                order.append(task)
+                self.complete(rq, rqdata, task)
+            self.assertEqual(sorted(order), range(len(rqdata.runq_fnid)))
+
+    def test_shared_stamp(self):
+        rqdata = make_rqdata(5, 4)
+        set_task_weights(rqdata)
+        rq = SchedulerRunQueue(rqdata)
+        scheduler = bb.runqueue.RunQueueSchedulerSpeed(rq, rqdata)
+        first = scheduler.next()
+
+        # A task sharing its stamp with a running task is held back, and
+        # comes back once that task is done
+        rq.build_stamps2.add(scheduler.stampfile(first))
+        second = scheduler.next()
+        self.assertNotEqual(second, first)
+        rq.runq_running[second] = 1
+        rq.build_stamps2.clear()
+        self.assertEqual(scheduler.next(), first)
+
+class TaskHashTest(unittest.TestCase):
+    def setUp(self):
+        self.siggen = getattr(bb.parse, "siggen", None)
+        bb.parse.siggen = bb.siggen.SignatureGeneratorBasicHash(bb.data.init())
+
+    def tearDown(self):
+        bb.parse.siggen = self.siggen
+
+    def test_same_hashes(self):
+        rqdata = make_rqdata(60, 1)
+        reference_task_hashes(rqdata)
+        expected = list(rqdata.runq_hash)
+        expected_runtaskdeps = bb.parse.siggen.runtaskdeps
+
+        bb.parse.siggen = bb.siggen.SignatureGeneratorBasicHash(bb.data.init())
+        rqdata.runq_hash = [None] * len(rqdata.runq_fnid)
+        rqdata.compute_task_hashes()
+        self.assertEqual(rqdata.runq_hash, expected)
+        self.assertEqual(bb.parse.siggen.runtaskdeps, expected_runtaskdeps)
+        self.assertEqual(len(set(rqdata.runq_hash)), len(rqdata.runq_hash))
+
+        for task in xrange(len(rqdata.runq_fnid)):
+            identifier = "%s.%s" % (rqdata.taskData.fn_index[rqdata.runq_fnid[task]], rqdata.runq_task[task])
+            self.assertEqual(rqdata.hashes[identifier], expected[task])
+            self.assertEqual(len(rqdata.hash_deps[identifier]), len(rqdata.runq_depends[task]))
+
+    def test_dependency_change(self):
+        rqdata = make_rqdata(20, 2)
+        rqdata.compute_task_hashes()
+        before = list(rqdata.runq_hash)
+
+        # Changing the base hash of one task changes the hashes of all the
+        # tasks depending on it, directly or not, and only those
+        task = rqdata.runq_task.index("do_populate_sysroot")
+        fn = rqdata.taskData.fn_index[rqdata.runq_fnid[task]]
+        rqdata.dataCache.basetaskhash[fn + ".do_populate_sysroot"] = "0" * 32
+        affected = set([task])
+        todo = [task]
+        while todo:
+            for revdep in rqdata.runq_revdeps[todo.pop()]:
+                if revdep not in affected:
+                    affected.add(revdep)
+                    todo.append(revdep)
+
+        bb.parse.siggen = bb.siggen.SignatureGeneratorBasicHash(bb.data.init())
+        rqdata.compute_task_hashes()
+        for task in xrange(len(rqdata.runq_fnid)):
+            self.assertEqual(rqdata.runq_hash[task] != before[task], task in affected)
+
+class Configuration(object):
+    dry_run = False
+
+class Cooker(object):
+    def __init__(self, data):
+        self.configuration = Configuration()
+        self.configuration.data = data
+
+    def get_file_appends(self, fn):
+        return []
+
+class RunQueue(object):
+    def __init__(self, cooker):
+        self.cooker = cooker
+        self.cfgData = cooker.configuration.data
+        self.state = None
+        self.workerpool = None
+
+class RunQueueData(object):
+    def __init__(self, tasks):
+        self.hashes = {}
+        self.hash_deps = {}
+        self.runq_hash = ["hash%d" % task for task in xrange(tasks)]
+
+class RunQueueExecute(bb.runqueue.RunQueueExecute):
+    def __init__(self, rq, tasks):
+        self.rq = rq
+        self.cooker = rq.cooker
+        self.cfgData = rq.cfgData
+        self.rqdata = RunQueueData(tasks)
+        self.stats = bb.runqueue.RunQueueStats(tasks)
+        self.build_pids = {}
+        self.build_pipes = {}
+        self.failed_fnids = []
+
+recipe = """
+T = "${TOPDIR}/temp"
+B = "${TOPDIR}/build"
+STAMP = "${TOPDIR}/stamps/test"
+
+python do_test () {
+    import os
+    f = open(d.expand("${TOPDIR}/ran-${BB_TASKHASH}"), "w")
+    f.write(os.environ.get("BB_TEST_ENV", ""))
+    f.close()
+}
+addtask test
+
+python do_fail () {
+    bb.fatal("do_fail failed")
+}
+addtask fail
+
+do_sleep () {
+    sleep 60
+}
+addtask sleep
+"""
+
+class WorkerPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.tempdir, "test_1.0.bb")
+        with open(self.fn, "w") as f:
+            f.write(recipe)
+        d = bb.data.init()
+        d.setVar("TOPDIR", self.tempdir)
+        d.setVar("BBPATH", self.tempdir)
+        d.setVar("BB_WORKER_POOL_CACHE", "2")
+        self.rq = RunQueue(Cooker(d))
+        self.rqexe = RunQueueExecute(self.rq, 4)
+        self.pool = bb.runqueue.RunQueueWorkerPool(self.rq, 2)
+        self.siggen = getattr(bb.parse, "siggen", None)
+        bb.parse.siggen = bb.siggen.SignatureGenerator(d)
+
+    def tearDown(self):
+        self.pool.shutdown()
+        bb.parse.siggen = self.siggen
+        shutil.rmtree(self.tempdir)
+
+    def run_task(self, task, taskname, fakeenv = {}, fn = None):
+        pid, pipe = self.pool.run_task(self.rqexe, fn or self.fn, task, taskname, None, fakeenv, True)
+        end = time.time() + 30
+        while time.time() < end:
+            pipe.read()
+            result = self.pool.collect()
+            if result is not None:
+                pipe.close()
+                self.assertEqual(result[0], pid)
+                return result
+            select.select(self.pool.result_fds() + [pipe.input], [], [], 0.1)
+        self.fail("%s did not finish" % taskname)
+
+    def ran(self, task):
+        path = os.path.join(self.tempdir, "ran-hash%d" % task)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return f.read()
+
+    def test_dispatch(self):
+        pid, status = self.run_task(0, "do_test", {"BB_TEST_ENV" : "fakeroot"})
+        self.assertEqual(status, 0)
+        self.assertEqual(self.ran(0), "fakeroot")
+
+        # The next task of the recipe goes to the worker which has it parsed
+        self.assertEqual(self.run_task(1, "do_test"), (pid, 0))
+        self.assertEqual(self.ran(1), "")
+        self.assertEqual((self.pool.hits, self.pool.misses), (1, 1))
+        self.assertEqual(len(self.pool.workers), 1)
+
+    def test_failure(self):
+        pid, status = self.run_task(0, "do_fail")
+        self.assertNotEqual(status, 0)
+
+        # The worker survives the failure of its task
+        self.assertEqual(self.run_task(1, "do_test"), (pid, 0))
+        self.assertEqual(self.ran(1), "")
+
+    def test_parse_failure(self):
+        broken = os.path.join(self.tempdir, "broken_1.0.bb")
+        with open(broken, "w") as f:
+            f.write("inherit nonexistent\n")
+        pid, status = self.run_task(0, "do_test", fn = broken)
+        self.assertNotEqual(status, 0)
+
+        # The recipe which failed to parse isn't taken for cached, so its
+        # tasks aren't sent to that worker for it
+        self.assertEqual([worker.cached for worker in self.pool.workers], [[]])
+        pid, status = self.run_task(1, "do_test")
+        self.assertEqual(status, 0)
+        cached = dict((worker.pid, [key[0] for key in worker.cached]) for worker in self.pool.workers)
+        self.assertEqual(cached[pid], [self.fn])
+
+    def test_shutdown(self):
+        pid, status = self.run_task(0, "do_test")
+        self.pool.shutdown()
+        self.assertEqual(self.pool.workers, [])
+        self.assertRaises(OSError, os.kill, pid, 0)
+
+    def test_finish_now(self):
+        self.rq.workerpool = self.pool
+        pid, pipe = self.pool.run_task(self.rqexe, self.fn, 0, "do_sleep", None, {}, True)
+        self.rqexe.build_pids[pid] = 0
+        self.rqexe.build_pipes[pid] = pipe
+        self.rqexe.stats.taskActive()
+        time.sleep(0.5)
+
+        start = time.time()
+        self.rqexe.finish_now()
+        self.assertTrue(time.time() - start < 30)
+        self.assertEqual(self.rq.state, bb.runqueue.runQueueComplete)
+        self.assertEqual(self.rqexe.build_pipes, {})
+        self.assertEqual(self.pool.workers, [])
+        self.assertRaises(OSError, os.kill, pid, 0)
+
+class WakeupTest(unittest.TestCase):
+    def setUp(self):
+        self.wakeup = bb.runqueue.runQueueWakeup()
+
+    def tearDown(self):
+        self.wakeup.close()
+
+    def child(self, delay):
+        pid = os.fork()
+        if pid == 0:
+            time.sleep(delay)
+            os._exit(0)
+        return pid
+
+    def test_child_exit(self):
+        pid = self.child(0.2)
+        start = time.time()
+        self.wakeup.wait([], 10)
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(os.waitpid(pid, 0)[0], pid)
+
+    def test_exited_before_wait(self):
+        # A child which exits before the runqueue goes to sleep still
+        # wakes it up
+        pid = self.child(0)
+        time.sleep(0.5)
+        start = time.time()
+        self.wakeup.wait([], 10)
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(os.waitpid(pid, 0)[0], pid)
+
+        # Once drained the pipe doesn't wake anything up
+        start = time.time()
+        self.wakeup.wait([], 0.2)
+        self.assertTrue(time.time() - start >= 0.2)
+
+    def test_close(self):
+        wakeup = bb.runqueue.runQueueWakeup()
+        wakeup.close()
+        self.assertEqual(signal.set_wakeup_fd(-1), self.wakeup.writefd)
+        signal.set_wakeup_fd(self.wakeup.writefd)
+
+def make_graph(tasks):
+    """
+    Set up the task graph of a list of (pn, taskname, dependency indexes)
+    """
+    taskData = TaskData()
+    dataCache = DataCache()
+    rqdata = bb.runqueue.RunQueueData(None, None, bb.data.init(), dataCache, taskData, [])
+    for pn, taskname, deps in tasks:
+        fn = "/meta/recipes/%s/%s_1.0.bb" % (pn, pn)
+        if fn not in taskData.fn_index:
+            taskData.fn_index.append(fn)
+            dataCache.pkg_fn[fn] = pn
+            dataCache.stamp[fn] = "/nonexistent/stamps/" + pn
+            dataCache.stamp_base[fn] = {}
+            dataCache.stamp_extrainfo[fn] = {}
+            dataCache.task_deps[fn] = {}
+        rqdata.runq_fnid.append(taskData.fn_index.index(fn))
+        rqdata.runq_task.append(taskname)
+        rqdata.runq_depends.append(set(deps))
+        rqdata.runq_revdeps.append(set())
+    for task, deps in enumerate(rqdata.runq_depends):
+        for dep in deps:
+            rqdata.runq_revdeps[dep].add(task)
+    set_task_weights(rqdata)
+    return rqdata
+
+class CriticalPathTest(unittest.TestCase):
+    # A long chain of two tasks and a short task many others depend on,
+    # which the speed scheduler starts first for its weight
+    tasks = [("long", "do_configure", []),
+             ("long", "do_compile", [0]),
+             ("short", "do_configure", []),
+             ("short", "do_compile", [2]),
+             ("short", "do_install", [2]),
+             ("short", "do_package", [2])]
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.siggen = getattr(bb.parse, "siggen", None)
+        bb.parse.siggen = bb.siggen.SignatureGenerator(bb.data.init())
+
+    def tearDown(self):
+        bb.parse.siggen = self.siggen
+        shutil.rmtree(self.tempdir)
+
+    def buildstats(self, build, pf, taskname, elapsed):
+        path = os.path.join(self.tempdir, build, pf)
+        bb.utils.mkdirhier(path)
+        with open(os.path.join(path, taskname), "w") as f:
+            f.write("Event: TaskStarted\nStarted: 1000.00\n")
+            f.write("%s: %s: Elapsed time: %.2f seconds\n" % (pf, taskname, elapsed))
+            f.write("Status: PASSED\n")
+
+    def test_read_buildstats(self):
+        self.buildstats("201201010000", "long-1.0-r0", "do_compile", 98)
+        self.buildstats("201201020000", "long-1.0-r1", "do_compile", 102)
+        self.buildstats("201201020000", "short-name-2.0-r0", "do_configure", 3)
+        self.assertEqual(bb.runqueue.read_buildstats([self.tempdir]),
+                         { ("long", "do_compile") : 100.0, ("short-name", "do_configure") : 3.0 })
+
+    def test_expected_durations(self):
+        rqdata = make_graph(self.tasks)
+        durations = { ("long", "do_compile") : 100.0, ("other", "do_compile") : 20.0,
+                      ("short", "do_configure") : 1.0 }
+        # Tasks without a duration take as long as the average task of the
+        # same name, or nothing if there is none
+        self.assertEqual(bb.runqueue.expected_task_durations(rqdata, durations),
+                         [1.0, 100.0, 1.0, 60.0, 0.0, 0.0])
+
+    def test_order(self):
+        rqdata = make_graph(self.tasks)
+        rq = SchedulerRunQueue(rqdata)
+        self.assertEqual(bb.runqueue.RunQueueSchedulerSpeed(rq, rqdata).next(), 2)
+
+        # Without any history the weights decide
+        rq.cfgData.setVar("BB_TASK_DURATIONS", self.tempdir)
+        self.assertEqual(bb.runqueue.RunQueueSchedulerCriticalPath(rq, rqdata).next(), 2)
+
+        self.buildstats("201201010000", "long-1.0-r0", "do_configure", 10)
+        self.buildstats("201201010000", "long-1.0-r0", "do_compile", 100)
+        self.buildstats("201201010000", "short-1.0-r0", "do_compile", 5)
+        scheduler = bb.runqueue.RunQueueSchedulerCriticalPath(rq, rqdata)
+        self.assertEqual(scheduler.runq_path[:4], [110.0, 100.0, 15.0, 5.0])
+        self.assertEqual(scheduler.next(), 0)
+
+class ResourcesTest(unittest.TestCase):
+    tasks = [("big", "do_compile", []),
+             ("big", "do_install", [0]),
+             ("small", "do_compile", []),
+             ("io", "do_install", [])]
+
+    def setUp(self):
+        self.siggen = getattr(bb.parse, "siggen", None)
+        bb.parse.siggen = bb.siggen.SignatureGenerator(bb.data.init())
+        self.rqdata = make_graph(self.tasks)
+        task_deps = self.rqdata.dataCache.task_deps
+        task_deps["/meta/recipes/big/big_1.0.bb"].update({ "cpu" : { "do_compile" : "4" },
+                                                           "mem" : { "do_compile" : "2048" } })
+        task_deps["/meta/recipes/io/io_1.0.bb"].update({ "io" : { "do_install" : "1" },
+                                                         "cpu" : { "do_install" : "many" } })
+
+    def tearDown(self):
+        bb.parse.siggen = self.siggen
+
+    def test_usage(self):
+        resources = bb.runqueue.RunQueueResources(self.rqdata.dataCache, {})
+        self.assertEqual(resources.usage("/meta/recipes/big/big_1.0.bb", "do_compile"),
+                         { "cpu" : 4.0, "mem" : 2048.0, "io" : 0.0 })
+        self.assertEqual(resources.usage("/meta/recipes/big/big_1.0.bb", "do_install"),
+                         { "cpu" : 1.0, "mem" : 0.0, "io" : 0.0 })
+        # Invalid values are ignored
+        self.assertEqual(resources.usage("/meta/recipes/io/io_1.0.bb", "do_install"),
+                         { "cpu" : 1.0, "mem" : 0.0, "io" : 1.0 })
+        # Usage is capped at the budgets
+        resources = bb.runqueue.RunQueueResources(self.rqdata.dataCache, { "cpu" : 2.0 })
+        self.assertEqual(resources.usage("/meta/recipes/big/big_1.0.bb", "do_compile"),
+                         { "cpu" : 2.0, "mem" : 2048.0, "io" : 0.0 })
+
+    def test_from_config(self):
+        d = bb.data.init()
+        d.setVar("BB_RESOURCE_CPU", "8")
+        d.setVar("BB_RESOURCE_IO", "2")
+        resources = bb.runqueue.RunQueueResources.from_config(self.rqdata.dataCache, d)
+        self.assertEqual(resources.limits, { "cpu" : 8.0, "io" : 2.0 })
+
+    def test_fits(self):
+        resources = bb.runqueue.RunQueueResources(self.rqdata.dataCache, { "cpu" : 4.0, "io" : 1.0 })
+        big = { "cpu" : 4.0, "mem" : 0.0, "io" : 0.0 }
+        small = { "cpu" : 1.0, "mem" : 0.0, "io" : 0.0 }
+        io = { "cpu" : 1.0, "mem" : 0.0, "io" : 1.0 }
+
+        # A task taking the whole budget only runs on its own
+        self.assertTrue(resources.fits(big))
+        resources.acquire(0, big)
+        self.assertFalse(resources.fits(small))
+        resources.release(0)
+
+        resources.acquire(1, io)
+        self.assertTrue(resources.fits(small))
+        self.assertFalse(resources.fits(io))
+        self.assertFalse(resources.fits(small, big))
+        self.assertTrue(resources.fits(small, small))
+        resources.acquire(2, small)
+        self.assertEqual(resources.occupancy(), { "cpu" : (2.0, 4.0), "mem" : (0.0, None), "io" : (1.0, 1.0) })
+        resources.release(1)
+        self.assertEqual(resources.occupancy()["cpu"], (1.0, 4.0))
+        resources.release(2)
+        self.assertEqual(resources.active, {})
+        self.assertEqual(resources.occupancy()["cpu"], (0.0, 4.0))
+
+    def test_admission(self):
+        rq = SchedulerRunQueue(self.rqdata, { "cpu" : 4.0, "io" : 1.0 })
+        scheduler = bb.runqueue.RunQueueScheduler(rq, self.rqdata)
+
+        def start(task):
+            rq.runq_running[task] = 1
+            rq.resources.acquire(task, scheduler.task_usage(task))
+
+        # do_compile of big takes the whole cpu budget, the other tasks
+        # wait for it
+        self.assertEqual(scheduler.next(), 0)
+        start(0)
+        self.assertEqual(scheduler.next(), None)
+        rq.resources.release(0)
+
+        self.assertEqual(scheduler.next(), 2)
+        start(2)
+        self.assertEqual(scheduler.next(), 3)
+        start(3)
+        rq.runq_buildable[1] = 1
+        scheduler.newbuildable(1)
+        self.assertEqual(scheduler.next(), 1)
+        start(1)
+        self.assertEqual(scheduler.next(), None)
+
+    def test_reservation(self):
+        rq = SchedulerRunQueue(self.rqdata, { "cpu" : 4.0, "io" : 1.0 })
+        scheduler = bb.runqueue.RunQueueScheduler(rq, self.rqdata)
+
+        # Once do_compile of big is blocked, the lower priority tasks don't
+        # start ahead of it even though they would fit
+        rq.runq_running[2] = 1
+        rq.resources.acquire(2, rq.resources.usage("/meta/recipes/small/small_1.0.bb", "do_compile"))
+        self.assertEqual(scheduler.next(), None)
+        rq.resources.release(2)
+        self.assertEqual(scheduler.next(), 0)
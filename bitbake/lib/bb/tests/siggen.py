@@ -0,0 +1,102 @@
+#
+# BitBake Tests for siggen.py
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+
+import unittest
+import tempfile
+import shutil
+import os
+import bb
+import bb.data
+import bb.siggen
+
+def sigdata(value, dephash):
+    return {
+        'basewhitelist' : set(["TMPDIR", "FILE"]),
+        'taskwhitelist' : None,
+        'taskdeps' : ["CC", "do_compile"],
+        'basehash' : "b" * 32,
+        'gendeps' : {"CC" : set(), "do_compile" : set(["CC"])},
+        'varvals' : {"do_compile" : value, "CC" : "gcc", "do_build" : None},
+        'runtaskdeps' : ["/meta/foo_1.0.bb.do_configure"],
+        'file_checksum_values' : {},
+        'runtaskhashes' : {"/meta/foo_1.0.bb.do_configure" : dephash},
+    }
+
+class SignatureStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.store = bb.siggen.SignatureStore(os.path.join(self.tempdir, "signatures", "sigstore.sqlite3"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def pieces(self):
+        self.store._connect()
+        return self.store._execute("SELECT COUNT(*) FROM pieces;").fetchone()[0]
+
+    def test_get(self):
+        data = sigdata("oe_runmake", "1" * 32)
+        self.store.add([("a" * 32, "/meta/foo_1.0.bb", "do_compile", "sigdata", data)])
+        self.assertEqual(self.store.get("a" * 32), data)
+        self.assertEqual(self.store.get("a" * 32, "/meta/foo_1.0.bb", "do_compile"), data)
+        self.assertEqual(self.store.get("a" * 32, "/meta/bar_1.0.bb"), None)
+        self.assertEqual(self.store.get("c" * 32), None)
+
+    def test_deduplication(self):
+        self.store.add([("a" * 32, "/meta/foo_1.0.bb", "do_compile", "sigdata", sigdata("oe_runmake", "1" * 32))])
+        pieces = self.pieces()
+        # Only the changed value and dependent task hash, and the lists of
+        # the varvals and runtaskhashes pieces are new
+        changed = sigdata("oe_runmake all", "2" * 32)
+        self.store.add([("c" * 32, "/meta/foo_1.0.bb", "do_compile", "sigdata", changed),
+                        ("d" * 32, "/meta/bar_1.0.bb", "do_compile", "sigdata", sigdata("oe_runmake all", "2" * 32))])
+        self.assertEqual(self.pieces(), pieces + 4)
+        self.assertEqual(self.store.get("d" * 32), changed)
+
+    def test_find(self):
+        for i, fn in enumerate(["/meta/foo_1.0.bb", "virtual:native:/meta/foo_1.0.bb", "/meta/foo_1.0.bb"]):
+            self.store.add([(str(i) * 32, fn, "do_compile", "sigdata", sigdata(str(i), "1" * 32))])
+        found = self.store.find(task = "do_compile", fn = "/meta/foo_1.0.bb")
+        self.assertEqual([row[0] for row in found], ["2" * 32, "0" * 32])
+        self.assertEqual([row[0] for row in self.store.find_recipe("foo", "compile")], ["2" * 32, "0" * 32])
+        self.assertEqual([row[0] for row in self.store.find_recipe("foo_1.0.bb", "do_compile")], ["2" * 32, "0" * 32])
+        self.assertEqual([row[0] for row in self.store.find_recipe("virtual:native:foo", "do_compile")], ["1" * 32])
+        self.assertEqual(self.store.find_recipe("fo", "do_compile"), [])
+
+    def test_dump_sigtask(self):
+        d = bb.data.init()
+        d.setVar("BB_SIGNATURE_STORE", self.store.path)
+        d.setVar("BB_HASHBASE_WHITELIST", "TMPDIR FILE")
+        siggen = bb.siggen.SignatureGeneratorBasicHash(d)
+        fn = "/meta/foo_1.0.bb"
+        data = sigdata("oe_runmake", "1" * 32)
+        siggen.taskdeps[fn] = {"do_compile" : data['taskdeps']}
+        siggen.gendeps[fn] = data['gendeps']
+        siggen.lookupcache[fn] = data['varvals']
+        siggen.basehash[fn + ".do_compile"] = data['basehash']
+        siggen.taskhash[fn + ".do_configure"] = "1" * 32
+        siggen.taskhash[fn + ".do_compile"] = "a" * 32
+        siggen.runtaskdeps[fn + ".do_compile"] = data['runtaskdeps']
+        siggen.file_checksum_values[fn + ".do_compile"] = {}
+
+        stampbase = os.path.join(self.tempdir, "stamps", "foo")
+        siggen.dump_sigtask(fn, "do_compile", stampbase, True)
+        del data['varvals']['do_build']
+        self.assertEqual(siggen.sigstore.get("a" * 32, fn, "do_compile"), data)
+        self.assertFalse(os.path.exists(os.path.dirname(stampbase)))
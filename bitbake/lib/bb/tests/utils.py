@@ -18,6 +18,9 @@
 #
 
 import unittest
+import tempfile
+import hashlib
+import os
 import bb
 
 class VerCmpString(unittest.TestCase):
@@ -34,3 +37,19 @@ class VerCmpString(unittest.TestCase):
         result = bb.utils.vercmp_string('1.1', '1_p2')
         self.assertTrue(result < 0)
 
+class FileDigests(unittest.TestCase):
+
+    def test_file_digests(self):
+        for content in ["", "a\nb", os.urandom(3 * 1024 * 1024 + 5)]:
+            fd, path = tempfile.mkstemp()
+            try:
+                os.write(fd, content)
+                os.close(fd)
+                expected = {"md5" : hashlib.md5(content).hexdigest(), "sha256" : hashlib.sha256(content).hexdigest()}
+                self.assertEqual(bb.utils.file_digests(path), expected)
+                self.assertEqual(bb.utils.file_digests(path, use_mmap = True), expected)
+                self.assertEqual(bb.utils.file_digests(path, ("sha1",)), {"sha1" : hashlib.sha1(content).hexdigest()})
+                self.assertEqual(bb.utils.md5_file(path), expected["md5"])
+                self.assertEqual(bb.utils.sha256_file(path), expected["sha256"])
+            finally:
+                os.unlink(path)
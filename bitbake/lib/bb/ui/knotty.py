@@ -142,6 +142,7 @@ def main(server, eventHandler, tf = TerminalFilter):
 
     parseprogress = None
     cacheprogress = None
+    validateprogress = None
     main.shutdown = 0
     interrupted = False
     return_value = 0
@@ -234,6 +235,16 @@ def main(server, eventHandler, tf = TerminalFilter):
                 print("Loaded %d entries from dependency cache." % event.num_entries)
                 continue
 
+            if isinstance(event, bb.event.CacheValidateStarted):
+                validateprogress = new_progress("Checking cache", event.total).start()
+                continue
+            if isinstance(event, bb.event.CacheValidateProgress):
+                validateprogress.update(event.current)
+                continue
+            if isinstance(event, bb.event.CacheValidateCompleted):
+                validateprogress.finish()
+                continue
+
             if isinstance(event, bb.command.CommandFailed):
                 return_value = event.exitcode
                 errors = errors + 1
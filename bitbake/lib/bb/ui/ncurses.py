@@ -269,6 +269,15 @@ class NCursesUI:
                     mw.appendText("Loaded %d entries from dependency cache.\n"
                                 % ( event.num_entries))
 
+                if isinstance(event, bb.event.CacheValidateStarted):
+                    self.parse_total = event.total
+                if isinstance(event, bb.event.CacheValidateProgress):
+                    x = event.current
+                    y = self.parse_total
+                    mw.setStatus("Checking Cache:  %s [%2d %%]" % ( next(parsespin), x*100/y ) )
+                if isinstance(event, bb.event.CacheValidateCompleted):
+                    mw.setStatus("Idle")
+
                 if isinstance(event, bb.event.ParseStarted):
                     self.parse_total = event.total
                 if isinstance(event, bb.event.ParseProgress):
@@ -21,6 +21,7 @@ BitBake Utility Functions
 
 import re, fcntl, os, string, stat, shutil, time
 import sys
+import gc
 import errno
 import logging
 import bb
@@ -290,6 +291,20 @@ def fileslocked(files):
     for lock in locks:
         bb.utils.unlockfile(lock)
 
+@contextmanager
+def gc_disabled():
+    """
+    Suspend the cyclic garbage collector. Unpickling large amounts of
+    data otherwise triggers repeated full collections of the heap.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
 def lockfile(name, shared=False, retry=True):
     """
     Use the file fn as a lock file, return when the lock has been acquired.
@@ -349,6 +364,57 @@ def unlockfile(lf):
     fcntl.flock(lf.fileno(), fcntl.LOCK_UN)
     lf.close()
 
+# Large enough to keep the per-call overhead low, and for hashlib to
+# release the GIL while hashing each block
+_hash_blocksize = 1024 * 1024
+
+def _update_file_hash(h, filename, use_mmap = False):
+    with open(filename, "rb") as f:
+        if use_mmap:
+            size = os.fstat(f.fileno()).st_size
+            if not size:
+                return
+            import mmap
+            m = mmap.mmap(f.fileno(), size, access = mmap.ACCESS_READ)
+            try:
+                for offset in xrange(0, size, _hash_blocksize):
+                    h.update(buffer(m, offset, _hash_blocksize))
+            finally:
+                m.close()
+            return
+        while True:
+            block = f.read(_hash_blocksize)
+            if not block:
+                break
+            h.update(block)
+
+class MultiDigest(object):
+    """
+    Compute several hashlib digests (by default md5 and sha256) of the
+    same data in one pass
+    """
+    def __init__(self, algorithms = ("md5", "sha256")):
+        import hashlib
+        self.hashes = [(name, hashlib.new(name)) for name in algorithms]
+
+    def update(self, data):
+        for name, h in self.hashes:
+            h.update(data)
+
+    def hexdigests(self):
+        """Return a dict of the hex digests, by algorithm name"""
+        return dict((name, h.hexdigest()) for name, h in self.hashes)
+
+def file_digests(filename, algorithms = ("md5", "sha256"), use_mmap = False):
+    """
+    Return a dict of the hex digests of filename for each of the hashlib
+    algorithms given, reading the file once. With use_mmap set the file is
+    memory mapped rather than read into a buffer.
+    """
+    h = MultiDigest(algorithms)
+    _update_file_hash(h, filename, use_mmap)
+    return h.hexdigests()
+
 def md5_file(filename):
     """
     Return the hex string representation of the MD5 checksum of filename.
@@ -360,8 +426,7 @@ def md5_file(filename):
         import md5
         m = md5.new()
 
-    for line in open(filename):
-        m.update(line)
+    _update_file_hash(m, filename)
     return m.hexdigest()
 
 def sha256_file(filename):
@@ -377,8 +442,7 @@ def sha256_file(filename):
         return None
 
     s = hashlib.sha256()
-    for line in open(filename):
-        s.update(line)
+    _update_file_hash(s, filename)
     return s.hexdigest()
 
 def preserved_envvars_exported():
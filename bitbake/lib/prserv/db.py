@@ -29,6 +29,11 @@ class PRTable():
                     checksum TEXT NOT NULL, \
                     value INTEGER, \
                     PRIMARY KEY (version, pkgarch, checksum));" % self.table)
+        # The primary key index serves the lookups of a value. This one
+        # covers the max(value) of a (version, pkgarch), which new values
+        # and the nohist lookups depend on
+        self._execute("CREATE INDEX IF NOT EXISTS %s_value ON %s (version, pkgarch, value);"
+                      % (self.table, self.table))
 
     def _execute(self, *query):
         """Execute a query, waiting to acquire a lock if necessary"""
@@ -42,65 +47,67 @@ class PRTable():
                     continue
                 raise exc
 
-    def _getValueHist(self, version, pkgarch, checksum):
-        data=self._execute("SELECT value FROM %s WHERE version=? AND pkgarch=? AND checksum=?;" % self.table,
-                           (version, pkgarch, checksum))
-        row=data.fetchone()
-        if row != None:
-            return row[0]
+    def _findValue(self, version, pkgarch, checksum):
+        if self.nohist:
+            data=self._execute("SELECT value FROM %s \
+                                WHERE version=? AND pkgarch=? AND checksum=? AND \
+                                value >= (select max(value) from %s where version=? AND pkgarch=?);"
+                                % (self.table, self.table),
+                                (version, pkgarch, checksum, version, pkgarch))
         else:
-            #no value found, try to insert
-            try:
-                self._execute("BEGIN")
-                self._execute("INSERT OR ROLLBACK INTO %s VALUES (?, ?, ?, (select ifnull(max(value)+1,0) from %s where version=? AND pkgarch=?));"
-                           % (self.table,self.table),
-                           (version,pkgarch, checksum,version, pkgarch))
-                self.conn.commit()
-            except sqlite3.IntegrityError as exc:
-                logger.error(str(exc))
-
             data=self._execute("SELECT value FROM %s WHERE version=? AND pkgarch=? AND checksum=?;" % self.table,
                                (version, pkgarch, checksum))
-            row=data.fetchone()
-            if row != None:
-                return row[0]
-            else:
-                raise prserv.NotFoundError
-
-    def _getValueNohist(self, version, pkgarch, checksum):
-        data=self._execute("SELECT value FROM %s \
-                            WHERE version=? AND pkgarch=? AND checksum=? AND \
-                            value >= (select max(value) from %s where version=? AND pkgarch=?);" 
-                            % (self.table, self.table),
-                            (version, pkgarch, checksum, version, pkgarch))
         row=data.fetchone()
         if row != None:
             return row[0]
-        else:
-            #no value found, try to insert
-            try:
-                self._execute("BEGIN")
+        return None
+
+    def _newValue(self, version, pkgarch, checksum):
+        # No value found, insert one. The caller commits, so the values of
+        # a whole batch are written in one transaction
+        try:
+            if self.nohist:
                 self._execute("INSERT OR REPLACE INTO %s VALUES (?, ?, ?, (select ifnull(max(value)+1,0) from %s where version=? AND pkgarch=?));"
                                % (self.table,self.table),
                                (version, pkgarch, checksum, version, pkgarch))
-                self.conn.commit()
-            except sqlite3.IntegrityError as exc:
-                logger.error(str(exc))
-                self.conn.rollback()
-
-            data=self._execute("SELECT value FROM %s WHERE version=? AND pkgarch=? AND checksum=?;" % self.table,
-                               (version, pkgarch, checksum))
-            row=data.fetchone()
-            if row != None:
-                return row[0]
             else:
-                raise prserv.NotFoundError
+                self._execute("INSERT OR IGNORE INTO %s VALUES (?, ?, ?, (select ifnull(max(value)+1,0) from %s where version=? AND pkgarch=?));"
+                           % (self.table,self.table),
+                           (version,pkgarch, checksum,version, pkgarch))
+        except sqlite3.IntegrityError as exc:
+            logger.error(str(exc))
+
+        data=self._execute("SELECT value FROM %s WHERE version=? AND pkgarch=? AND checksum=?;" % self.table,
+                           (version, pkgarch, checksum))
+        row=data.fetchone()
+        if row != None:
+            return row[0]
+        return None
+
+    def getValues(self, items):
+        """
+        Return the values of a list of (version, pkgarch, checksum), creating
+        the missing ones, in a single transaction. The value of an item is
+        None if it couldn't be created.
+        """
+        values = []
+        try:
+            for version, pkgarch, checksum in items:
+                value = self._findValue(version, pkgarch, checksum)
+                if value is None:
+                    value = self._newValue(version, pkgarch, checksum)
+                values.append(value)
+            self.conn.commit()
+        except:
+            self.conn.rollback()
+            raise
+        return values
 
     def getValue(self, version, pkgarch, checksum):
-        if self.nohist:
-            return self._getValueNohist(version, pkgarch, checksum)
-        else:
-            return self._getValueHist(version, pkgarch, checksum)
+        value = self.getValues([(version, pkgarch, checksum)])[0]
+        if value is None:
+            raise prserv.NotFoundError
+        return value
 
     def _importHist(self, version, pkgarch, checksum, value):
         val = None 
@@ -223,8 +230,12 @@ class PRData(object):
         except OSError as e:
             if e.errno != errno.EEXIST:
                 raise e
-        self.connection=sqlite3.connect(self.filename, isolation_level="DEFERRED")
+        # The server serializes the accesses from its threads
+        self.connection=sqlite3.connect(self.filename, isolation_level="DEFERRED", check_same_thread=False)
         self.connection.row_factory=sqlite3.Row
+        if sqlversion >= (3, 7, 0):
+            # Commits only need to sync the log in WAL mode
+            self.connection.execute("PRAGMA journal_mode=WAL;")
         self._tables={}
 
     def __del__(self):
@@ -1,6 +1,7 @@
 import os,sys,logging
 import signal, time, atexit, threading
 from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+from SocketServer import ThreadingMixIn
 import xmlrpclib
 
 try:
@@ -28,14 +29,22 @@ class Handler(SimpleXMLRPCRequestHandler):
             raise
         return value
 
+class PRServerRequestHandler(SimpleXMLRPCRequestHandler):
+    # Keep the connections open between the requests of a client, each
+    # connection is served by its own thread
+    protocol_version = "HTTP/1.1"
+    timeout = 60
+
 PIDPREFIX = "/tmp/PRServer_%s_%s.pid"
 singleton = None
 
-class PRServer(SimpleXMLRPCServer):
+class PRServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
     def __init__(self, dbfile, logfile, interface, daemon=True):
         ''' constructor '''
         SimpleXMLRPCServer.__init__(self, interface,
-                                    requestHandler=SimpleXMLRPCRequestHandler,
+                                    requestHandler=PRServerRequestHandler,
                                     logRequests=False, allow_none=True)
         self.dbfile=dbfile
         self.daemon=daemon
@@ -44,9 +53,12 @@ class PRServer(SimpleXMLRPCServer):
         self.host, self.port = self.socket.getsockname()
         self.db=prserv.db.PRData(dbfile)
         self.table=self.db["PRMAIN"]
+        # The requests are handled in threads sharing the database connection
+        self.lock=threading.Lock()
         self.pidfile=PIDPREFIX % (self.host, self.port)
 
         self.register_function(self.getPR, "getPR")
+        self.register_function(self.getPRs, "getPRs")
         self.register_function(self.quit, "quit")
         self.register_function(self.ping, "ping")
         self.register_function(self.export, "export")
@@ -55,13 +67,15 @@ class PRServer(SimpleXMLRPCServer):
 
     def export(self, version=None, pkgarch=None, checksum=None, colinfo=True):
         try:
-            return self.table.export(version, pkgarch, checksum, colinfo)
+            with self.lock:
+                return self.table.export(version, pkgarch, checksum, colinfo)
         except sqlite3.Error as exc:
             logger.error(str(exc))
             return None
 
     def importone(self, version, pkgarch, checksum, value):
-        return self.table.importone(version, pkgarch, checksum, value)
+        with self.lock:
+            return self.table.importone(version, pkgarch, checksum, value)
 
     def ping(self):
         return not self.quit
@@ -71,7 +85,8 @@ class PRServer(SimpleXMLRPCServer):
 
     def getPR(self, version, pkgarch, checksum):
         try:
-            return self.table.getValue(version, pkgarch, checksum)
+            with self.lock:
+                return self.table.getValue(version, pkgarch, checksum)
         except prserv.NotFoundError:
             logger.error("can not find value for (%s, %s)",version, checksum)
             return None
@@ -79,6 +94,22 @@ class PRServer(SimpleXMLRPCServer):
             logger.error(str(exc))
             return None
 
+    def getPRs(self, items):
+        """
+        Batch version of getPR(): return the values of a list of
+        (version, pkgarch, checksum), None for those which can't be found
+        """
+        try:
+            with self.lock:
+                values = self.table.getValues(items)
+        except sqlite3.Error as exc:
+            logger.error(str(exc))
+            return [None] * len(items)
+        for (version, pkgarch, checksum), value in zip(items, values):
+            if value is None:
+                logger.error("can not find value for (%s, %s)",version, checksum)
+        return values
+
     def quit(self):
         self.quit=True
         return
@@ -198,9 +229,24 @@ class PRServerConnection():
         except Exception as exc:
             sys.stderr.write("%s\n" % str(exc))
 
+    # The values are not cached: in the default nohist mode the value of
+    # a checksum changes when another one of its version and pkgarch is
+    # asked for in between
     def getPR(self, version, pkgarch, checksum):
         return self.connection.getPR(version, pkgarch, checksum)
 
+    def getPRs(self, items):
+        """
+        Return the values of a list of (version, pkgarch, checksum) in a
+        single request, numbered as separate getPR() calls would number them
+        """
+        items = [tuple(item) for item in items]
+        try:
+            return self.connection.getPRs(items)
+        except xmlrpclib.Fault:
+            # Servers older than the batch API
+            return [self.connection.getPR(*item) for item in items]
+
     def ping(self):
         return self.connection.ping()
 
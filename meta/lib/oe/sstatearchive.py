@@ -0,0 +1,125 @@
+import bb
+import bb.process
+import os
+import time
+import tarfile
+import tempfile
+from StringIO import StringIO
+
+class Codec(object):
+    """
+    Compression of the sstate archives: the suffix of the archive names
+    and the commands compressing and decompressing a stream. The option
+    setting the number of threads is added to the compress command of
+    the codecs which can use several.
+    """
+    def __init__(self, name, suffix, compress, decompress, threads = None, fallback = None):
+        self.name = name
+        self.suffix = suffix
+        self.compress = compress
+        self.decompress = decompress
+        self.threads = threads
+        self.fallback = fallback
+
+    def command(self, threads = 1):
+        if not self.compress:
+            return None
+        cmd = self.compress.split()
+        if self.threads and threads > 1:
+            cmd.append(self.threads % threads)
+        return cmd
+
+codecs = {}
+for codec in (Codec("gzip", ".tgz", "gzip -c", "gzip -dc"),
+              # pigz writes gzip streams, its archives are the same as gzip's
+              Codec("pigz", ".tgz", "pigz -c", "gzip -dc", "-p%d", "gzip"),
+              # xz and zstd aren't always installed on the host, gzip is
+              Codec("xz", ".tar.xz", "xz -c", "xz -dc", "-T%d", "gzip"),
+              Codec("zstd", ".tar.zst", "zstd -c -q", "zstd -dc -q", "-T%d", "gzip"),
+              Codec("none", ".tar", None, "cat")):
+    codecs[codec.name] = codec
+
+def get_codec(name, path = None):
+    """
+    Return the codec called name. A codec whose compressor is not in path
+    (by default the PATH of the environment) is replaced by its fallback,
+    if it has one.
+    """
+    if name not in codecs:
+        raise ValueError("Unknown sstate archive codec '%s', expected one of %s" % (name, ", ".join(sorted(codecs))))
+    codec = codecs[name]
+    if codec.fallback:
+        if path is None:
+            path = os.environ.get("PATH", "")
+        if not bb.utils.which(path, codec.compress.split()[0]):
+            return get_codec(codec.fallback, path)
+    return codec
+
+def walk(members):
+    """
+    Yield the (path, arcname) pair of each file, directory and link of the
+    trees in members, a list of (path, arcname) pairs, parents first.
+    """
+    for top, arctop in members:
+        yield top, arctop
+        for root, dirs, files in os.walk(top):
+            arcroot = os.path.normpath(os.path.join(arctop, os.path.relpath(root, top)))
+            dirs.sort()
+            for name in dirs + sorted(files):
+                yield os.path.join(root, name), os.path.join(arcroot, name)
+
+def create(archive, members, codec, threads = 1, fixups = {}):
+    """
+    Write the archive of the trees in members, a list of (path, arcname)
+    pairs, compressed by codec with threads threads. The trees are read
+    in place and streamed to the compressor. The content of the files
+    whose arcname is in fixups is replaced by the one it maps to, and the
+    arcnames which are in no tree are added as new files.
+
+    The archive is written to a temporary file which is then renamed, so
+    it is complete whenever it exists.
+    """
+    fd, tmpfile = tempfile.mkstemp(prefix = os.path.basename(archive) + ".", dir = os.path.dirname(archive))
+    output = os.fdopen(fd, "wb")
+    compressor = None
+    try:
+        cmd = codec.command(threads)
+        if cmd:
+            try:
+                compressor = bb.process.Popen(cmd, stdin = bb.process.subprocess.PIPE, stdout = output)
+            except OSError:
+                raise bb.process.NotFoundError(cmd)
+            output.close()
+            output = compressor.stdin
+
+        tar = tarfile.open(fileobj = output, mode = "w|", format = tarfile.GNU_FORMAT)
+        added = set()
+        for path, arcname in walk(members):
+            if arcname in fixups:
+                info = tar.gettarinfo(path, arcname)
+                info.type = tarfile.REGTYPE
+                info.size = len(fixups[arcname])
+                tar.addfile(info, StringIO(fixups[arcname]))
+                added.add(arcname)
+            else:
+                tar.add(path, arcname, recursive = False)
+        for arcname in sorted(set(fixups) - added):
+            info = tarfile.TarInfo(arcname)
+            info.size = len(fixups[arcname])
+            info.mode = 0644
+            info.mtime = time.time()
+            tar.addfile(info, StringIO(fixups[arcname]))
+        tar.close()
+        output.close()
+
+        if compressor and compressor.wait():
+            raise bb.process.ExecutionError(cmd, compressor.returncode)
+        compressor = None
+        os.chmod(tmpfile, 0664)
+        os.rename(tmpfile, archive)
+    finally:
+        output.close()
+        if compressor:
+            compressor.wait()
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
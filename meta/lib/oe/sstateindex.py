@@ -0,0 +1,61 @@
+import bb
+import os
+import tempfile
+
+# First line of the index of an sstate mirror, as written by
+# scripts/sstate-cache-management.sh
+index_header = "# sstate-index 1"
+
+def read_index(f):
+    """
+    Return the names of the packages listed by the index in the file f,
+    or None if it doesn't start with index_header
+    """
+    if f.readline().rstrip("\n") != index_header:
+        return None
+    names = set()
+    # Lines are "<task hash> <package> <size> <md5sum>". Only the names are
+    # used, the size and md5sum are informational.
+    for line in f:
+        fields = line.split()
+        if len(fields) == 4 and not line.startswith("#"):
+            names.add(fields[1])
+    return names
+
+def mirror_index(mirror, d):
+    """
+    Fetch the SSTATE_MIRROR_INDEX of mirror, a PREMIRRORS entry, and return
+    the names of the packages it lists, or None if the mirror has no index
+    """
+    import bb.fetch2
+
+    index = d.getVar("SSTATE_MIRROR_INDEX", True)
+    if not index:
+        return None
+
+    localdata = bb.data.createCopy(d)
+    bb.data.update_data(localdata)
+
+    dldir = tempfile.mkdtemp(prefix="sstate-index-")
+    localdata.setVar('DL_DIR', dldir)
+    localdata.setVar('PREMIRRORS', mirror)
+
+    srcuri = "file://" + index
+    # The fetcher changes to DL_DIR, which is removed afterwards
+    cwd = os.getcwd()
+    try:
+        fetcher = bb.fetch2.Fetch([srcuri], localdata, cache=False)
+        fetcher.download()
+        with open(fetcher.localpath(srcuri)) as f:
+            names = read_index(f)
+        if names is None:
+            bb.debug(2, "SState: %s of %s is not an sstate index" % (index, mirror))
+        else:
+            bb.debug(2, "SState: %d packages in the index of %s" % (len(names), mirror))
+        return names
+    except (bb.fetch2.BBFetchException, EnvironmentError) as e:
+        bb.debug(2, "SState: No index for %s: %s" % (mirror, e))
+        return None
+    finally:
+        os.chdir(cwd)
+        bb.utils.remove(dldir, True)
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from oe.sstatearchive import codecs, get_codec, create
+
+class TestCodecs(unittest.TestCase):
+    def test_get_codec(self):
+        self.assertTrue(get_codec("gzip") is codecs["gzip"])
+        self.assertRaises(ValueError, get_codec, "bzip2")
+
+    def test_fallback(self):
+        self.assertTrue(get_codec("pigz", "") is codecs["gzip"])
+        self.assertEqual(get_codec("pigz", "").suffix, codecs["pigz"].suffix)
+        # The suffix of the packages changes with the codec
+        self.assertTrue(get_codec("xz", "") is codecs["gzip"])
+        self.assertTrue(get_codec("zstd", "") is codecs["gzip"])
+        self.assertEqual(get_codec("zstd", "").suffix, ".tgz")
+
+    def test_command(self):
+        self.assertEqual(codecs["gzip"].command(4), ["gzip", "-c"])
+        self.assertEqual(codecs["xz"].command(1), ["xz", "-c"])
+        self.assertEqual(codecs["xz"].command(4), ["xz", "-c", "-T4"])
+        self.assertEqual(codecs["none"].command(4), None)
+
+class TestCreate(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tempdir, "image")
+        os.makedirs(os.path.join(self.src, "usr", "lib"))
+        with open(os.path.join(self.src, "usr", "lib", "libfoo.la"), "w") as f:
+            f.write("libdir='/staging/usr/lib'\n")
+        os.symlink("libfoo.la", os.path.join(self.src, "usr", "lib", "libbar.la"))
+        self.plain = os.path.join(self.tempdir, "deploy")
+        os.makedirs(self.plain)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def check(self, codec):
+        archive = os.path.join(self.tempdir, "sstate" + codec.suffix)
+        fixups = {"sysroot-destdir/usr/lib/libfoo.la" : "libdir='FIXMESTAGINGDIR/usr/lib'\n",
+                  "fixmepath" : "sysroot-destdir/usr/lib/libfoo.la\n"}
+        create(archive, [(self.src, "sysroot-destdir"), (self.plain, "deploy")], codec, 2, fixups)
+
+        tar = tarfile.open(archive)
+        self.assertEqual(tar.getnames(), ["sysroot-destdir", "sysroot-destdir/usr", "sysroot-destdir/usr/lib",
+                                          "sysroot-destdir/usr/lib/libbar.la", "sysroot-destdir/usr/lib/libfoo.la",
+                                          "deploy", "fixmepath"])
+        self.assertTrue(tar.getmember("sysroot-destdir/usr/lib/libbar.la").issym())
+        for name, content in fixups.items():
+            self.assertEqual(tar.extractfile(name).read(), content)
+        tar.close()
+        self.assertEqual(sorted(os.listdir(self.tempdir)), ["deploy", "image", "sstate" + codec.suffix])
+
+        # The trees are left alone
+        with open(os.path.join(self.src, "usr", "lib", "libfoo.la")) as f:
+            self.assertEqual(f.read(), "libdir='/staging/usr/lib'\n")
+
+    def test_gzip(self):
+        self.check(get_codec("gzip"))
+
+    def test_none(self):
+        self.check(get_codec("none"))
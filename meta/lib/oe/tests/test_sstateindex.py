@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+import bb.data
+from StringIO import StringIO
+from oe.sstateindex import read_index, mirror_index
+
+class TestReadIndex(unittest.TestCase):
+    def test_read(self):
+        f = StringIO("# sstate-index 1\n"
+                     "1234 sstate-foo_populate-sysroot.tgz 10 d41d8cd9\n"
+                     "# comment\n"
+                     "truncated line\n"
+                     "5678 sstate-bar_package.tgz 20 8f00b204\n")
+        self.assertEqual(read_index(f), set(["sstate-foo_populate-sysroot.tgz", "sstate-bar_package.tgz"]))
+
+    def test_header(self):
+        self.assertEqual(read_index(StringIO("")), None)
+        self.assertEqual(read_index(StringIO("1234 sstate-foo_populate-sysroot.tgz 10 d41d8cd9\n")), None)
+
+class TestMirrorIndex(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.mirror = os.path.join(self.tempdir, "mirror")
+        os.makedirs(self.mirror)
+        self.d = bb.data.init()
+        self.d.setVar("SSTATE_MIRROR_INDEX", "sstate-index")
+        self.d.setVar("FILESPATH", "")
+        self.cwd = os.getcwd()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tempdir)
+
+    def index(self, content):
+        with open(os.path.join(self.mirror, "sstate-index"), "w") as f:
+            f.write(content)
+        return mirror_index("file://.* file://%s/" % self.mirror, self.d)
+
+    def test_indexed(self):
+        names = self.index("# sstate-index 1\n"
+                           "1234 sstate-foo_populate-sysroot.tgz 10 d41d8cd9\n"
+                           "5678 sstate-bar_package.tgz 20 8f00b204\n")
+        self.assertEqual(names, set(["sstate-foo_populate-sysroot.tgz", "sstate-bar_package.tgz"]))
+        self.assertEqual(os.getcwd(), self.cwd)
+
+    def test_unindexed(self):
+        self.assertEqual(mirror_index("file://.* file://%s/" % self.mirror, self.d), None)
+        self.assertEqual(os.getcwd(), self.cwd)
+
+    def test_disabled(self):
+        self.d.setVar("SSTATE_MIRROR_INDEX", "")
+        self.assertEqual(self.index("# sstate-index 1\n"), None)
+
+    def test_bogus(self):
+        # e.g. the error page of a web server
+        self.assertEqual(self.index("<html>\n1234 sstate-foo_populate-sysroot.tgz 10 d41d8cd9\n</html>\n"), None)
+        self.assertEqual(self.index("# sstate-index 2\n"), None)
+        self.assertEqual(os.getcwd(), self.cwd)
@@ -108,3 +108,15 @@ def distro_features_backfill(d):
         return " %s" % (" ".join(addfeatures))
     else:
         return ""
+
+def parallel_make_jobs(d):
+    """Return the number of jobs PARALLEL_MAKE allows make to run in
+    parallel, e.g. for "-j 4" or "-j4" return 4. Used as the cpu resource
+    declaration of compile tasks."""
+    args = (d.getVar('PARALLEL_MAKE', True) or "").split()
+    for i, arg in enumerate(args):
+        if arg.startswith("-j"):
+            jobs = arg[2:] or (i + 1 < len(args) and args[i + 1]) or ""
+            if jobs.isdigit():
+                return int(jobs)
+    return 1
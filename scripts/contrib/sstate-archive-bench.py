@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#
+# Benchmark for the creation of sstate packages.
+#
+# A native sysroot, by default the installation prefix of the python
+# running the script, is packaged as sstate_package() does for a native
+# recipe, with its own path as the staging dir to take out of the files:
+# first the way it used to, by copying the tree to a build dir, fixing the
+# files there with sed and running tar -czf on it, then by streaming the
+# tree to each of the codecs with oe.sstatearchive. Each package is then
+# unpacked as sstate_unpack_package() does. The throughput is the size of
+# the sysroot over the time taken.
+#
+# Copyright (C) 2012 Intel Corporation
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import optparse
+import subprocess
+
+topsrcdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+sys.path.insert(0, os.path.join(topsrcdir, "bitbake", "lib"))
+sys.path.insert(0, os.path.join(topsrcdir, "meta", "lib"))
+import bb
+import bb.utils
+import oe.sstatearchive
+
+def tree_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            fn = os.path.join(root, name)
+            if not os.path.islink(fn):
+                size += os.path.getsize(fn)
+    return size
+
+def scan(path, staging):
+    cmd = "grep -Irl %s %s" % (staging, path)
+    return subprocess.Popen(cmd, shell = True, stdout = subprocess.PIPE).communicate()[0].splitlines()
+
+def package_copy(sysroot, tempdir, pkg):
+    # oe.path.copytree() to the build dir, without the -s newer tar
+    # versions refuse with -c, sed the files there and tar -czf it
+    builddir = os.path.join(tempdir, "sstate-build-populate-sysroot")
+    bb.utils.mkdirhier(os.path.join(builddir, "sysroot-destdir"))
+    subprocess.check_call("tar -cf - -C %s -p . | tar -xf - -C %s/sysroot-destdir" % (sysroot, builddir), shell = True)
+    files = scan(builddir, sysroot)
+    if files:
+        subprocess.check_call(["sed", "-i", "-e", "s:%s:FIXMESTAGINGDIR:g" % sysroot] + files)
+    subprocess.check_call("cd %s && tar -czf %s *" % (builddir, pkg), shell = True)
+    shutil.rmtree(builddir)
+
+def package_stream(sysroot, pkg, codec, threads):
+    fixups = {}
+    for fn in scan(sysroot, sysroot):
+        data = open(fn).read()
+        fixups[os.path.join("sysroot-destdir", os.path.relpath(fn, sysroot))] = data.replace(sysroot, "FIXMESTAGINGDIR")
+    if fixups:
+        fixups["fixmepath"] = "".join(fn + "\n" for fn in sorted(fixups))
+    oe.sstatearchive.create(pkg, [(sysroot, "sysroot-destdir")], codec, threads, fixups)
+
+def unpack(pkg, decompress, tempdir):
+    instdir = os.path.join(tempdir, "sstate-install-populate-sysroot")
+    os.mkdir(instdir)
+    subprocess.check_call("cd %s && %s < %s | tar -xf -" % (instdir, decompress, pkg), shell = True)
+    shutil.rmtree(instdir)
+
+def report(name, size, elapsed, pkg = None):
+    line = "  %-28s%.3f s, %.1f MB/s" % (name, elapsed, size / elapsed / 1000000)
+    if pkg:
+        line += ", %.1f MB" % (os.path.getsize(pkg) / 1000000.0)
+    print(line)
+
+def main():
+    parser = optparse.OptionParser(usage = "%prog [options]")
+    parser.add_option("-s", "--sysroot", default = sys.prefix,
+                      help = "native sysroot to package (default: %default)")
+    parser.add_option("-c", "--codecs", default = "gzip pigz xz zstd none",
+                      help = "codecs to package with (default: %default)")
+    parser.add_option("-t", "--threads", type = "int", default = bb.utils.cpu_count(),
+                      help = "compression threads (default: %default)")
+    options, args = parser.parse_args()
+
+    sysroot = os.path.realpath(options.sysroot)
+    size = tree_size(sysroot)
+    print("%s: %.1f MB, %d files to fix up, %d threads" % (sysroot, size / 1000000.0,
+          len(scan(sysroot, sysroot)), options.threads))
+
+    tempdir = tempfile.mkdtemp(prefix = "sstate-archive-")
+    try:
+        pkg = os.path.join(tempdir, "sstate-populate-sysroot.tgz")
+        start = time.time()
+        package_copy(sysroot, tempdir, pkg)
+        report("copy, tar -czf:", size, time.time() - start, pkg)
+        start = time.time()
+        unpack(pkg, "gzip -dc", tempdir)
+        report("  unpack:", size, time.time() - start)
+        os.remove(pkg)
+
+        for name in options.codecs.split():
+            codec = oe.sstatearchive.get_codec(name)
+            if codec.name != name:
+                print("  %-28s%s not found, skipped" % (name + ":", oe.sstatearchive.codecs[name].compress.split()[0]))
+                continue
+            pkg = os.path.join(tempdir, "sstate-populate-sysroot" + codec.suffix)
+            start = time.time()
+            package_stream(sysroot, pkg, codec, options.threads)
+            report("stream, %s:" % name, size, time.time() - start, pkg)
+            start = time.time()
+            unpack(pkg, codec.decompress, tempdir)
+            report("  unpack:", size, time.time() - start)
+            os.remove(pkg)
+    finally:
+        shutil.rmtree(tempdir)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
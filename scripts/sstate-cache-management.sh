@@ -22,6 +22,11 @@ confirm=
 total_deleted=0
 verbose=
 
+# The suffixes of the sstate packages, one for each codec of
+# meta/lib/oe/sstatearchive.py, and a regex matching them
+pkg_suffixes=".tgz .tar .tar.xz .tar.zst"
+pkg_regex='\.(tgz|tar|tar\.xz|tar\.zst)$'
+
 usage () {
   cat << EOF
 Welcome to sstate cache management utilities.
@@ -62,6 +67,18 @@ Options:
         Automatic yes to prompts; assume "yes" as answer to all prompts
         and run non-interactively.
 
+  --update-index
+        Write the index of the sstate cache files to sstate-index in
+        the cache dir, for a cache dir used as a SSTATE_MIRRORS. Only
+        the files which are not in the index yet are read, and the
+        files which were removed are dropped from it. The index is
+        also updated when files are removed by the other options, if
+        the cache dir has one.
+
+  --rebuild-index
+        Write the index of the sstate cache files again, reading all
+        of them.
+
   -v, --verbose
         explain what is being done
 
@@ -135,7 +152,7 @@ remove_duplicated () {
   cd $cache_dir || exit 1
   # Save all the sstate files in a file
   sstate_list=`mktemp` || exit 1
-  ls sstate-*.tgz >$sstate_list
+  ls sstate-* 2>/dev/null | grep -E "$pkg_regex" >$sstate_list
   echo -n "Figuring out the archs in the sstate cache dir ... "
   for arch in $all_archs; do
       grep -q -w $arch $sstate_list
@@ -151,9 +168,9 @@ remove_duplicated () {
 
   for suffix in $sstate_suffixes; do
       # Save the file list to a file, some suffix's file may not exist
-      ls *_$suffix.tgz >$list_suffix 2>/dev/null
+      grep -E "_$suffix$pkg_regex" $sstate_list >$list_suffix
       local deleted=0
-      echo -n "Figuring out the sstate-xxx_$suffix.tgz ... "
+      echo -n "Figuring out the sstate-xxx_$suffix packages ... "
       # There are at list 6 dashes (-) after arch, use this to avoid the
       # greedy match of sed.
       file_names=`for arch in $ava_archs; do
@@ -162,7 +179,7 @@ remove_duplicated () {
 
       fn_tmp=`mktemp` || exit 1
       for fn in $file_names; do
-          [ -z "$verbose" ] || echo "Analyzing $fn-xxx_$suffix.tgz"
+          [ -z "$verbose" ] || echo "Analyzing $fn-xxx_$suffix"
           for arch in $ava_archs; do
               grep -h "^$fn-$arch-" $list_suffix >>$fn_tmp
           done
@@ -175,12 +192,12 @@ remove_duplicated () {
       echo "($deleted files will be removed)"
       let total_deleted=$total_deleted+$deleted
   done
-  rm -f $list_suffix
+  rm -f $list_suffix $sstate_list
   if [ $total_deleted -gt 0 ]; then
       read_confirm
       if [ "$confirm" = "y" -o "$confirm" = "Y" ]; then
           for list in `ls $remove_listdir/`; do
-              echo -n "Removing $list.tgz (`cat $remove_listdir/$list | wc -w` files) ... "
+              echo -n "Removing $list (`cat $remove_listdir/$list | wc -w` files) ... "
               rm -f $verbose `cat $remove_listdir/$list`
               echo "Done"
           done
@@ -218,7 +235,7 @@ rm_by_stamps (){
   echo "Done"
 
   # Save all the state file list to a file
-  ls $cache_dir/sstate-*.tgz >$cache_list
+  ls $cache_dir/sstate-* 2>/dev/null | grep -E "$pkg_regex" >$cache_list
 
   echo -n "Figuring out the files which will be removed ... "
   for i in $all_sums; do
@@ -239,8 +256,10 @@ rm_by_stamps (){
                   mv $i $mv_to_dir
                   mv $i.siginfo $mv_to_dir || true
               done
-              rm -f $verbose $cache_dir/sstate-*.tgz
-              rm -f $verbose $cache_dir/sstate-*.tgz.siginfo
+              for suffix in $pkg_suffixes; do
+                  rm -f $verbose $cache_dir/sstate-*$suffix
+                  rm -f $verbose $cache_dir/sstate-*$suffix.siginfo
+              done
               mv $mv_to_dir/* $cache_dir/
               echo "$total_deleted files have been removed"
           else
@@ -258,6 +277,48 @@ rm_by_stamps (){
   rmdir $mv_to_dir
 }
 
+# Write the index of the sstate cache files, with a
+# "<task hash> <file> <size> <md5sum>" line per file. The lines of the
+# files which are still there with the same size are kept from the old
+# index unless $1 is "rebuild", so only the new files are read.
+update_index () {
+  local index=$cache_dir/sstate-index
+  local old_index=$index
+  local listing=`mktemp` || exit 1
+  local entries=`mktemp` || exit 1
+  local new_index=`mktemp -p $cache_dir` || exit 1
+  local added=0
+  local total=0
+
+  [ "$1" = "rebuild" -o ! -f $index ] && old_index=/dev/null
+
+  echo -n "Updating the index of the cache dir ... "
+  (cd $cache_dir && find -L . -maxdepth 1 -type f \( -name 'sstate-*.tgz' \
+    -o -name 'sstate-*.tar' -o -name 'sstate-*.tar.xz' -o -name 'sstate-*.tar.zst' \) -printf '%f %s\n') | \
+    sort >$listing
+  awk 'FILENAME == ARGV[1] { if (!/^#/) known[$2 " " $3] = $0; next }
+       { if (($1 " " $2) in known) print known[$1 " " $2]; else print "-", $1, $2, "-" }' \
+    $old_index $listing >$entries
+
+  echo "# sstate-index 1" >$new_index
+  while read hash name size sum; do
+      if [ "$sum" = "-" ]; then
+          [ -z "$verbose" ] || echo "Adding $name"
+          hash=`echo $name | sed -e 's/_[^_]*$//' -e 's/.*-//'`
+          sum=`md5sum $cache_dir/$name | cut -d' ' -f1`
+          let added=$added+1
+      fi
+      echo "$hash $name $size $sum" >>$new_index
+      let total=$total+1
+  done <$entries
+  chmod 644 $new_index
+  mv $new_index $index
+  echo "Done"
+  echo "$total files in the index, $added added"
+
+  rm -f $listing $entries
+}
+
 # Parse arguments
 while [ -n "$1" ]; do
   case $1 in
@@ -295,6 +356,14 @@ while [ -n "$1" ]; do
       done
       shift
         ;;
+    --update-index)
+      index="update"
+      shift
+        ;;
+    --rebuild-index)
+      index="rebuild"
+      shift
+        ;;
     --verbose|-v)
       verbose="-v"
       shift
@@ -321,6 +390,10 @@ done
 
 [ "$rm_duplicated" = "y" ] && remove_duplicated
 [ -n "$stamps" ] && rm_by_stamps
-[ -z "$rm_duplicated" -a -z "$stamps" ] && \
+# Drop the removed files from the index
+[ -n "$rm_duplicated" -o -n "$stamps" ] && [ -f "$cache_dir/sstate-index" ] && \
+    [ -z "$index" ] && index="update"
+[ -n "$index" ] && update_index $index
+[ -z "$rm_duplicated" -a -z "$stamps" -a -z "$index" ] && \
     echo "What do you want to do?"
 